@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Form, UserFormAccess, FormDisplayVersion, FormEntryVersion, FormData, FormDataHistory
+from .models import Form, UserFormAccess, FormDisplayVersion, FormEntryVersion, FormData, FormDataHistory, Attachment, SharePointResolution, ImportJob, VersionBlob, WorkbookSnapshot, GraphSubscription
 
 
 @admin.register(Form)
@@ -7,20 +7,24 @@ class FormAdmin(admin.ModelAdmin):
     list_display = ['id', 'form_name', 'source', 'created_by', 'created_at']
     search_fields = ['form_name']
     readonly_fields = ['created_at', 'updated_at']
+    # A select would load every version with its content
+    raw_id_fields = ['current_entry_version', 'current_display_version']
 
 
 @admin.register(FormDisplayVersion)
 class FormDisplayVersionAdmin(admin.ModelAdmin):
-    list_display = ['id', 'form', 'form_version', 'approved', 'created_at']
+    list_display = ['id', 'form', 'form_version', 'version_number', 'source', 'approved', 'created_at']
     list_filter = ['approved', 'form']
     readonly_fields = ['created_at', 'updated_at']
+    raw_id_fields = ['blob', 'delta_base', 'snapshot']
 
 
 @admin.register(FormEntryVersion)
 class FormEntryVersionAdmin(admin.ModelAdmin):
-    list_display = ['id', 'form', 'form_version', 'approved', 'created_at']
+    list_display = ['id', 'form', 'form_version', 'version_number', 'source', 'approved', 'created_at']
     list_filter = ['approved', 'form']
     readonly_fields = ['created_at', 'updated_at']
+    raw_id_fields = ['blob', 'delta_base', 'snapshot']
 
 
 @admin.register(UserFormAccess)
@@ -37,8 +41,51 @@ class FormDataAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
 
 
+@admin.register(Attachment)
+class AttachmentAdmin(admin.ModelAdmin):
+    list_display = ['id', 'form_data', 'field_id', 'path', 'size', 'content_type', 'created_at']
+    search_fields = ['path', 'content_hash']
+    readonly_fields = ['created_at']
+
+
 @admin.register(FormDataHistory)
 class FormDataHistoryAdmin(admin.ModelAdmin):
     list_display = ['id', 'form', 'updated_by', 'updated_at']
     list_filter = ['form']
-    readonly_fields = ['created_at', 'updated_at']
\ No newline at end of file
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(SharePointResolution)
+class SharePointResolutionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'key', 'value', 'hits', 'expires_at', 'last_used_at']
+    list_filter = ['kind']
+    search_fields = ['key']
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'form', 'progress', 'attempts', 'created_by', 'created_at']
+    list_filter = ['kind', 'status']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(VersionBlob)
+class VersionBlobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'content_hash', 'size', 'created_at']
+    search_fields = ['content_hash']
+    readonly_fields = ['created_at']
+
+
+@admin.register(WorkbookSnapshot)
+class WorkbookSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['id', 'content_hash', 'size', 'created_at']
+    search_fields = ['content_hash']
+    readonly_fields = ['created_at']
+
+
+@admin.register(GraphSubscription)
+class GraphSubscriptionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subscription_id', 'site_id', 'expires_at', 'notified_at', 'created_by']
+    search_fields = ['subscription_id', 'site_id']
+    readonly_fields = ['created_at', 'updated_at']
+    exclude = ['client_state']
@@ -1,6 +1,28 @@
+import os
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 
 class FormsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.forms'
\ No newline at end of file
+    name = 'apps.forms'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # The shared cache holds the Graph app token and unpickles what it reads; others must not reach it
+        shared = settings.CACHES.get('shared', {})
+        if shared.get('BACKEND') == 'django.core.cache.backends.filebased.FileBasedCache':
+            _check_private_dir(shared['LOCATION'])
+
+
+def _check_private_dir(path: str):
+    # Missing directories are created 0700 by the file-based cache itself
+    if not os.path.exists(path):
+        return
+    info = os.stat(path)
+    if info.st_uid != os.geteuid() or info.st_mode & 0o077:
+        raise ImproperlyConfigured(
+            f"Shared cache directory {path} must be owned by this user and not accessible to others (chmod 700)"
+        )
@@ -0,0 +1,51 @@
+import hashlib
+import mimetypes
+from pathlib import Path
+from django.db import IntegrityError, transaction
+from .models import Attachment, FormData
+
+
+# Uploaded files live under userUploads/<form>/<entry>/<field>/, relative to the working directory
+UPLOAD_ROOT = Path('userUploads')
+
+
+def store_attachment(form_data: FormData, field_id, filename: str, content: bytes) -> Attachment:
+    """Write an uploaded file under the entry's upload directory and index it"""
+    upload_dir = UPLOAD_ROOT / str(form_data.form_id) / str(form_data.id) / str(field_id)
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    
+    file_path = upload_dir / filename
+    with open(file_path, 'wb') as f:
+        f.write(content)
+    return index_attachment(form_data, field_id, file_path, content)
+
+
+def index_attachment(form_data: FormData, field_id, file_path: Path, content: bytes = None) -> Attachment:
+    """Record a file of an entry in the attachment index, reading it from disk if `content` is not given.
+    
+    A file written again under the same path replaces its row.
+    """
+    if content is None:
+        content = file_path.read_bytes()
+    values = {
+        'field_id': str(field_id),
+        'size': len(content),
+        'content_type': mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream',
+        'content_hash': hashlib.sha256(content).hexdigest(),
+    }
+    
+    try:
+        with transaction.atomic():
+            attachment, _ = Attachment.objects.update_or_create(form_data=form_data, path=str(file_path), defaults=values)
+    except IntegrityError:
+        # Indexed by another request or the backfill a moment ago
+        attachment = Attachment.objects.get(form_data=form_data, path=str(file_path))
+    return attachment
+
+
+def attachment_paths(attachments) -> dict:
+    """Paths of an entry's attachments by field ID, in upload order"""
+    paths = {}
+    for attachment in sorted(attachments, key=lambda attachment: attachment.id):
+        paths.setdefault(attachment.field_id, []).append(attachment.path)
+    return paths
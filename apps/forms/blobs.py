@@ -0,0 +1,32 @@
+import hashlib
+import json
+from django.db import IntegrityError, transaction
+from .models import VersionBlob
+
+
+def canonical_json(content) -> str:
+    """Serialize JSON content deterministically (sorted keys, no whitespace)"""
+    return json.dumps(content, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+def content_hash(content) -> str:
+    return hashlib.sha256(canonical_json(content).encode('utf-8')).hexdigest()
+
+
+def store_blob(content, digest: str = None) -> VersionBlob:
+    """Get or create the blob holding this content; identical payloads share one row"""
+    digest = digest or content_hash(content)
+    blob = VersionBlob.objects.filter(content_hash=digest).only('id', 'content_hash').first()
+    if blob:
+        return blob
+    
+    try:
+        with transaction.atomic():
+            return VersionBlob.objects.create(
+                content_hash=digest,
+                content=content,
+                size=len(canonical_json(content))
+            )
+    except IntegrityError:
+        # Another import stored the same content first
+        return VersionBlob.objects.get(content_hash=digest)
@@ -0,0 +1,146 @@
+import hashlib
+import json
+from datetime import timedelta
+from typing import Dict, Optional
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Form, SharePointResolution
+
+
+class ResolutionCache:
+    """DB-backed cache of SharePoint site IDs and sharing-link file paths.
+    
+    Rows are shared by every worker, expire after SHAREPOINT_RESOLUTION_CACHE_TTL
+    seconds and the least recently used rows are evicted once the table grows
+    past SHAREPOINT_RESOLUTION_CACHE_MAX_ENTRIES. A hit only writes when the
+    row's last_used_at is older than SHAREPOINT_RESOLUTION_CACHE_TOUCH_INTERVAL,
+    so last_used_at and hits are that coarse.
+    """
+    
+    SITE_ID = 'site_id'
+    FILE_PATH = 'file_path'
+    
+    def get(self, kind: str, key: str) -> Optional[str]:
+        now = timezone.now()
+        entry = SharePointResolution.objects.filter(kind=kind, key=key, expires_at__gt=now).first()
+        if not entry:
+            return None
+        
+        touch_interval = timedelta(seconds=settings.SHAREPOINT_RESOLUTION_CACHE_TOUCH_INTERVAL)
+        if entry.last_used_at < now - touch_interval:
+            SharePointResolution.objects.filter(id=entry.id).update(last_used_at=now, hits=F('hits') + 1)
+        return entry.value
+    
+    def set(self, kind: str, key: str, value: str):
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=settings.SHAREPOINT_RESOLUTION_CACHE_TTL)
+        
+        try:
+            _, created = SharePointResolution.objects.update_or_create(
+                kind=kind,
+                key=key,
+                defaults={'value': value, 'expires_at': expires_at, 'last_used_at': now}
+            )
+        except IntegrityError:
+            # Another worker stored the same key first
+            return
+        
+        if created:
+            self._evict(now)
+    
+    def invalidate(self, kind: str, key: str):
+        SharePointResolution.objects.filter(kind=kind, key=key).delete()
+    
+    def _evict(self, now):
+        max_entries = settings.SHAREPOINT_RESOLUTION_CACHE_MAX_ENTRIES
+        SharePointResolution.objects.filter(expires_at__lte=now).delete()
+        
+        overflow = SharePointResolution.objects.count() - max_entries
+        if overflow > 0:
+            stale_ids = list(
+                SharePointResolution.objects.order_by('last_used_at').values_list('id', flat=True)[:overflow]
+            )
+            SharePointResolution.objects.filter(id__in=stale_ids).delete()
+
+
+class FormMetadataCache:
+    """Rendered get_form_metadata responses, in this process and in the shared cache.
+    
+    A response is keyed by the form's state: its update time and the ID,
+    content hash and approval of its current versions. That state is cached
+    in the shared cache only, so every worker sees it dropped by
+    invalidate(); responses are keyed by it and never go stale, which lets
+    them live in the local FORM_METADATA_CACHE_ALIAS cache as well.
+    """
+    
+    def __init__(self):
+        self.local = caches[settings.FORM_METADATA_CACHE_ALIAS]
+        self.shared = caches[settings.FORM_METADATA_SHARED_CACHE_ALIAS]
+    
+    def state(self, form_id: int) -> Optional[Dict]:
+        """The form's state, or None if the form does not exist"""
+        state = self.shared.get(self._state_key(form_id))
+        if state is not None:
+            return state
+        
+        form = Form.objects.select_related('current_entry_version', 'current_display_version').only(
+            'id', 'updated_at',
+            'current_entry_version__id', 'current_entry_version__content_hash', 'current_entry_version__approved',
+            'current_display_version__id', 'current_display_version__content_hash', 'current_display_version__approved'
+        ).filter(id=form_id).first()
+        if form is None:
+            return None
+        
+        state = self.state_of(form)
+        self.shared.set(self._state_key(form_id), state, settings.FORM_METADATA_STATE_TIMEOUT)
+        return state
+    
+    def state_of(self, form: Form) -> Dict:
+        """State of a form loaded with its current versions"""
+        def version_state(version):
+            return [version.id, version.content_hash, version.approved] if version else None
+        
+        return {
+            'updated_at': form.updated_at.isoformat(),
+            'entry': version_state(form.current_entry_version),
+            'display': version_state(form.current_display_version),
+        }
+    
+    def etag(self, form_id: int, state: Dict, metadata_type: str, display_format: str) -> str:
+        """Strong ETag of the response for a form state; responses are rendered deterministically from it"""
+        key = json.dumps([form_id, state, metadata_type, display_format], sort_keys=True)
+        return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+    
+    def get(self, form_id: int, etag: str) -> Optional[bytes]:
+        key = self._response_key(form_id, etag)
+        body = self.local.get(key)
+        if body is not None:
+            return body
+        
+        body = self.shared.get(key)
+        if body is not None:
+            self.local.set(key, body, settings.FORM_METADATA_CACHE_TIMEOUT)
+        return body
+    
+    def set(self, form_id: int, etag: str, body: bytes):
+        key = self._response_key(form_id, etag)
+        self.local.set(key, body, settings.FORM_METADATA_CACHE_TIMEOUT)
+        self.shared.set(key, body, settings.FORM_METADATA_CACHE_TIMEOUT)
+    
+    def invalidate(self, form_id: int):
+        """Drop the form's cached state once the current transaction commits.
+        
+        A request that read the state just before the commit may cache it
+        again; FORM_METADATA_STATE_TIMEOUT bounds how long that lasts.
+        """
+        transaction.on_commit(lambda: self.shared.delete(self._state_key(form_id)))
+    
+    def _state_key(self, form_id: int) -> str:
+        return f"form_metadata_state:{form_id}"
+    
+    def _response_key(self, form_id: int, etag: str) -> str:
+        digest = etag.strip('"')
+        return f"form_metadata:{form_id}:{digest}"
@@ -0,0 +1,98 @@
+from typing import Dict, List
+
+
+def make_patch(source, target) -> List[Dict]:
+    """Operations that turn the JSON document `source` into `target`.
+    
+    Each operation is {"op": "set" | "remove" | "splice", "path": [...]}.
+    Dicts are compared key by key and lists after trimming their common
+    prefix and suffix, so a small edit to a large document gives a small patch.
+    """
+    operations = []
+    _diff(source, target, [], operations)
+    return operations
+
+
+def apply_patch(document, patch: List[Dict]):
+    """Return `document` with `patch` applied, leaving `document` itself unchanged.
+    
+    Only the containers on the patched paths are copied; the rest of the
+    result is shared with `document`.
+    """
+    root = [document]
+    copied = {id(root)}
+    
+    for operation in patch:
+        path = [0] + operation['path']
+        parent = root
+        for key in path[:-1]:
+            parent = _writable_child(parent, key, copied)
+        
+        key = path[-1]
+        if operation['op'] == 'set':
+            parent[key] = operation['value']
+        elif operation['op'] == 'remove':
+            del parent[key]
+        elif operation['op'] == 'splice':
+            target = _writable_child(parent, key, copied)
+            target[operation['start']:operation['start'] + operation['delete']] = operation['insert']
+        else:
+            raise ValueError(f"Unknown patch operation: {operation['op']}")
+    
+    return root[0]
+
+
+def _diff(source, target, path: list, operations: List[Dict]):
+    if _same(source, target):
+        return
+    
+    if isinstance(source, dict) and isinstance(target, dict):
+        for key in source:
+            if key not in target:
+                operations.append({'op': 'remove', 'path': path + [key]})
+        for key, value in target.items():
+            if key in source:
+                _diff(source[key], value, path + [key], operations)
+            else:
+                operations.append({'op': 'set', 'path': path + [key], 'value': value})
+        return
+    
+    if isinstance(source, list) and isinstance(target, list):
+        start = 0
+        while start < len(source) and start < len(target) and _same(source[start], target[start]):
+            start += 1
+        end = 0
+        while end < len(source) - start and end < len(target) - start and _same(source[-1 - end], target[-1 - end]):
+            end += 1
+        
+        source_middle = source[start:len(source) - end]
+        target_middle = target[start:len(target) - end]
+        if len(source_middle) == len(target_middle):
+            # Same shape: diff the changed items in place
+            for offset, (source_item, target_item) in enumerate(zip(source_middle, target_middle)):
+                _diff(source_item, target_item, path + [start + offset], operations)
+        else:
+            operations.append({'op': 'splice', 'path': path, 'start': start, 'delete': len(source_middle), 'insert': target_middle})
+        return
+    
+    operations.append({'op': 'set', 'path': path, 'value': target})
+
+
+def _same(source, target) -> bool:
+    # 1 == True == 1.0 in Python but not in JSON, also inside containers; == rules out most differences first
+    if type(source) is not type(target) or source != target:
+        return False
+    if isinstance(source, dict):
+        return all(_same(value, target[key]) for key, value in source.items())
+    if isinstance(source, list):
+        return all(_same(source_item, target_item) for source_item, target_item in zip(source, target))
+    return True
+
+
+def _writable_child(parent, key, copied: set):
+    child = parent[key]
+    if id(child) not in copied:
+        child = list(child) if isinstance(child, list) else dict(child)
+        parent[key] = child
+        copied.add(id(child))
+    return child
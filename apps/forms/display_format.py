@@ -0,0 +1,355 @@
+import json
+import re
+from typing import Dict, List
+from openpyxl.utils import get_column_letter
+
+
+LEGACY_FORMAT = 'legacy'
+COMPACT_FORMAT = 'compact'
+SPARSE_FORMAT = 'sparse'
+DISPLAY_FORMATS = [LEGACY_FORMAT, COMPACT_FORMAT, SPARSE_FORMAT]
+
+STYLE_KEYS = ('font', 'fill', 'alignment', 'borders', 'number_format', 'protection')
+
+DEFAULT_COLUMN_WIDTH = 8.43
+DEFAULT_ROW_HEIGHT = 15
+
+
+def infer_data_type(value) -> str:
+    if value is None or value == "":
+        return "empty"
+    elif isinstance(value, bool):
+        return "boolean"
+    elif isinstance(value, (int, float)):
+        return "number"
+    elif isinstance(value, str):
+        if value.startswith("="):
+            return "formula"
+        return "text"
+    else:
+        return "unknown"
+
+
+def merged_column_letter(col: int) -> str:
+    """Column letter used for merged-cell placeholders (only exact up to column ZZ)"""
+    return chr(65 + col) if col < 26 else chr(64 + col // 26) + chr(65 + col % 26)
+
+
+def merged_cell_placeholder(row: int, col: int, column_width, row_height) -> Dict:
+    """Metadata for a cell covered by a merged range"""
+    return {
+        "address": f"{merged_column_letter(col)}{row + 1}",
+        "value": None,
+        "formula": None,
+        "display_value": "",
+        "data_type": "empty",
+        "row": row,
+        "column": col,
+        "font": {"name": "", "size": 11, "bold": False, "italic": False, "underline": "none", "strikethrough": False, "color": ""},
+        "fill": {"color": "", "pattern_type": ""},
+        "alignment": {"horizontal": "", "vertical": "", "wrap_text": False, "indent": 0, "text_rotation": 0},
+        "borders": {"left": {"style": ""}, "right": {"style": ""}, "top": {"style": ""}, "bottom": {"style": ""}},
+        "number_format": {"format": ""},
+        "protection": {"locked": True},
+        "column_width": column_width,
+        "row_height": row_height,
+        "column_hidden": False,
+        "row_hidden": False,
+        "hyperlink": {"target": ""},
+        "comment": {"text": ""},
+        "validation": {},
+        "conditional_formats": []
+    }
+
+
+def is_compact(display_json) -> bool:
+    return isinstance(display_json, dict) and display_json.get('format') == COMPACT_FORMAT
+
+
+def is_sparse(display_json) -> bool:
+    return isinstance(display_json, dict) and display_json.get('format') == SPARSE_FORMAT
+
+
+def compact_display_json(display_json: Dict) -> Dict:
+    """Convert legacy or sparse display metadata to the compact style-table format.
+    
+    Each distinct style is stored once in `styles` and referenced by index,
+    column widths and row heights move to `columns`/`rows`, and fields that
+    can be derived from a cell's value are dropped. Anything that does not
+    match the derived value is kept on the cell, so the conversion is lossless.
+    """
+    if not display_json or is_compact(display_json):
+        return display_json
+    if is_sparse(display_json):
+        return _densify(display_json)
+    
+    cells = display_json.get('cells', [])
+    dimensions = display_json.get('dimensions', {})
+    columns = _column_table(cells, dimensions.get('columns', 0))
+    rows = _row_table(cells, dimensions.get('rows', 0))
+    
+    styles = []
+    style_ids = {}
+    compact_cells = []
+    for cell in cells:
+        row, col = cell['row'], cell['column']
+        column, row_info = _table_entry(columns, col), _table_entry(rows, row)
+        
+        if cell.get('value') is None and cell.get('fill', {}).get('pattern_type') == "":
+            placeholder = merged_cell_placeholder(row, col, column['width'], row_info['height'])
+            if cell == placeholder:
+                compact_cells.append({"row": row, "column": col, "merged": True})
+                continue
+        
+        style = {key: cell.get(key) for key in STYLE_KEYS}
+        style_key = json.dumps(style, sort_keys=True, default=str)
+        style_id = style_ids.get(style_key)
+        if style_id is None:
+            style_id = len(styles)
+            style_ids[style_key] = style_id
+            styles.append(style)
+        
+        compact_cells.append(_compact_cell(cell, style_id, column, row_info))
+    
+    compact = {key: value for key, value in display_json.items() if key != 'cells'}
+    compact.update({
+        "format": COMPACT_FORMAT,
+        "styles": styles,
+        "columns": columns,
+        "rows": rows,
+        "cells": compact_cells,
+    })
+    return compact
+
+
+def expand_display_json(display_json: Dict) -> Dict:
+    """Convert compact or sparse display metadata back to the legacy per-cell shape"""
+    if is_sparse(display_json):
+        display_json = _densify(display_json)
+    if not is_compact(display_json):
+        return display_json
+    
+    styles = display_json['styles']
+    columns = display_json['columns']
+    rows = display_json['rows']
+    
+    legacy = {
+        key: value for key, value in display_json.items()
+        if key not in ('format', 'styles', 'columns', 'rows', 'cells')
+    }
+    legacy['cells'] = [_expand_cell(cell, styles, columns, rows) for cell in display_json['cells']]
+    return legacy
+
+
+def sparse_display_json(display_json: Dict) -> Dict:
+    """Convert display metadata to the sparse format.
+    
+    Same as the compact format, but only cells with a value, a formula or
+    formatting other than the sheet's most common empty style are stored.
+    The omitted cells (and merged-cell placeholders, which follow from
+    `merged_cells`) are rebuilt from `dimensions` and `default_style`.
+    """
+    if not display_json or is_sparse(display_json):
+        return display_json
+    
+    compact = compact_display_json(display_json)
+    cells = compact['cells']
+    rows, columns = compact['dimensions']['rows'], compact['dimensions']['columns']
+    
+    # Omitting cells relies on the dense row-major grid the extractor produces
+    if len(cells) != rows * columns or any(
+        cell['row'] != index // columns or cell['column'] != index % columns
+        for index, cell in enumerate(cells)
+    ):
+        return compact
+    
+    covered = _merged_positions(compact)
+    style_counts = {}
+    for cell in cells:
+        if _is_blank(cell):
+            style_counts[cell['style']] = style_counts.get(cell['style'], 0) + 1
+    default_style = max(style_counts, key=style_counts.get) if style_counts else None
+    
+    sparse = {key: value for key, value in compact.items() if key != 'cells'}
+    sparse.update({
+        "format": SPARSE_FORMAT,
+        "default_style": default_style,
+        "cells": [cell for cell in cells if not _is_implied(cell, covered, default_style)],
+    })
+    return sparse
+
+
+def to_display_format(display_json: Dict, display_format: str) -> Dict:
+    if display_format == SPARSE_FORMAT:
+        return sparse_display_json(display_json)
+    if display_format == COMPACT_FORMAT:
+        return compact_display_json(display_json)
+    return expand_display_json(display_json)
+
+
+def fill_display_values(display_json: Dict, form_values: Dict) -> Dict:
+    """Replace <pa_N> placeholders in display cells with submitted form values"""
+    compact = is_compact(display_json) or is_sparse(display_json)
+    
+    for cell in display_json.get('cells', []):
+        cell_value = cell.get('value', '')
+        if cell_value and '<pa' in str(cell_value):
+            # Extract ID from pattern like <pa_1>
+            match = re.search(r'<pa_(\d+)>', str(cell_value))
+            if match:
+                field_id = match.group(1)
+                if field_id in form_values:
+                    if compact:
+                        # Keep the template's data type, as the legacy shape does
+                        cell.setdefault('data_type', infer_data_type(cell_value))
+                    cell['value'] = form_values[field_id]
+                    cell['display_value'] = str(form_values[field_id])
+    
+    return display_json
+
+
+def _merged_positions(display_json: Dict) -> set:
+    """Grid positions covered by a merged range, other than its top-left cell"""
+    dimensions = display_json.get('dimensions', {})
+    rows, columns = dimensions.get('rows', 0), dimensions.get('columns', 0)
+    
+    covered = set()
+    for merged in display_json.get('merged_cells', []):
+        for row in range(merged['start_row'], min(merged['start_row'] + merged['row_span'], rows)):
+            for col in range(merged['start_col'], min(merged['start_col'] + merged['col_span'], columns)):
+                if (row, col) != (merged['start_row'], merged['start_col']):
+                    covered.add((row, col))
+    return covered
+
+
+def _is_blank(cell: Dict) -> bool:
+    return cell.keys() == {'row', 'column', 'value', 'style'} and cell['value'] is None
+
+
+def _is_implied(cell: Dict, covered: set, default_style) -> bool:
+    if (cell['row'], cell['column']) in covered:
+        return cell.get('merged', False) and len(cell) == 3
+    return _is_blank(cell) and cell['style'] == default_style
+
+
+def _densify(display_json: Dict) -> Dict:
+    """Rebuild the full compact cell grid from sparse display metadata"""
+    rows, columns = display_json['dimensions']['rows'], display_json['dimensions']['columns']
+    covered = _merged_positions(display_json)
+    stored = {(cell['row'], cell['column']): cell for cell in display_json['cells']}
+    default_style = display_json.get('default_style')
+    
+    cells = []
+    for row in range(rows):
+        for col in range(columns):
+            cell = stored.get((row, col))
+            if cell is None:
+                if (row, col) in covered:
+                    cell = {"row": row, "column": col, "merged": True}
+                else:
+                    cell = {"row": row, "column": col, "value": None, "style": default_style}
+            cells.append(cell)
+    
+    compact = {key: value for key, value in display_json.items() if key not in ('default_style', 'cells')}
+    compact.update({"format": COMPACT_FORMAT, "cells": cells})
+    return compact
+
+
+def _column_table(cells: List[Dict], column_count: int) -> List[Dict]:
+    columns = [None] * column_count
+    for cell in cells:
+        col = cell['column']
+        if col < column_count and columns[col] is None and cell.get('font', {}).get('name') != "":
+            columns[col] = {"width": cell.get('column_width'), "hidden": cell.get('column_hidden')}
+    
+    for cell in cells:
+        col = cell['column']
+        if col < column_count and columns[col] is None:
+            columns[col] = {"width": cell.get('column_width'), "hidden": False}
+    
+    return [column or {"width": DEFAULT_COLUMN_WIDTH, "hidden": False} for column in columns]
+
+
+def _row_table(cells: List[Dict], row_count: int) -> List[Dict]:
+    rows = [None] * row_count
+    for cell in cells:
+        row = cell['row']
+        if row < row_count and rows[row] is None and cell.get('font', {}).get('name') != "":
+            rows[row] = {"height": cell.get('row_height'), "hidden": cell.get('row_hidden')}
+    
+    for cell in cells:
+        row = cell['row']
+        if row < row_count and rows[row] is None:
+            rows[row] = {"height": cell.get('row_height'), "hidden": False}
+    
+    return [row or {"height": DEFAULT_ROW_HEIGHT, "hidden": False} for row in rows]
+
+
+def _table_entry(table: List[Dict], index: int) -> Dict:
+    if index < len(table):
+        return table[index]
+    return {"width": DEFAULT_COLUMN_WIDTH, "height": DEFAULT_ROW_HEIGHT, "hidden": False}
+
+
+def _compact_cell(cell: Dict, style_id: int, column: Dict, row_info: Dict) -> Dict:
+    row, col = cell['row'], cell['column']
+    value = cell.get('value')
+    compact = {"row": row, "column": col, "value": value, "style": style_id}
+    
+    if cell.get('formula') is not None:
+        compact['formula'] = cell['formula']
+    
+    hyperlink = cell.get('hyperlink', {}).get('target')
+    if hyperlink != "":
+        compact['hyperlink'] = hyperlink
+    comment = cell.get('comment', {}).get('text')
+    if comment != "":
+        compact['comment'] = comment
+    
+    # Keep anything that differs from what expansion would derive
+    derived = {
+        "address": f"{get_column_letter(col + 1)}{row + 1}",
+        "display_value": str(value) if value is not None else "",
+        "data_type": infer_data_type(value),
+        "column_width": column['width'],
+        "row_height": row_info['height'],
+        "column_hidden": column['hidden'],
+        "row_hidden": row_info['hidden'],
+        "validation": {},
+        "conditional_formats": [],
+    }
+    for key, derived_value in derived.items():
+        if cell.get(key) != derived_value:
+            compact[key] = cell.get(key)
+    
+    return compact
+
+
+def _expand_cell(cell: Dict, styles: List[Dict], columns: List[Dict], rows: List[Dict]) -> Dict:
+    row, col = cell['row'], cell['column']
+    column, row_info = _table_entry(columns, col), _table_entry(rows, row)
+    
+    if cell.get('merged'):
+        return merged_cell_placeholder(row, col, column['width'], row_info['height'])
+    
+    value = cell.get('value')
+    style = styles[cell['style']]
+    return {
+        "address": cell.get('address', f"{get_column_letter(col + 1)}{row + 1}"),
+        "value": value,
+        "formula": cell.get('formula'),
+        "display_value": cell.get('display_value', str(value) if value is not None else ""),
+        "data_type": cell.get('data_type', infer_data_type(value)),
+        "row": row,
+        "column": col,
+        **style,
+        "column_width": cell.get('column_width', column['width']),
+        "row_height": cell.get('row_height', row_info['height']),
+        "column_hidden": cell.get('column_hidden', column['hidden']),
+        "row_hidden": cell.get('row_hidden', row_info['hidden']),
+        "hyperlink": {"target": cell.get('hyperlink', "")},
+        "comment": {"text": cell.get('comment', "")},
+        "validation": cell.get('validation', {}),
+        "conditional_formats": cell.get('conditional_formats', [])
+    }
+
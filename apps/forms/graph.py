@@ -0,0 +1,349 @@
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlencode, urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from decouple import config
+from django.conf import settings
+from django.core.cache import caches
+from msal import ConfidentialClientApplication
+
+
+logger = logging.getLogger(__name__)
+
+GRAPH_SCOPES = ["https://graph.microsoft.com/.default"]
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+# Graph rejects $batch payloads with more requests than this
+GRAPH_BATCH_LIMIT = 20
+
+
+class GraphTokenCache:
+    """Process-wide Microsoft Graph app token shared by every SharePointService.
+    
+    The token lives in memory for threads of this process and in the shared
+    Django cache for other processes. It is refreshed GRAPH_TOKEN_REFRESH_MARGIN
+    seconds before it expires, so callers never receive a token about to lapse.
+    """
+    
+    CACHE_KEY = 'graph:app_token'
+    
+    _lock = threading.Lock()
+    _client_app = None
+    _access_token = None
+    _expires_at = 0.0
+    
+    @classmethod
+    def get_token(cls) -> str:
+        if cls._is_fresh(cls._expires_at):
+            return cls._access_token
+        
+        with cls._lock:
+            # Another thread may have refreshed while we waited
+            if cls._is_fresh(cls._expires_at):
+                return cls._access_token
+            
+            shared = cls._shared_cache().get(cls.CACHE_KEY)
+            if shared and cls._is_fresh(shared['expires_at']):
+                cls._access_token = shared['access_token']
+                cls._expires_at = shared['expires_at']
+                return cls._access_token
+            
+            result = cls._get_client_app().acquire_token_for_client(scopes=GRAPH_SCOPES)
+            if "access_token" not in result:
+                raise Exception(f"Failed to acquire token: {result.get('error_description')}")
+            
+            expires_in = int(result.get('expires_in', 3599))
+            cls._access_token = result['access_token']
+            cls._expires_at = time.time() + expires_in
+            
+            cls._shared_cache().set(
+                cls.CACHE_KEY,
+                {'access_token': cls._access_token, 'expires_at': cls._expires_at},
+                timeout=max(expires_in - settings.GRAPH_TOKEN_REFRESH_MARGIN, 1)
+            )
+            return cls._access_token
+    
+    @classmethod
+    def invalidate(cls):
+        """Forget the current token, e.g. after Graph rejects it with 401"""
+        with cls._lock:
+            cls._access_token = None
+            cls._expires_at = 0.0
+            cls._shared_cache().delete(cls.CACHE_KEY)
+    
+    @classmethod
+    def _is_fresh(cls, expires_at: float) -> bool:
+        return expires_at - settings.GRAPH_TOKEN_REFRESH_MARGIN > time.time()
+    
+    @classmethod
+    def _shared_cache(cls):
+        return caches[settings.GRAPH_TOKEN_CACHE_ALIAS]
+    
+    @classmethod
+    def _get_client_app(cls) -> ConfidentialClientApplication:
+        if cls._client_app is None:
+            cls._client_app = ConfidentialClientApplication(
+                config('MICROSOFT_CLIENT_ID'),
+                authority=f"https://login.microsoftonline.com/{config('MICROSOFT_TENANT_ID')}",
+                client_credential=config('MICROSOFT_CLIENT_SECRET'),
+            )
+        return cls._client_app
+
+
+class GraphBatchResponse:
+    """One response out of a $batch call, exposing the parts of requests.Response the services use"""
+    
+    def __init__(self, item: Dict):
+        self.status_code = item.get('status')
+        self.headers = item.get('headers') or {}
+        self.body = item.get('body')
+    
+    def json(self):
+        return self.body
+    
+    @property
+    def text(self) -> str:
+        return self.body if isinstance(self.body, str) else json.dumps(self.body)
+
+
+class GraphClient:
+    """Single HTTP layer for Microsoft Graph calls.
+    
+    All instances share one pooled requests.Session and process-wide caps on
+    requests in flight and on streamed downloads. Throttled (429) and unavailable (5xx) responses are retried
+    with exponential backoff that honours Retry-After; a Retry-After longer than
+    GRAPH_RETRY_AFTER_MAX returns the response instead of retrying early. A 401
+    refreshes the app token once. Point base_url at a local stub server to run without Graph.
+    """
+    
+    _session = None
+    _session_lock = threading.Lock()
+    _semaphore = None
+    _download_semaphore = None
+    _executor = None
+    
+    stats_lock = threading.Lock()
+    stats = {'calls': 0, 'retries': 0, 'failures': 0, 'total_seconds': 0.0}
+    
+    def __init__(self, base_url: str = None, token_provider: Callable[[], str] = None, timeout=None):
+        self.base_url = (base_url or settings.GRAPH_BASE_URL).rstrip('/')
+        self.token_provider = token_provider or GraphTokenCache.get_token
+        # requests' (connect, read) timeout for every call of this client
+        self.timeout = timeout or (settings.GRAPH_CONNECT_TIMEOUT, settings.GRAPH_READ_TIMEOUT)
+    
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        if cls._session is None:
+            with cls._session_lock:
+                if cls._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=settings.GRAPH_POOL_SIZE,
+                        pool_maxsize=settings.GRAPH_POOL_SIZE
+                    )
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    cls._semaphore = threading.BoundedSemaphore(settings.GRAPH_MAX_CONCURRENCY)
+                    cls._download_semaphore = threading.BoundedSemaphore(settings.GRAPH_MAX_DOWNLOADS)
+                    cls._session = session
+        return cls._session
+    
+    @classmethod
+    def get_executor(cls) -> ThreadPoolExecutor:
+        """Shared pool for running independent Graph calls alongside each other"""
+        with cls._session_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=settings.GRAPH_MAX_CONCURRENCY,
+                    thread_name_prefix='graph'
+                )
+            return cls._executor
+    
+    def url(self, path: str) -> str:
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+    
+    def is_graph_url(self, url: str) -> bool:
+        """Whether an absolute URL (nextLink, deltaLink) points at base_url's host and may carry the app token"""
+        target, base = urlsplit(url), urlsplit(self.base_url)
+        return (target.scheme, target.netloc.lower()) == (base.scheme, base.netloc.lower())
+    
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+    
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+    
+    def patch(self, path: str, **kwargs) -> requests.Response:
+        return self.request('PATCH', path, **kwargs)
+    
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', path, **kwargs)
+    
+    def batch(self, requests_: List[Dict]) -> List:
+        """Send independent requests through Graph JSON batching.
+        
+        Each request is a dict with `url` (relative to base_url) and optional
+        `method` (default GET) and `params`. Requests are grouped into $batch
+        calls of at most GRAPH_BATCH_SIZE; a lone request is sent as a plain
+        call. Throttled or unavailable sub-requests are retried with the usual
+        backoff. Responses come back in request order.
+        """
+        responses = [None] * len(requests_)
+        pending = list(range(len(requests_)))
+        batch_size = max(1, min(settings.GRAPH_BATCH_SIZE, GRAPH_BATCH_LIMIT))
+        retries = 0
+        
+        while pending:
+            retry = {}
+            retry_after = None
+            
+            for start in range(0, len(pending), batch_size):
+                chunk = pending[start:start + batch_size]
+                if len(pending) == 1:
+                    index = chunk[0]
+                    responses[index] = self.request(requests_[index].get('method', 'GET'), self._batch_url(requests_[index]))
+                    continue
+                
+                response = self.post('$batch', json={'requests': [
+                    {'id': str(index), 'method': requests_[index].get('method', 'GET'), 'url': self._batch_url(requests_[index])}
+                    for index in chunk
+                ]})
+                if response.status_code != 200:
+                    raise Exception(f"Graph batch request failed: {response.text}")
+                
+                for item in response.json().get('responses', []):
+                    index = int(item['id'])
+                    sub_response = GraphBatchResponse(item)
+                    if sub_response.status_code in RETRY_STATUS_CODES and retries < settings.GRAPH_MAX_RETRIES:
+                        retry[index] = sub_response
+                        retry_after = sub_response.headers.get('Retry-After') or retry_after
+                    else:
+                        responses[index] = sub_response
+            
+            missing = [index for index in pending if responses[index] is None and index not in retry]
+            if missing:
+                raise Exception(f"Graph batch response is missing {len(missing)} request(s)")
+            
+            if retry:
+                retries += 1
+                delay = self._backoff(retries, retry_after)
+                if delay is None:
+                    # Throttled for longer than we wait; hand back the throttled responses
+                    for index, sub_response in retry.items():
+                        responses[index] = sub_response
+                    break
+                time.sleep(delay)
+            pending = sorted(retry)
+        
+        return responses
+    
+    def _batch_url(self, batch_request: Dict) -> str:
+        url = '/' + batch_request['url'].lstrip('/')
+        if batch_request.get('params'):
+            url += '?' + urlencode(batch_request['params'], safe='$,')
+        return url
+    
+    @contextmanager
+    def stream(self, path: str, **kwargs):
+        """GET `path` with a streamed body, holding a download slot until the response is closed.
+        
+        Bodies are read under GRAPH_MAX_DOWNLOADS; a GRAPH_MAX_CONCURRENCY slot
+        is only held until the headers arrive, so requests made while a
+        download runs (e.g. its drive item's metadata) never wait for it.
+        """
+        self.get_session()
+        with self._download_semaphore:
+            response = self._request('GET', path, slot=self._semaphore, stream=True, **kwargs)
+            with response:
+                yield response
+    
+    def request(self, method: str, path: str, headers: Dict = None, **kwargs) -> requests.Response:
+        """Send a Graph request, retrying throttled and transient failures"""
+        self.get_session()
+        return self._request(method, path, headers=headers, slot=self._semaphore, **kwargs)
+    
+    def _request(self, method: str, path: str, slot, headers: Dict = None, **kwargs) -> requests.Response:
+        session = self.get_session()
+        url = self.url(path)
+        kwargs.setdefault('timeout', self.timeout)
+        
+        # Other hosts, e.g. pre-authenticated @microsoft.graph.downloadUrl links, never see the app token
+        authenticate = self.is_graph_url(url)
+        retries = 0
+        token_refreshed = False
+        started = time.monotonic()
+        
+        while True:
+            request_headers = {"Authorization": f"Bearer {self.token_provider()}"} if authenticate else {}
+            request_headers.update(headers or {})
+            
+            try:
+                with slot:
+                    response = session.request(method, url, headers=request_headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if retries >= settings.GRAPH_MAX_RETRIES:
+                    self._record(method, url, None, retries, started, failed=True)
+                    raise Exception(f"Graph request failed: {e}")
+                retries += 1
+                time.sleep(self._backoff(retries, None))
+                continue
+            
+            if response.status_code == 401 and authenticate and not token_refreshed and self.token_provider == GraphTokenCache.get_token:
+                token_refreshed = True
+                GraphTokenCache.invalidate()
+                # Returns a streamed response's connection to the pool
+                response.close()
+                continue
+            
+            if response.status_code in RETRY_STATUS_CODES and retries < settings.GRAPH_MAX_RETRIES:
+                delay = self._backoff(retries + 1, response.headers.get('Retry-After'))
+                if delay is not None:
+                    retries += 1
+                    response.close()
+                    time.sleep(delay)
+                    continue
+            
+            self._record(method, url, response.status_code, retries, started, failed=response.status_code >= 400)
+            return response
+    
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None if Graph asks to wait longer than GRAPH_RETRY_AFTER_MAX"""
+        delay = self._parse_retry_after(retry_after)
+        if delay is not None:
+            # Retrying before Retry-After only spends attempts while still throttled
+            return delay if delay <= settings.GRAPH_RETRY_AFTER_MAX else None
+        
+        delay = settings.GRAPH_BACKOFF_BASE * (2 ** (attempt - 1))
+        delay += random.uniform(0, delay / 2)
+        return min(delay, settings.GRAPH_BACKOFF_MAX)
+    
+    def _parse_retry_after(self, retry_after: Optional[str]) -> Optional[float]:
+        if not retry_after:
+            return None
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+    
+    def _record(self, method: str, url: str, status_code: Optional[int], retries: int, started: float, failed: bool):
+        elapsed = time.monotonic() - started
+        with self.stats_lock:
+            self.stats['calls'] += 1
+            self.stats['retries'] += retries
+            self.stats['total_seconds'] += elapsed
+            if failed:
+                self.stats['failures'] += 1
+        logger.info("graph %s %s status=%s retries=%d elapsed_ms=%.1f", method, url, status_code, retries, elapsed * 1000)
@@ -0,0 +1,364 @@
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from apps.permissions.models import Role
+from .models import Form, GraphSubscription, ImportJob, UserFormAccess
+from .services import SharePointService
+from .sources import GraphWorkbookSource, UploadedWorkbookSource, WorkbookSourceError, discard_upload, open_upload
+from .subscriptions import GraphSubscriptionManager
+
+
+logger = logging.getLogger(__name__)
+
+
+def grant_form_admin(user, form_id: int):
+    """Grant admin access to the creator of a form"""
+    admin_role = Role.objects.get(role_name='Form Admin')
+    UserFormAccess.objects.create(
+        user=user,
+        form_id=form_id,
+        role=admin_role,
+        created_by=user
+    )
+
+
+class ImportJobRunner:
+    """Runs SharePoint import jobs stored in the import_jobs table.
+    
+    With IMPORT_JOB_MODE='thread' jobs run on a small in-process thread pool as
+    soon as the enqueuing transaction commits. With IMPORT_JOB_MODE='worker'
+    they are only queued and `manage.py run_import_jobs` picks them up.
+    Failed attempts are retried after IMPORT_JOB_RETRY_DELAY * attempt seconds.
+    """
+    
+    _executor = None
+    _lock = threading.Lock()
+    
+    @classmethod
+    def enqueue(cls, kind: str, params: Dict, user, form: Form = None, delay: float = 0) -> ImportJob:
+        """Queue a job to run after `delay` seconds, or return a pending job that already covers it"""
+        if settings.IMPORT_JOB_MODE == 'thread':
+            # Before deduplicating, so a job lost with a restarted process is running again when it is returned
+            for job_id in cls.recover_stale_jobs():
+                cls.submit(job_id)
+        
+        queued = cls._queued_job(kind, params, user, form)
+        if queued is not None:
+            return queued
+        
+        job = ImportJob.objects.create(
+            kind=kind,
+            form=form,
+            params=params,
+            max_attempts=settings.IMPORT_JOB_MAX_ATTEMPTS,
+            available_at=timezone.now() + timedelta(seconds=delay),
+            created_by=user
+        )
+        
+        if settings.IMPORT_JOB_MODE == 'thread':
+            transaction.on_commit(lambda: cls.submit(job.id, delay=delay))
+        return job
+    
+    @classmethod
+    def _queued_job(cls, kind: str, params: Dict, user, form: Form = None) -> Optional[ImportJob]:
+        """A pending job of the same user that covers this request; its result is shared instead of importing twice.
+        
+        Only the user's own jobs qualify, since jobs can only be polled by their creator.
+        Imports of the same form by different users still share one run through the form's import lock.
+        """
+        queued = ImportJob.objects.filter(kind=kind, status=ImportJob.PENDING, attempts=0, created_by=user)
+        if kind == ImportJob.UPDATE:
+            queued = queued.filter(form=form)
+            if params.get('force'):
+                queued = queued.filter(params__force=True)
+        elif kind == ImportJob.CHANGES:
+            queued = queued.filter(params__subscription_id=params['subscription_id'])
+        else:
+            return None
+        return queued.order_by('id').first()
+    
+    @classmethod
+    def submit(cls, job_id: int, delay: float = 0):
+        if delay > 0:
+            timer = threading.Timer(delay, cls.submit, args=(job_id,))
+            timer.daemon = True
+            timer.start()
+            return
+        cls._get_executor().submit(cls._run_in_thread, job_id)
+    
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=settings.IMPORT_JOB_WORKERS,
+                    thread_name_prefix='import-job'
+                )
+            return cls._executor
+    
+    @classmethod
+    def _run_in_thread(cls, job_id: int):
+        close_old_connections()
+        try:
+            retry_delay = cls.run(job_id)
+        finally:
+            close_old_connections()
+        
+        if retry_delay is not None:
+            cls.submit(job_id, delay=retry_delay)
+    
+    @classmethod
+    def claim(cls, job_id: int = None) -> Optional[ImportJob]:
+        """Atomically move one due pending job to running and return it"""
+        now = timezone.now()
+        candidates = ImportJob.objects.filter(status=ImportJob.PENDING, available_at__lte=now)
+        if job_id is not None:
+            candidates = candidates.filter(id=job_id)
+        
+        for candidate_id in candidates.order_by('available_at', 'id').values_list('id', flat=True)[:10]:
+            claimed = ImportJob.objects.filter(id=candidate_id, status=ImportJob.PENDING).update(
+                status=ImportJob.RUNNING,
+                started_at=now,
+                attempts=F('attempts') + 1,
+                error=None,
+                updated_at=now
+            )
+            if claimed:
+                return ImportJob.objects.get(id=candidate_id)
+        return None
+    
+    @classmethod
+    def run(cls, job_id: int) -> Optional[float]:
+        job = cls.claim(job_id)
+        if job is None:
+            return None
+        return cls.run_job(job)
+    
+    @classmethod
+    def run_job(cls, job: ImportJob) -> Optional[float]:
+        """Run a claimed job; returns the retry delay in seconds if it should be retried"""
+        def progress(percent: int, message: str):
+            ImportJob.objects.filter(id=job.id).update(
+                progress=percent, progress_message=message, updated_at=timezone.now()
+            )
+        
+        try:
+            if job.kind == ImportJob.CREATE:
+                result = cls._run_create(job, progress)
+            elif job.kind == ImportJob.WORKBOOK:
+                result = cls._run_workbook(job, progress)
+            elif job.kind == ImportJob.CHANGES:
+                result = cls._run_changes(job, progress)
+            elif job.kind == ImportJob.UPLOAD:
+                result = cls._run_upload(job, progress)
+            else:
+                result = cls._run_update(job, progress)
+        except Exception as e:
+            logger.warning("Import job %s attempt %s failed: %s", job.id, job.attempts, e)
+            retryable = not isinstance(e, (Form.DoesNotExist, GraphSubscription.DoesNotExist, WorkbookSourceError)) and job.attempts < job.max_attempts
+            return cls._fail(job, e, retryable)
+        
+        ImportJob.objects.filter(id=job.id).update(
+            status=ImportJob.SUCCEEDED,
+            # A workbook job imports several forms and records none
+            form_id=result.get('form_id', job.form_id),
+            result=result,
+            progress=100,
+            progress_message='Done',
+            finished_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+        cls._discard_upload(job)
+        return None
+    
+    @classmethod
+    def _run_create(cls, job: ImportJob, progress) -> Dict:
+        if job.form_id is not None:
+            return cls._created_result(job)
+        
+        params = job.params
+        user = job.created_by
+        return SharePointService().create_new_form(
+            params['sharepoint_url'],
+            params['form_name'],
+            created_by=user,
+            updated_by=user,
+            custom_scripts=params.get('custom_scripts', []),
+            observation_count=params.get('observation_count', 1),
+            progress=progress,
+            on_created=cls._on_created(job)
+        )
+    
+    @classmethod
+    def _on_created(cls, job: ImportJob):
+        """Grant the creator access and record the form on the job in the transaction that creates it"""
+        def created(form_id: int):
+            grant_form_admin(job.created_by, form_id)
+            ImportJob.objects.filter(id=job.id).update(form_id=form_id)
+        return created
+    
+    @classmethod
+    def _created_result(cls, job: ImportJob) -> Dict:
+        # An earlier attempt created the form and failed afterwards; retrying must not create a second one
+        return {'form_id': job.form_id, 'form_name': job.form.form_name, 'outcome': 'created'}
+    
+    @classmethod
+    def _run_workbook(cls, job: ImportJob, progress) -> Dict:
+        params = job.params
+        user = job.created_by
+        service = SharePointService()
+        return service.import_workbook_forms(
+            GraphWorkbookSource(service, params['sharepoint_url']),
+            created_by=user,
+            updated_by=user,
+            form_names=params.get('form_names'),
+            custom_scripts=params.get('custom_scripts', []),
+            observation_count=params.get('observation_count', 1),
+            progress=progress,
+            force=params.get('force', False),
+            # Retries find the forms created before by URL and update them
+            on_created=lambda form_id: grant_form_admin(user, form_id)
+        )
+    
+    @classmethod
+    def _run_upload(cls, job: ImportJob, progress) -> Dict:
+        params = job.params
+        user = job.created_by
+        if 'form_name' in params and job.form_id is not None:
+            return cls._created_result(job)
+        
+        service = SharePointService()
+        with open_upload(params['file']) as workbook_file:
+            source = UploadedWorkbookSource(workbook_file)
+            if 'form_name' in params:
+                return service.create_form_from_source(
+                    source,
+                    params['form_name'],
+                    created_by=user,
+                    updated_by=user,
+                    custom_scripts=params.get('custom_scripts', []),
+                    observation_count=params.get('observation_count', 1),
+                    progress=progress,
+                    on_created=cls._on_created(job)
+                )
+            return service.update_form_from_source(
+                job.form,
+                source,
+                updated_by=user,
+                progress=progress,
+                force=params.get('force', False)
+            )
+    
+    @classmethod
+    def _run_changes(cls, job: ImportJob, progress) -> Dict:
+        subscription = GraphSubscription.objects.get(subscription_id=job.params['subscription_id'])
+        progress(10, 'Listing changed files')
+        forms, delta_link = GraphSubscriptionManager().changed_forms(subscription)
+        
+        # Saves made in quick succession land in the same pending update of each form
+        with transaction.atomic():
+            updates = [
+                cls.enqueue(ImportJob.UPDATE, {'force': False}, subscription.created_by, form=form, delay=settings.GRAPH_NOTIFICATION_DEBOUNCE)
+                for form in forms
+            ]
+            subscription.delta_link = delta_link
+            subscription.save(update_fields=['delta_link', 'updated_at'])
+        
+        return {
+            'subscription_id': subscription.subscription_id,
+            'form_ids': [form.id for form in forms],
+            'job_ids': sorted({update.id for update in updates})
+        }
+    
+    @classmethod
+    def _run_update(cls, job: ImportJob, progress) -> Dict:
+        return SharePointService().update_existing_form(
+            job.form_id,
+            updated_by=job.created_by,
+            progress=progress,
+            force=job.params.get('force', False)
+        )
+    
+    @classmethod
+    def _fail(cls, job: ImportJob, error: Exception, retryable: bool) -> Optional[float]:
+        now = timezone.now()
+        message = f"{error}\n\n{traceback.format_exc()}"
+        
+        if retryable:
+            delay = settings.IMPORT_JOB_RETRY_DELAY * job.attempts
+            ImportJob.objects.filter(id=job.id).update(
+                status=ImportJob.PENDING,
+                error=message,
+                progress=0,
+                progress_message=f'Retrying after failed attempt {job.attempts}',
+                available_at=now + timedelta(seconds=delay),
+                updated_at=now
+            )
+            return delay
+        
+        ImportJob.objects.filter(id=job.id).update(
+            status=ImportJob.FAILED,
+            error=message,
+            finished_at=now,
+            updated_at=now
+        )
+        cls._discard_upload(job)
+        return None
+    
+    @classmethod
+    def _discard_upload(cls, job: ImportJob):
+        # Uploaded workbooks are kept for retries until the job has finished
+        if job.kind == ImportJob.UPLOAD:
+            discard_upload(job.params['file'])
+    
+    @classmethod
+    def recover_stale_jobs(cls) -> List[int]:
+        """Requeue running jobs whose worker died; returns the requeued job IDs.
+        
+        In thread mode, pending jobs overdue by IMPORT_JOB_STALE_AFTER are returned as
+        well: they were queued on a thread pool or timer of a process that has since
+        stopped, and nothing else would run them.
+        """
+        now = timezone.now()
+        stale_before = now - timedelta(seconds=settings.IMPORT_JOB_STALE_AFTER)
+        stale = ImportJob.objects.filter(status=ImportJob.RUNNING, updated_at__lt=stale_before)
+        
+        requeued = []
+        if settings.IMPORT_JOB_MODE == 'thread':
+            overdue = ImportJob.objects.filter(status=ImportJob.PENDING, available_at__lt=stale_before, updated_at__lt=stale_before)
+            for job in overdue:
+                # Touched so other processes recovering at the same time skip it
+                updated = ImportJob.objects.filter(id=job.id, status=ImportJob.PENDING, updated_at=job.updated_at).update(
+                    progress_message='Resubmitted after its process stopped',
+                    available_at=now,
+                    updated_at=now
+                )
+                if updated:
+                    requeued.append(job.id)
+        
+        for job in stale:
+            if job.attempts < job.max_attempts:
+                updated = ImportJob.objects.filter(id=job.id, status=ImportJob.RUNNING, updated_at=job.updated_at).update(
+                    status=ImportJob.PENDING,
+                    progress_message='Requeued after worker stopped responding',
+                    available_at=now,
+                    updated_at=now
+                )
+                if updated:
+                    requeued.append(job.id)
+            else:
+                ImportJob.objects.filter(id=job.id, status=ImportJob.RUNNING).update(
+                    status=ImportJob.FAILED,
+                    error='Worker stopped responding',
+                    finished_at=now,
+                    updated_at=now
+                )
+                cls._discard_upload(job)
+        return requeued
@@ -0,0 +1,105 @@
+import time
+import uuid
+from datetime import timedelta
+from typing import Callable, Dict, List
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import FormImportLock, WorkbookImportLock
+
+
+def single_flight(form_id: int, import_form: Callable[[], Dict], share: bool = True, on_wait: Callable[[], None] = None) -> Dict:
+    """Run `import_form` while holding the form's import lock, one import per form at a time.
+    
+    A caller that finds the lock held waits for it. Imports with `share` are
+    interchangeable: such a caller returns the result of a shared import that
+    finished after it arrived instead of running its own. Pass share=False when
+    this import differs from others, e.g. an uploaded workbook; it waits, runs
+    and publishes no result. `on_wait` is called on every poll while waiting.
+    The lock is a lease: a holder that dies releases it after
+    FORM_IMPORT_LOCK_TIMEOUT seconds.
+    """
+    arrived = timezone.now()
+    token = uuid.uuid4().hex
+    give_up = time.monotonic() + settings.FORM_IMPORT_LOCK_WAIT
+    
+    while not _acquire(FormImportLock, token, form_id=form_id):
+        if time.monotonic() > give_up:
+            raise Exception(f"Timed out waiting for another import of form {form_id} to finish")
+        if on_wait:
+            on_wait()
+        time.sleep(settings.FORM_IMPORT_LOCK_POLL_INTERVAL)
+        
+        # Checked before trying the lock again, which a finished import has just released
+        if share:
+            finished = FormImportLock.objects.filter(
+                form_id=form_id, finished_at__gte=arrived, result__isnull=False
+            ).values_list('result', flat=True).first()
+            if finished is not None:
+                return finished
+    
+    result = None
+    try:
+        result = import_form()
+        return result
+    finally:
+        # A failed import shares no result; waiters then run their own
+        FormImportLock.objects.filter(form_id=form_id, token=token).update(
+            token=None, expires_at=None, result=result if share else None, finished_at=timezone.now()
+        )
+
+
+def single_flight_all(form_ids: List[int], import_forms: Callable[[], Dict], on_wait: Callable[[], None] = None) -> Dict:
+    """Run `import_forms` while holding the import locks of all `form_ids`, taken in ID order"""
+    if not form_ids:
+        return import_forms()
+    
+    form_ids = sorted(form_ids)
+    return single_flight(
+        form_ids[0],
+        lambda: single_flight_all(form_ids[1:], import_forms, on_wait=on_wait),
+        share=False,
+        on_wait=on_wait
+    )
+
+
+def single_flight_workbook(key: str, import_workbook: Callable[[], Dict], on_wait: Callable[[], None] = None) -> Dict:
+    """Run `import_workbook` while holding the workbook's import lock, one import of its sheet pairs at a time.
+    
+    Forms are looked up inside it, so an import that waited on one creating a
+    new workbook's forms updates them instead of creating them again. The
+    lease and its timeouts work like `single_flight`'s; no result is shared.
+    """
+    token = uuid.uuid4().hex
+    give_up = time.monotonic() + settings.FORM_IMPORT_LOCK_WAIT
+    
+    while not _acquire(WorkbookImportLock, token, key=key):
+        if time.monotonic() > give_up:
+            raise Exception("Timed out waiting for another import of this workbook to finish")
+        if on_wait:
+            on_wait()
+        time.sleep(settings.FORM_IMPORT_LOCK_POLL_INTERVAL)
+    
+    try:
+        return import_workbook()
+    finally:
+        WorkbookImportLock.objects.filter(key=key, token=token).update(token=None, expires_at=None)
+
+
+def _acquire(model, token: str, **key) -> bool:
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.FORM_IMPORT_LOCK_TIMEOUT)
+    claimed = model.objects.filter(**key).filter(Q(token__isnull=True) | Q(expires_at__lt=now)).update(
+        token=token, acquired_at=now, expires_at=expires_at
+    )
+    if claimed:
+        return True
+    
+    try:
+        with transaction.atomic():
+            model.objects.create(token=token, acquired_at=now, expires_at=expires_at, **key)
+        return True
+    except IntegrityError:
+        # Held by another import, or created by one a moment ago
+        return False
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from apps.forms.attachments import UPLOAD_ROOT, index_attachment
+from apps.forms.models import Attachment, FormData
+
+
+class Command(BaseCommand):
+    help = 'Index files already under userUploads/ so entry listings find them without scanning directories'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--form-id', type=int, action='append', dest='form_ids', help='Only index these forms (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Only count files that are not indexed yet')
+    
+    def handle(self, *args, **options):
+        entries = FormData.objects.order_by('id')
+        if options['form_ids']:
+            entries = entries.filter(form_id__in=options['form_ids'])
+        ids = list(entries.values_list('id', flat=True))
+        
+        counts = {'indexed': 0, 'skipped': 0, 'failed': 0}
+        for start in range(0, len(ids), options['batch_size']):
+            batch = FormData.objects.filter(id__in=ids[start:start + options['batch_size']]).only('id', 'form_id')
+            indexed = set(Attachment.objects.filter(form_data__in=batch).values_list('path', flat=True))
+            for form_data in batch:
+                for field_id, file_path in self._files(form_data):
+                    if str(file_path) in indexed:
+                        counts['skipped'] += 1
+                        continue
+                    if options['dry_run']:
+                        counts['indexed'] += 1
+                        continue
+                    try:
+                        index_attachment(form_data, field_id, file_path)
+                        counts['indexed'] += 1
+                    except OSError as e:
+                        self.stderr.write(f"Failed to index {file_path}: {e}")
+                        counts['failed'] += 1
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Attachments {'to index' if options['dry_run'] else 'indexed'}: {counts['indexed']}, "
+            f"already indexed: {counts['skipped']}, failed: {counts['failed']}"
+        ))
+    
+    def _files(self, form_data: FormData):
+        upload_dir = UPLOAD_ROOT / str(form_data.form_id) / str(form_data.id)
+        if not upload_dir.is_dir():
+            return
+        for field_dir in upload_dir.iterdir():
+            if not field_dir.is_dir():
+                continue
+            for file_path in field_dir.iterdir():
+                if file_path.is_file():
+                    yield field_dir.name, file_path
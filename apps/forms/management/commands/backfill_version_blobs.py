@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.forms.blobs import content_hash, store_blob
+from apps.forms.display_format import sparse_display_json
+from apps.forms.models import FormDisplayVersion, FormEntryVersion
+
+
+class Command(BaseCommand):
+    help = 'Move inline version JSON into content-addressed version blobs'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--dry-run', action='store_true', help='Report what would move without writing')
+    
+    def handle(self, *args, **options):
+        display_count = self._backfill(
+            FormDisplayVersion, 'inline_display_json', sparse_display_json, options
+        )
+        entry_count = self._backfill(
+            FormEntryVersion, 'inline_entry_json', lambda content: content, options
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Display versions: {display_count}, entry versions: {entry_count}"
+        ))
+    
+    def _backfill(self, model, inline_field: str, canonicalize, options) -> int:
+        count = 0
+        pending = model.objects.filter(blob__isnull=True, delta_base__isnull=True).values_list('id', flat=True).order_by('id')
+        ids = list(pending)
+        
+        for start in range(0, len(ids), options['batch_size']):
+            batch = ids[start:start + options['batch_size']]
+            with transaction.atomic():
+                for version in model.objects.filter(id__in=batch).select_for_update():
+                    content = canonicalize(getattr(version, inline_field))
+                    count += 1
+                    if options['dry_run']:
+                        continue
+                    
+                    digest = content_hash(content)
+                    version.blob = store_blob(content, digest)
+                    version.content_hash = digest
+                    setattr(version, inline_field, None)
+                    version.save(update_fields=['blob', 'content_hash', inline_field])
+        
+        return count
@@ -0,0 +1,67 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from apps.forms.models import Form, FormDisplayVersion, FormEntryVersion, VersionBlob
+from apps.forms.deltas import apply_patch
+from apps.forms.versions import full_content, materialize, store_as_delta, version_number
+
+
+class Command(BaseCommand):
+    help = 'Store older form versions as patches against the next version and drop unreferenced blobs'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--form-id', type=int, action='append', dest='form_ids', help='Only compact these forms (repeatable)')
+        parser.add_argument('--skip-prune', action='store_true', help='Keep version blobs that are no longer referenced')
+        parser.add_argument('--dry-run', action='store_true', help='Only count unreferenced blobs; change nothing')
+    
+    def handle(self, *args, **options):
+        forms = Form.objects.order_by('id')
+        if options['form_ids']:
+            forms = forms.filter(id__in=options['form_ids'])
+        
+        if not options['dry_run']:
+            converted = 0
+            for form_id in forms.values_list('id', flat=True):
+                for model in (FormDisplayVersion, FormEntryVersion):
+                    with transaction.atomic():
+                        converted += self._compact(model, form_id)
+            self.stdout.write(f"Versions stored as patches: {converted}")
+        
+        if not options['skip_prune']:
+            # Skip recent blobs: a running import may have just looked one up to reference it
+            unreferenced = VersionBlob.objects.filter(
+                entry_versions__isnull=True,
+                display_versions__isnull=True,
+                created_at__lt=timezone.now() - timedelta(hours=1)
+            )
+            count = unreferenced.count()
+            if not options['dry_run']:
+                unreferenced.delete()
+            self.stdout.write(f"Unreferenced blobs {'to prune' if options['dry_run'] else 'pruned'}: {count}")
+    
+    def _compact(self, model, form_id: int) -> int:
+        versions = sorted(
+            model.objects.filter(form_id=form_id).select_for_update(),
+            key=lambda version: (version_number(version), version.id)
+        )
+        if len(versions) < 2:
+            return 0
+        
+        converted = 0
+        # Walk back from the latest version, rebuilding each one from the version after it
+        base = versions[-1]
+        base_content = materialize(base)
+        for version in reversed(versions[:-1]):
+            if not version.delta_base_id:
+                content = full_content(version)
+            elif version.delta_base_id == base.id:
+                content = apply_patch(base_content, version.delta)
+            else:
+                content = materialize(version)
+            
+            if store_as_delta(version, base, base_content):
+                converted += 1
+            base, base_content = version, content
+        
+        return converted
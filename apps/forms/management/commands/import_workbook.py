@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.forms.jobs import grant_form_admin
+from apps.forms.models import Form
+from apps.forms.services import SharePointService
+from apps.forms.sources import LocalWorkbookSource
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Create or update a form from an xlsx file under WORKBOOK_LOCAL_DIR'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Workbook path, relative to WORKBOOK_LOCAL_DIR')
+        parser.add_argument('--username', required=True, help='User recorded as creator/updater')
+        parser.add_argument('--form-name', help='Create a new form with this name')
+        parser.add_argument('--form-id', type=int, help='Import a new version of this form')
+        parser.add_argument('--all-forms', action='store_true', help='Create or update a form for every display/entry sheet pair')
+        parser.add_argument('--force', action='store_true', help='Import even if the file has not changed')
+    
+    def handle(self, *args, **options):
+        if [bool(options['form_name']), bool(options['form_id']), options['all_forms']].count(True) != 1:
+            raise CommandError('Pass exactly one of --form-name, --form-id or --all-forms')
+        
+        try:
+            user = User.objects.get(username=options['username'])
+            source = LocalWorkbookSource(options['path'])
+            service = SharePointService()
+            
+            if options['all_forms']:
+                result = service.import_workbook_forms(
+                    source, created_by=user, updated_by=user, force=options['force'],
+                    on_created=lambda form_id: grant_form_admin(user, form_id)
+                )
+            elif options['form_name']:
+                result = service.create_form_from_source(
+                    source, options['form_name'], created_by=user, updated_by=user,
+                    on_created=lambda form_id: grant_form_admin(user, form_id)
+                )
+            else:
+                result = service.update_form_from_source(
+                    Form.objects.get(id=options['form_id']), source, updated_by=user, force=options['force']
+                )
+        except (User.DoesNotExist, Form.DoesNotExist) as e:
+            raise CommandError(str(e))
+        except Exception as e:
+            raise CommandError(f"Failed to import workbook: {e}")
+        
+        for form_result in result.get('forms', [result]):
+            self.stdout.write(self.style.SUCCESS(
+                f"Form {form_result['form_id']} ({form_result['form_name']}): {form_result.get('outcome', 'created')}"
+            ))
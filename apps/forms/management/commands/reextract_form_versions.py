@@ -0,0 +1,114 @@
+import os
+from collections import defaultdict
+from concurrent.futures import as_completed
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.forms.blobs import content_hash
+from apps.forms.display_format import sparse_display_json
+from apps.forms.models import FormDisplayVersion, FormEntryVersion
+from apps.forms.parsing import create_parser_executor, parse_workbook_forms
+from apps.forms.snapshots import snapshot_path
+from apps.forms.versions import materialize, replace_content, version_number
+
+
+# Key of each version model's content in an extracted form
+EXTRACTED_KEYS = {
+    FormDisplayVersion: 'display',
+    FormEntryVersion: 'entry',
+}
+
+
+class Command(BaseCommand):
+    help = 'Re-run the current extractor on the stored workbook snapshots of form versions and update changed versions'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--form-id', type=int, action='append', dest='form_ids', help='Only re-extract these forms (repeatable)')
+        parser.add_argument('--latest-only', action='store_true', help='Only re-extract the latest display and entry version of each form')
+        parser.add_argument('--workers', type=int, default=None, help='Parser processes (default WORKBOOK_PARSE_WORKERS; 0 parses in this process)')
+        parser.add_argument('--dry-run', action='store_true', help='Only count versions whose content would change')
+    
+    def handle(self, *args, **options):
+        workers = settings.WORKBOOK_PARSE_WORKERS if options['workers'] is None else options['workers']
+        
+        # Versions imported from the same workbook share a snapshot, which is parsed once for all their forms
+        by_snapshot = defaultdict(list)
+        for model in EXTRACTED_KEYS:
+            for version in self._versions(model, options):
+                by_snapshot[version.snapshot.content_hash].append(version)
+        
+        counts = {'changed': 0, 'unchanged': 0, 'missing': 0, 'failed': 0}
+        pending = {}
+        for snapshot_hash, versions in by_snapshot.items():
+            path = snapshot_path(snapshot_hash)
+            if os.path.exists(path):
+                pending[path] = versions
+            else:
+                self.stderr.write(f"Snapshot {snapshot_hash} is missing from {settings.WORKBOOK_SNAPSHOT_DIR}")
+                counts['missing'] += len(versions)
+        
+        if workers <= 0:
+            for path, versions in pending.items():
+                self._update(versions, lambda: parse_workbook_forms(path, _sheet_keys(versions)), counts, options)
+        else:
+            with create_parser_executor(workers) as executor:
+                futures = {
+                    executor.submit(parse_workbook_forms, path, _sheet_keys(versions)): versions
+                    for path, versions in pending.items()
+                }
+                for future in as_completed(futures):
+                    self._update(futures[future], future.result, counts, options)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Versions {'to change' if options['dry_run'] else 'changed'}: {counts['changed']}, "
+            f"unchanged: {counts['unchanged']}, missing snapshot: {counts['missing']}, failed: {counts['failed']}"
+        ))
+    
+    def _versions(self, model, options) -> list:
+        versions = model.objects.filter(snapshot__isnull=False).select_related('snapshot', 'form').only(
+            'id', 'form_id', 'form_version', 'version_number', 'content_hash', 'snapshot__content_hash', 'form__sheet_key'
+        )
+        if options['form_ids']:
+            versions = versions.filter(form_id__in=options['form_ids'])
+        if not options['latest_only']:
+            return list(versions)
+        
+        latest = {}
+        for version in versions:
+            current = latest.get(version.form_id)
+            if current is None or version_number(version) > version_number(current):
+                latest[version.form_id] = version
+        return list(latest.values())
+    
+    def _update(self, versions: list, extract, counts: dict, options):
+        try:
+            workbooks = extract()
+        except Exception as e:
+            self.stderr.write(f"Failed to re-extract versions {[version.id for version in versions]}: {e}")
+            counts['failed'] += len(versions)
+            return
+        
+        for version in versions:
+            model = type(version)
+            content = workbooks[version.form.sheet_key][EXTRACTED_KEYS[model]]
+            digest = content_hash(content)
+            with transaction.atomic():
+                version = model.objects.select_for_update().get(id=version.id)
+                if digest == _current_hash(version):
+                    counts['unchanged'] += 1
+                    continue
+                counts['changed'] += 1
+                if not options['dry_run']:
+                    replace_content(version, content, digest)
+
+
+def _sheet_keys(versions: list) -> list:
+    return list({version.form.sheet_key for version in versions})
+
+
+def _current_hash(version) -> str:
+    if version.content_hash:
+        return version.content_hash
+    # Rows from before content hashes were stored
+    content = materialize(version)
+    return content_hash(sparse_display_json(content) if isinstance(version, FormDisplayVersion) else content)
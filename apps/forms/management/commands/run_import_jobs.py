@@ -0,0 +1,33 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from apps.forms.jobs import ImportJobRunner
+
+
+class Command(BaseCommand):
+    help = 'Process queued SharePoint import jobs (for IMPORT_JOB_MODE=worker)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the jobs that are due and exit')
+        parser.add_argument('--poll-interval', type=float, default=settings.IMPORT_JOB_POLL_INTERVAL)
+    
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            requeued = ImportJobRunner.recover_stale_jobs()
+            if requeued:
+                self.stdout.write(f"Requeued stale jobs: {', '.join(str(job_id) for job_id in requeued)}")
+            
+            processed = 0
+            job = ImportJobRunner.claim()
+            while job is not None:
+                ImportJobRunner.run_job(job)
+                processed += 1
+                job = ImportJobRunner.claim()
+            
+            if processed:
+                self.stdout.write(f"Processed {processed} job(s)")
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,52 @@
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.forms.models import Form, GraphSubscription
+from apps.forms.services import SharePointService
+
+
+class Command(BaseCommand):
+    help = 'Post a Graph-style change notification to the notification endpoint, e.g. of a local runserver'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--form-id', type=int, help='Notify the subscription covering this form\'s workbook')
+        parser.add_argument('--subscription-id', help='Notify this subscription')
+        parser.add_argument('--url', default=settings.GRAPH_NOTIFICATION_URL, help='Endpoint (default GRAPH_NOTIFICATION_URL)')
+        parser.add_argument('--client-state', help='Send this clientState instead of the stored one')
+        parser.add_argument('--validate', action='store_true', help='Send the validation request Graph makes when subscribing')
+    
+    def handle(self, *args, **options):
+        if not options['url']:
+            raise CommandError('Pass --url or set GRAPH_NOTIFICATION_URL')
+        
+        if options['validate']:
+            response = requests.post(options['url'], params={'validationToken': 'validation-check'}, timeout=10)
+            if response.status_code != 200 or response.text != 'validation-check':
+                raise CommandError(f"Validation failed: {response.status_code} {response.text}")
+            self.stdout.write(self.style.SUCCESS('Endpoint echoed the validation token'))
+            return
+        
+        subscription = self._subscription(options)
+        response = requests.post(options['url'], json={'value': [{
+            'subscriptionId': subscription.subscription_id,
+            'clientState': options['client_state'] or subscription.client_state,
+            'changeType': 'updated',
+            'resource': f"drives/{subscription.drive_id}/root",
+            'subscriptionExpirationDateTime': subscription.expires_at.isoformat()
+        }]}, timeout=10)
+        
+        if response.status_code != 202:
+            raise CommandError(f"Notification rejected: {response.status_code} {response.text}")
+        self.stdout.write(self.style.SUCCESS(f"Notification accepted: {response.text}"))
+    
+    def _subscription(self, options) -> GraphSubscription:
+        try:
+            if options['subscription_id']:
+                return GraphSubscription.objects.get(subscription_id=options['subscription_id'])
+            if options['form_id']:
+                form = Form.objects.get(id=options['form_id'], source='sharepoint')
+                site_id, _ = SharePointService()._parse_sharepoint_url(form.url)
+                return GraphSubscription.objects.get(site_id=site_id)
+        except (Form.DoesNotExist, GraphSubscription.DoesNotExist) as e:
+            raise CommandError(str(e))
+        raise CommandError('Pass --form-id or --subscription-id')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.forms.subscriptions import GraphSubscriptionManager
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Subscribe to Graph change notifications for every site with SharePoint forms; renew or drop existing subscriptions'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='User recorded as creator of the import jobs notifications queue')
+        parser.add_argument('--dry-run', action='store_true', help='Only count subscriptions to create, renew or delete')
+    
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist")
+        
+        counts = GraphSubscriptionManager().sync_subscriptions(user, dry_run=options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Subscriptions created: {counts['created']}, renewed: {counts['renewed']}, "
+            f"deleted: {counts['deleted']}, failed: {counts['failed']}"
+        ))
@@ -0,0 +1,201 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from apps.forms.graph import GraphClient
+from apps.forms.models import Form
+from apps.forms.services import SAVING_PROGRESS, SharePointService
+from apps.users.models import User
+
+
+class SyncTimeout(Exception):
+    """A form sync ran past its deadline"""
+
+
+class SyncDeadline:
+    """Deadline of one form's sync, checked by its worker at progress reports and enforced by the command.
+    
+    Once the worker reports it is saving, the command waits for it instead
+    of giving up; once the command has given up, the worker stops at its
+    next report, before saving anything.
+    """
+    
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        # Set when the worker picks the form up; queued forms have not started their allowance
+        self.at = None
+        self.lock = threading.Lock()
+        self.abandoned = False
+        self.saving = False
+    
+    def start(self):
+        self.at = time.monotonic() + self.seconds
+    
+    def check(self, percent: int, message: str):
+        with self.lock:
+            if self.abandoned or time.monotonic() > self.at:
+                self.abandoned = True
+                raise SyncTimeout(message)
+            if percent >= SAVING_PROGRESS:
+                self.saving = True
+    
+    def abandon(self) -> bool:
+        """Give up on the form unless it is already saving"""
+        with self.lock:
+            if not self.saving:
+                self.abandoned = True
+            return self.abandoned
+
+
+class Command(BaseCommand):
+    help = 'Re-import every SharePoint-sourced form, skipping workbooks that have not changed'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.SHAREPOINT_SYNC_WORKERS)
+        parser.add_argument('--timeout', type=float, default=settings.SHAREPOINT_SYNC_TIMEOUT, help='Seconds allowed per form')
+        parser.add_argument('--form-id', type=int, action='append', dest='form_ids', help='Only sync these forms (repeatable)')
+        parser.add_argument('--force', action='store_true', help='Re-import even if the workbook eTag/cTag is unchanged')
+        parser.add_argument('--username', help='User recorded as updated_by (defaults to each form\'s last editor)')
+        parser.add_argument('--state-file', default=settings.SHAREPOINT_SYNC_STATE_FILE, help='Progress file used by --resume')
+        parser.add_argument('--resume', action='store_true', help='Skip forms that finished in the previous run')
+    
+    def handle(self, *args, **options):
+        user = None
+        if options['username']:
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['username']} does not exist")
+        
+        forms = Form.objects.filter(source='sharepoint').exclude(url__isnull=True).exclude(url='').select_related('created_by', 'updated_by').order_by('id')
+        if options['form_ids']:
+            forms = forms.filter(id__in=options['form_ids'])
+        
+        state_file = options['state_file']
+        state = self._load_state(state_file) if options['resume'] else {'completed': {}, 'failed': {}}
+        state['failed'] = {}
+        todo = [form for form in forms if str(form.id) not in state['completed']]
+        skipped = len(forms) - len(todo)
+        
+        self.stdout.write(f"Syncing {len(todo)} form(s) with {options['workers']} worker(s)" + (f", {skipped} already done" if skipped else ""))
+        
+        started = time.monotonic()
+        # No single Graph call may outlast a form's whole allowance
+        service = SharePointService(GraphClient(timeout=(
+            min(settings.GRAPH_CONNECT_TIMEOUT, options['timeout']), min(settings.GRAPH_READ_TIMEOUT, options['timeout'])
+        )))
+        # One round of Graph batches fetches every workbook's version up front
+        sources = service.get_form_sources(todo)
+        state_lock = threading.Lock()
+        outcomes = {}
+        
+        def record(form_id: int, outcome: str, error: str = None):
+            with state_lock:
+                outcomes[form_id] = outcome
+                if error is None:
+                    state['completed'][str(form_id)] = outcome
+                else:
+                    state['failed'][str(form_id)] = error
+                self._save_state(state_file, state)
+        
+        executor = ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='form-sync')
+        try:
+            running = {}
+            deadlines = {}
+            for form in todo:
+                deadline = SyncDeadline(options['timeout'])
+                future = executor.submit(self._sync_form, service, form, sources[form.id], user or form.updated_by or form.created_by, deadline, options)
+                running[future] = form
+                deadlines[future] = deadline
+            
+            while running:
+                done, _ = wait(running, timeout=1, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    form = running.pop(future)
+                    deadlines.pop(future)
+                    try:
+                        result = future.result()
+                    except SyncTimeout:
+                        record(form.id, 'timeout', f"Timed out after {options['timeout']}s")
+                        self.stderr.write(f"Form {form.id} ({form.form_name}): timed out")
+                    except Exception as e:
+                        record(form.id, 'failed', str(e))
+                        self.stderr.write(f"Form {form.id} ({form.form_name}): {e}")
+                    else:
+                        record(form.id, result['outcome'])
+                        self.stdout.write(f"Form {form.id} ({form.form_name}): {result['outcome']}")
+                
+                # A form stuck past its deadline (e.g. in a long parse) is reported as timed out;
+                # its thread stops at the next progress report and saves nothing
+                for future, form in list(running.items()):
+                    deadline = deadlines[future]
+                    if deadline.at is not None and time.monotonic() > deadline.at + 1 and deadline.abandon():
+                        running.pop(future)
+                        deadlines.pop(future)
+                        record(form.id, 'timeout', f"Timed out after {options['timeout']}s")
+                        self.stderr.write(f"Form {form.id} ({form.form_name}): timed out")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        self._print_summary(outcomes, skipped, time.monotonic() - started)
+        if state['failed']:
+            self.stdout.write(f"Re-run with --resume to retry the {len(state['failed'])} failed form(s)")
+    
+    def _sync_form(self, service: SharePointService, form: Form, source, user, deadline: SyncDeadline, options) -> dict:
+        deadline.start()
+        if isinstance(source, Exception):
+            raise source
+        
+        try:
+            # The service reports progress between steps; it stops there once the deadline has passed
+            return service.update_form_from_source(
+                form,
+                source,
+                updated_by=user,
+                progress=deadline.check,
+                force=options['force']
+            )
+        except SyncTimeout:
+            raise
+        except Exception as e:
+            # E.g. a Graph call cut short by the timeout
+            if time.monotonic() > deadline.at:
+                raise SyncTimeout(str(e)) from e
+            raise
+        finally:
+            connection.close()
+    
+    def _print_summary(self, outcomes: dict, skipped: int, elapsed: float):
+        counts = {}
+        for outcome in outcomes.values():
+            counts[outcome] = counts.get(outcome, 0) + 1
+        
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f"Finished in {elapsed:.1f}s"))
+        self.stdout.write(f"  changed:      {counts.get('updated', 0)}")
+        self.stdout.write(f"  unchanged:    {counts.get('unchanged', 0) + counts.get('not_modified', 0)} ({counts.get('not_modified', 0)} not downloaded)")
+        self.stdout.write(f"  failed:       {counts.get('failed', 0)}")
+        self.stdout.write(f"  timed out:    {counts.get('timeout', 0)}")
+        if skipped:
+            self.stdout.write(f"  skipped:      {skipped} (done in a previous run)")
+    
+    def _load_state(self, path: str) -> dict:
+        if not os.path.exists(path):
+            return {'completed': {}, 'failed': {}}
+        with open(path) as f:
+            return json.load(f)
+    
+    def _save_state(self, path: str, state: dict):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # mkstemp picks an unpredictable name readable by this user only
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
@@ -8,8 +8,19 @@ class Form(models.Model):
     form_name = models.CharField(max_length=255)
     source = models.CharField(max_length=255, null=True, blank=True)
     url = models.URLField(null=True, blank=True)
+    source_path = models.CharField(max_length=1000, null=True, blank=True)
+    # Display/entry sheet pair of a multi-form workbook this form was imported from; null when it is the only form
+    sheet_key = models.CharField(max_length=255, null=True, blank=True)
     custom_scripts = models.JSONField(default=list, blank=True)
     observation_count = models.IntegerField(default=0)
+    source_etag = models.CharField(max_length=255, null=True, blank=True)
+    source_ctag = models.CharField(max_length=255, null=True, blank=True)
+    source_size = models.BigIntegerField(null=True, blank=True)
+    # Graph drive item ID, to match change notifications to forms
+    source_item_id = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    # Latest versions, kept up to date by imports so reads need no sort over all versions
+    current_entry_version = models.ForeignKey('FormEntryVersion', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_column='current_entry_vid')
+    current_display_version = models.ForeignKey('FormDisplayVersion', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_column='current_display_vid')
     created_by = models.ForeignKey(User, on_delete=models.RESTRICT, related_name='created_forms', db_column='created_by')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_by = models.ForeignKey(User, on_delete=models.RESTRICT, related_name='updated_forms', null=True, blank=True, db_column='updated_by')
@@ -50,8 +61,20 @@ class UserFormAccess(models.Model):
 class FormEntryVersion(models.Model):
     id = models.AutoField(primary_key=True)
     form = models.ForeignKey(Form, on_delete=models.CASCADE, db_column='form_id')
-    form_entry_json = models.JSONField()
+    # Rows written before version blobs keep their JSON inline
+    inline_entry_json = models.JSONField(null=True, blank=True, db_column='form_entry_json')
+    blob = models.ForeignKey('VersionBlob', on_delete=models.PROTECT, null=True, blank=True, related_name='entry_versions', db_column='blob_id')
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # Older versions are stored as a patch that rebuilds them from the version after them
+    delta = models.JSONField(null=True, blank=True)
+    delta_base = models.ForeignKey('self', on_delete=models.RESTRICT, null=True, blank=True, related_name='+', db_column='delta_base_id')
+    # The xlsx file this version was extracted from
+    snapshot = models.ForeignKey('WorkbookSnapshot', on_delete=models.SET_NULL, null=True, blank=True, related_name='entry_versions', db_column='snapshot_id')
+    # Kind of source the workbook came from (sharepoint, upload, local); a form keeps its own source when a workbook is uploaded to it
+    source = models.CharField(max_length=255, null=True, blank=True)
     form_version = models.CharField(max_length=50)
+    # form_version as a number, for ordering
+    version_number = models.IntegerField(null=True, blank=True)
     approved = models.BooleanField(default=False)
     created_by = models.ForeignKey(User, on_delete=models.RESTRICT, related_name='created_entry_versions', db_column='created_by')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -60,13 +83,33 @@ class FormEntryVersion(models.Model):
 
     class Meta:
         db_table = 'form_entry_versions'
+        indexes = [models.Index(fields=['form', 'version_number'])]
+
+    @property
+    def form_entry_json(self):
+        if self.delta_base_id:
+            from .versions import materialize
+            return materialize(self)
+        return self.blob.content if self.blob_id else self.inline_entry_json
 
 
 class FormDisplayVersion(models.Model):
     id = models.AutoField(primary_key=True)
     form = models.ForeignKey(Form, on_delete=models.CASCADE, db_column='form_id')
-    form_display_json = models.JSONField()
+    # Rows written before version blobs keep their JSON inline
+    inline_display_json = models.JSONField(null=True, blank=True, db_column='form_display_json')
+    blob = models.ForeignKey('VersionBlob', on_delete=models.PROTECT, null=True, blank=True, related_name='display_versions', db_column='blob_id')
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # Older versions are stored as a patch that rebuilds them from the version after them
+    delta = models.JSONField(null=True, blank=True)
+    delta_base = models.ForeignKey('self', on_delete=models.RESTRICT, null=True, blank=True, related_name='+', db_column='delta_base_id')
+    # The xlsx file this version was extracted from
+    snapshot = models.ForeignKey('WorkbookSnapshot', on_delete=models.SET_NULL, null=True, blank=True, related_name='display_versions', db_column='snapshot_id')
+    # Kind of source the workbook came from (sharepoint, upload, local); a form keeps its own source when a workbook is uploaded to it
+    source = models.CharField(max_length=255, null=True, blank=True)
     form_version = models.CharField(max_length=50)
+    # form_version as a number, for ordering
+    version_number = models.IntegerField(null=True, blank=True)
     approved = models.BooleanField(default=False)
     created_by = models.ForeignKey(User, on_delete=models.RESTRICT, related_name='created_display_versions', db_column='created_by')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -75,6 +118,14 @@ class FormDisplayVersion(models.Model):
 
     class Meta:
         db_table = 'form_display_versions'
+        indexes = [models.Index(fields=['form', 'version_number'])]
+
+    @property
+    def form_display_json(self):
+        if self.delta_base_id:
+            from .versions import materialize
+            return materialize(self)
+        return self.blob.content if self.blob_id else self.inline_display_json
 
 
 class FormData(models.Model):
@@ -95,6 +146,22 @@ class FormData(models.Model):
         unique_together = ('form_data_entry', 'observation_number')
 
 
+class Attachment(models.Model):
+    id = models.AutoField(primary_key=True)
+    form_data = models.ForeignKey(FormData, on_delete=models.CASCADE, related_name='attachments', db_column='form_data_id')
+    field_id = models.CharField(max_length=255)
+    # Relative to the working directory, as returned to clients, e.g. userUploads/<form>/<entry>/<field>/<file>
+    path = models.CharField(max_length=1000)
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=255)
+    content_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'attachments'
+        unique_together = ('form_data', 'path')
+
+
 class FormDataHistory(models.Model):
     id = models.AutoField(primary_key=True)
     form_data_entry = models.ForeignKey(FormDataEntry, on_delete=models.CASCADE, db_column='form_data_entry_id')
@@ -110,4 +177,121 @@ class FormDataHistory(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        db_table = 'form_data_history'
\ No newline at end of file
+        db_table = 'form_data_history'
+
+
+class VersionBlob(models.Model):
+    id = models.AutoField(primary_key=True)
+    content_hash = models.CharField(max_length=64, unique=True)
+    content = models.JSONField()
+    size = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'version_blobs'
+
+
+class WorkbookSnapshot(models.Model):
+    id = models.AutoField(primary_key=True)
+    content_hash = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'workbook_snapshots'
+
+
+class FormImportLock(models.Model):
+    """Lease on importing a form; the last finished import's result is kept for callers that waited on it"""
+    form = models.OneToOneField(Form, on_delete=models.CASCADE, primary_key=True, related_name='import_lock', db_column='form_id')
+    token = models.CharField(max_length=32, null=True, blank=True)
+    acquired_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'form_import_locks'
+
+
+class WorkbookImportLock(models.Model):
+    """Lease on importing a workbook's sheet pairs, keyed by a hash of its URL or path"""
+    key = models.CharField(max_length=64, primary_key=True)
+    token = models.CharField(max_length=32, null=True, blank=True)
+    acquired_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'workbook_import_locks'
+
+
+class GraphSubscription(models.Model):
+    """Graph change-notification subscription on the document library of a site with SharePoint forms"""
+    id = models.AutoField(primary_key=True)
+    subscription_id = models.CharField(max_length=255, unique=True)
+    site_id = models.CharField(max_length=255, unique=True)
+    drive_id = models.CharField(max_length=255)
+    client_state = models.CharField(max_length=128)
+    expires_at = models.DateTimeField()
+    # Where the next delta query of the drive starts
+    delta_link = models.TextField(null=True, blank=True)
+    notified_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.RESTRICT, related_name='created_graph_subscriptions', db_column='created_by')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'graph_subscriptions'
+
+
+class SharePointResolution(models.Model):
+    id = models.AutoField(primary_key=True)
+    kind = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    value = models.CharField(max_length=1000)
+    hits = models.IntegerField(default=0)
+    expires_at = models.DateTimeField()
+    last_used_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'sharepoint_resolutions'
+        unique_together = ('kind', 'key')
+        indexes = [models.Index(fields=['last_used_at'])]
+
+
+class ImportJob(models.Model):
+    CREATE = 'create'
+    UPDATE = 'update'
+    WORKBOOK = 'workbook'
+    CHANGES = 'changes'
+    UPLOAD = 'upload'
+    KIND_CHOICES = [(CREATE, 'Create'), (UPDATE, 'Update'), (WORKBOOK, 'Workbook'), (CHANGES, 'Changes'), (UPLOAD, 'Upload')]
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    id = models.AutoField(primary_key=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    form = models.ForeignKey(Form, on_delete=models.CASCADE, null=True, blank=True, db_column='form_id')
+    params = models.JSONField(default=dict)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    progress = models.IntegerField(default=0)
+    progress_message = models.CharField(max_length=255, blank=True, default='')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    available_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.RESTRICT, related_name='created_import_jobs', db_column='created_by')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'import_jobs'
+        indexes = [models.Index(fields=['status', 'available_at'])]
@@ -0,0 +1,116 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List
+from django.conf import settings
+from .sources import WorkbookSourceError
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; children then run without a memory cap
+    resource = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class WorkbookParserPool:
+    """Bounded pool of child processes that extract form workbooks.
+    
+    Parsing is pure-Python CPU work; in a child it neither holds the GIL of
+    the API process nor competes with its requests, and several workbooks can
+    be parsed on several cores. Children are spawned (not forked) with their
+    address space capped at WORKBOOK_PARSE_MEMORY_LIMIT and are replaced after
+    WORKBOOK_PARSE_MAX_TASKS_PER_CHILD workbooks. Nothing in this module may
+    import models at load time: children import it before Django is set up.
+    """
+    
+    _executor = None
+    _lock = threading.Lock()
+    
+    @classmethod
+    def parse(cls, path: str, fallback: Callable[[], Dict], sheet_keys: List[str] = None) -> Dict:
+        """Extract the forms of a workbook file in a child process, or with `fallback` in this one if no pool can be started.
+        
+        A child that dies while parsing fails the workbook rather than falling
+        back: it most likely hit the memory cap, which the fallback would not have.
+        """
+        try:
+            future = cls._submit(path, sheet_keys)
+        except OSError as e:
+            logger.warning("workbook parser pool cannot be started, parsing in-process: %s", e)
+            cls._reset()
+            return fallback()
+        
+        try:
+            return future.result()
+        except MemoryError:
+            raise WorkbookSourceError(
+                f"Workbook is too large to parse within WORKBOOK_PARSE_MEMORY_LIMIT ({settings.WORKBOOK_PARSE_MEMORY_LIMIT} bytes)"
+            )
+        except BrokenProcessPool:
+            cls._reset()
+            raise WorkbookSourceError(
+                f"Workbook parser process died, most likely beyond WORKBOOK_PARSE_MEMORY_LIMIT ({settings.WORKBOOK_PARSE_MEMORY_LIMIT} bytes)"
+            )
+    
+    @classmethod
+    def _submit(cls, path: str, sheet_keys: List[str] = None):
+        try:
+            return cls._get_executor().submit(parse_workbook_forms, path, sheet_keys)
+        except BrokenProcessPool:
+            # Broken by an earlier workbook; this one gets a fresh pool
+            cls._reset()
+            return cls._get_executor().submit(parse_workbook_forms, path, sheet_keys)
+    
+    @classmethod
+    def _get_executor(cls) -> ProcessPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = create_parser_executor(settings.WORKBOOK_PARSE_WORKERS)
+            return cls._executor
+    
+    @classmethod
+    def _reset(cls):
+        # A child died (e.g. killed by the OOM killer) or the pool failed to start; start a fresh pool next time
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=False, cancel_futures=True)
+                cls._executor = None
+
+
+def create_parser_executor(max_workers: int) -> ProcessPoolExecutor:
+    """A process pool for `parse_form_workbook`, with the same memory cap and child recycling as the shared pool"""
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(settings.WORKBOOK_PARSE_MEMORY_LIMIT,),
+        max_tasks_per_child=settings.WORKBOOK_PARSE_MAX_TASKS_PER_CHILD or None
+    )
+
+
+def parse_form_workbook(path: str, sheet_key: str = None) -> Dict:
+    """Select and extract the display and entry sheets of the workbook file at `path`"""
+    return parse_workbook_forms(path, [sheet_key])[sheet_key]
+
+
+def parse_workbook_forms(path: str, sheet_keys: List[str] = None) -> Dict:
+    """Extract the forms of the workbook file at `path`, keyed by sheet key (see WorkbookImportSession.extract_forms)"""
+    from .services import SharePointService, WorkbookImportSession
+    from .sources import LocalWorkbookSource
+    
+    source = LocalWorkbookSource(os.path.basename(path), root=os.path.dirname(path))
+    with WorkbookImportSession(SharePointService(), source) as session:
+        return session.extract_forms(sheet_keys)
+
+
+def _init_worker(memory_limit: int):
+    if memory_limit and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    
+    import django
+    django.setup()
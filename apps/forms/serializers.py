@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Form
+from .models import Form, ImportJob
 
 
 class SharePointMetadataSerializer(serializers.Serializer):
@@ -9,5 +9,19 @@ class SharePointMetadataSerializer(serializers.Serializer):
 class FormSerializer(serializers.ModelSerializer):
     class Meta:
         model = Form
-        fields = '__all__'
-        read_only_fields = ('id', 'created_at', 'updated_at')
\ No newline at end of file
+        # Import bookkeeping (source_* fields, sheet_key, current-version pointers) stays internal
+        fields = [
+            'id', 'form_name', 'source', 'url', 'custom_scripts', 'observation_count',
+            'created_by', 'created_at', 'updated_by', 'updated_at'
+        ]
+        read_only_fields = ('id', 'created_at', 'updated_at')
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'kind', 'status', 'form', 'result', 'error', 'progress', 'progress_message',
+            'attempts', 'max_attempts', 'available_at', 'started_at', 'finished_at', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
@@ -1,102 +1,413 @@
-import requests
-from msal import ConfidentialClientApplication
-from typing import Dict, List, Any
-from decouple import config
+from typing import Callable, Dict, List, Any
+from django.conf import settings
 from django.db import transaction
 from .models import Form, FormDisplayVersion, FormEntryVersion
-# import concurrent.futures  # No longer needed - was used for Graph API batch processing
+from .blobs import content_hash
+from .cache import ResolutionCache
+from .graph import GraphClient
+from .locks import single_flight, single_flight_all, single_flight_workbook
+from .parsing import WorkbookParserPool
+from .sources import GraphWorkbookSource, LocalWorkbookSource, UploadedWorkbookSource, WorkbookSource, WorkbookSourceError
+from .styles import StyleResolver
+from .snapshots import store_snapshot
+from .versions import create_version, current_version, version_number
+from .xlsx_stream import MERGED, StreamedCell, StreamedWorkbook
+from .display_format import sparse_display_json, infer_data_type, merged_cell_placeholder, merged_column_letter
 from openpyxl import load_workbook
 from openpyxl.cell.cell import MergedCell
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import to_excel
 from io import BytesIO
+import datetime
+import hashlib
+import os
+import re
+import shutil
+import tempfile
 import zipfile
 import xml.etree.ElementTree as ET
 
 
+class GraphNotFoundError(Exception):
+    """Graph returned 404 for a resolved site or drive item"""
+
+
+# Progress an import reports right before its saving transaction; raising from
+# `progress` at this point or earlier stops the import without writing anything
+SAVING_PROGRESS = 90
+
+
+def _no_progress(percent: int, message: str):
+    pass
+
+
 class SharePointService:
-    def __init__(self):
-        self.client_app = ConfidentialClientApplication(
-            config('MICROSOFT_CLIENT_ID'),
-            authority=f"https://login.microsoftonline.com/{config('MICROSOFT_TENANT_ID')}",
-            client_credential=config('MICROSOFT_CLIENT_SECRET'),
-        )
-        self.token = None
+    def __init__(self, graph: GraphClient = None):
+        self.graph = graph or GraphClient()
+        self.resolution_cache = ResolutionCache()
     
     def get_access_token(self) -> str:
-        if not self.token:
-            result = self.client_app.acquire_token_for_client(
-                scopes=["https://graph.microsoft.com/.default"]
+        return self.graph.token_provider()
+    
+    def create_new_form(self, sharepoint_url: str, form_name: str, created_by: str, updated_by: str, custom_scripts: list = None, observation_count: int = 1, progress: Callable = None, on_created: Callable = None) -> Dict:
+        """Create new form from SharePoint URL"""
+        return self.create_form_from_source(
+            GraphWorkbookSource(self, sharepoint_url),
+            form_name,
+            created_by=created_by,
+            updated_by=updated_by,
+            custom_scripts=custom_scripts,
+            observation_count=observation_count,
+            progress=progress,
+            on_created=on_created
+        )
+    
+    def create_form_from_source(self, source: WorkbookSource, form_name: str, created_by: str, updated_by: str, custom_scripts: list = None, observation_count: int = 1, progress: Callable = None, on_created: Callable = None) -> Dict:
+        """Create new form from any workbook source.
+        
+        `on_created` is called with the new form's ID inside the transaction
+        that creates it, e.g. to grant access, so neither is saved without the other.
+        """
+        progress = progress or _no_progress
+        progress(5, 'Downloading workbook')
+        with WorkbookImportSession(self, source) as session:
+            # Parse outside the transaction so the DB is not held while the workbook is read
+            progress(30, 'Reading workbook')
+            workbook = session.read_form()
+            snapshot = store_snapshot(session.workbook_file)
+        
+        progress(SAVING_PROGRESS, 'Saving form')
+        with transaction.atomic():
+            return self._create_form(
+                source, session.version, workbook, snapshot, form_name, created_by, updated_by,
+                custom_scripts=custom_scripts, observation_count=observation_count, on_created=on_created
             )
-            if "access_token" in result:
-                self.token = result["access_token"]
+    
+    def update_existing_form(self, form_id: int, updated_by: str, progress: Callable = None, force: bool = False) -> Dict:
+        """Update existing form from the source it was imported from"""
+        form = Form.objects.get(id=form_id)
+        return self.update_form_from_source(form, self.get_form_source(form), updated_by, progress=progress, force=force)
+    
+    def get_form_source(self, form: Form) -> WorkbookSource:
+        if form.source == LocalWorkbookSource.source_name:
+            return LocalWorkbookSource(form.source_path)
+        if form.source == UploadedWorkbookSource.source_name and not form.url:
+            raise WorkbookSourceError("Form was imported from an uploaded workbook; upload a new workbook to update it")
+        return GraphWorkbookSource(self, form.url)
+    
+    def get_form_sources(self, forms: List[Form]) -> Dict:
+        """Sources for many forms, with SharePoint versions fetched in Graph batches.
+        
+        Maps each form ID to its source, or to the exception getting it failed with.
+        """
+        sources = {}
+        for form in forms:
+            try:
+                sources[form.id] = self.get_form_source(form)
+            except WorkbookSourceError as e:
+                sources[form.id] = e
+        
+        graph_sources = {form_id: source for form_id, source in sources.items() if isinstance(source, GraphWorkbookSource)}
+        resolved = self._resolve_drive_items([source.url for source in graph_sources.values()])
+        for form_id, source in graph_sources.items():
+            if isinstance(resolved[source.url], Exception):
+                sources[form_id] = resolved[source.url]
             else:
-                raise Exception(f"Failed to acquire token: {result.get('error_description')}")
-        return self.token
+                source.set_resolved(*resolved[source.url])
+        
+        return sources
     
-    def create_new_form(self, sharepoint_url: str, form_name: str, created_by: str, updated_by: str, custom_scripts: list = None, observation_count: int = 1) -> Dict:
-        """Create new form from SharePoint URL"""
-        worksheets = self.get_workbook_worksheets(sharepoint_url)
+    def update_form_from_source(self, form: Form, source: WorkbookSource, updated_by: str, progress: Callable = None, force: bool = False) -> Dict:
+        """Import a new version of a form, skipping the download if the source is unchanged.
         
-        display_sheet = None
-        entry_sheet = None
+        Imports of one form never overlap. A caller that arrives while the form's
+        own source is being imported waits and returns that import's result
+        instead of downloading and parsing the same workbook again.
+        """
+        progress = progress or _no_progress
+        # Forced imports and other files (uploads, another local path) must run themselves
+        share = not force and source.source_name == form.source and (source.url, source.path) == (form.url, form.source_path)
+        return single_flight(
+            form.id,
+            lambda: self._update_form(form, source, updated_by, progress, force),
+            share=share and not isinstance(source, UploadedWorkbookSource),
+            on_wait=lambda: progress(2, 'Waiting for the running import of this form')
+        )
+    
+    def _update_form(self, form: Form, source: WorkbookSource, updated_by: str, progress: Callable, force: bool) -> Dict:
+        # The import that held the lock before may have just recorded a new source version
+        form.refresh_from_db()
         
-        for worksheet in worksheets:
-            name = worksheet['name'].lower()
-            if 'display' in name:
-                display_sheet = worksheet
-            elif 'entry' in name:
-                entry_sheet = worksheet
+        progress(2, 'Checking workbook version')
+        if not force and self._is_unmodified(form, source.get_version()):
+            return self._not_modified_result(form)
         
-        if not display_sheet or not entry_sheet:
-            raise Exception("Both 'display' and 'entry' worksheets are required")
+        progress(5, 'Downloading workbook')
+        with WorkbookImportSession(self, source) as session:
+            progress(30, 'Reading workbook')
+            # Forms from a multi-form workbook are re-read from their own sheet pair
+            workbook = session.read_form(form.sheet_key)
+            changes = self._version_changes(form, workbook)
+            # Keep the workbook only when it produces a new version
+            snapshot = store_snapshot(session.workbook_file) if changes['display'] or changes['entry'] else None
         
+        progress(SAVING_PROGRESS, 'Saving versions')
         with transaction.atomic():
-            form = Form.objects.create(
-                form_name=form_name,
-                source='sharepoint',
-                url=sharepoint_url,
-                custom_scripts=custom_scripts or [],
-                observation_count=observation_count,
-                created_by=created_by,
-                updated_by=updated_by
+            return self._save_versions(form, source, session.version, workbook, changes, snapshot, updated_by)
+    
+    def import_workbook_forms(self, source: WorkbookSource, created_by: str, updated_by: str, form_names: Dict = None, custom_scripts: list = None, observation_count: int = 1, progress: Callable = None, force: bool = False, on_created: Callable = None) -> Dict:
+        """Create or update one form per display/entry sheet pair of a workbook, from one download and one parse.
+        
+        Pairs are matched by sheet name (see `_pair_form_sheets`); a pair that
+        was imported from this workbook before updates its form, any other pair
+        creates a form named after its display sheet unless `form_names` maps
+        its sheet key to a name. `on_created` is called with the ID of every
+        created form, as in `create_form_from_source`.
+        """
+        progress = progress or _no_progress
+        
+        def import_forms():
+            existing = [form.id for form in self._workbook_forms(source)]
+            return single_flight_all(
+                existing,
+                lambda: self._import_workbook_forms(source, created_by, updated_by, form_names, custom_scripts, observation_count, progress, force, on_created),
+                on_wait=lambda: progress(2, 'Waiting for running imports of these forms')
             )
-            
-            display_metadata = self.get_display_sheet_metadata(sharepoint_url, display_sheet['name'])
-            
-            FormDisplayVersion.objects.create(
-                form=form,
-                form_display_json=display_metadata,
-                form_version='1',
-                approved=False,
-                created_by=created_by,
-                updated_by=updated_by
+        
+        # Without the workbook's lock, imports of a new workbook would each create its forms
+        key = self._workbook_key(source)
+        if key is None:
+            return import_forms()
+        return single_flight_workbook(key, import_forms, on_wait=lambda: progress(2, 'Waiting for the running import of this workbook'))
+    
+    def _import_workbook_forms(self, source: WorkbookSource, created_by: str, updated_by: str, form_names: Dict, custom_scripts: list, observation_count: int, progress: Callable, force: bool, on_created: Callable) -> Dict:
+        existing = {form.sheet_key: form for form in self._workbook_forms(source)}
+        
+        progress(2, 'Checking workbook version')
+        if not force and existing:
+            version = source.get_version()
+            if all(self._is_unmodified(form, version) for form in existing.values()):
+                return {'forms': [self._not_modified_result(form) for form in existing.values()]}
+        
+        progress(5, 'Downloading workbook')
+        with WorkbookImportSession(self, source) as session:
+            progress(30, 'Reading workbook')
+            workbooks = session.read_forms()
+            changes = {key: self._version_changes(existing[key], workbook) for key, workbook in workbooks.items() if key in existing}
+            changed = any(change['display'] or change['entry'] for change in changes.values())
+            snapshot = store_snapshot(session.workbook_file) if changed or len(changes) < len(workbooks) else None
+        
+        progress(SAVING_PROGRESS, 'Saving forms')
+        form_names = form_names or {}
+        results = []
+        with transaction.atomic():
+            for key, workbook in workbooks.items():
+                if key in existing:
+                    results.append(self._save_versions(existing[key], source, session.version, workbook, changes[key], snapshot, updated_by))
+                else:
+                    results.append(self._create_form(
+                        source, session.version, workbook, snapshot, form_names.get(key) or self._pair_form_name(workbook, source),
+                        created_by, updated_by, custom_scripts=custom_scripts, observation_count=observation_count, sheet_key=key,
+                        on_created=on_created
+                    ))
+        
+        return {'forms': results}
+    
+    def _workbook_forms(self, source: WorkbookSource) -> List[Form]:
+        # Uploaded workbooks have no URL or path to recognise them by; their pairs always create forms
+        if source.url:
+            return list(Form.objects.filter(sheet_key__isnull=False, url=source.url))
+        if source.path:
+            return list(Form.objects.filter(sheet_key__isnull=False, source=source.source_name, source_path=source.path))
+        return []
+    
+    def _workbook_key(self, source: WorkbookSource):
+        # Matches how _workbook_forms finds a workbook's forms
+        if source.url:
+            return hashlib.sha256(source.url.encode()).hexdigest()
+        if source.path:
+            return hashlib.sha256(f"{source.source_name}:{source.path}".encode()).hexdigest()
+        return None
+    
+    def _pair_form_name(self, workbook: Dict, source: WorkbookSource) -> str:
+        name = re.sub(r'display', ' ', workbook['display_sheet'], flags=re.IGNORECASE)
+        name = ' '.join(name.replace('_', ' ').replace('-', ' ').split())
+        return name or os.path.splitext(os.path.basename(source.path or source.url or 'Form'))[0]
+    
+    def _create_form(self, source: WorkbookSource, version: Dict, workbook: Dict, snapshot, form_name: str, created_by: str, updated_by: str, custom_scripts: list = None, observation_count: int = 1, sheet_key: str = None, on_created: Callable = None) -> Dict:
+        display_metadata = workbook['display']
+        entry_data = workbook['entry']
+        
+        form = Form.objects.create(
+            form_name=form_name,
+            source=source.source_name,
+            url=source.url,
+            source_path=source.path,
+            sheet_key=sheet_key,
+            custom_scripts=custom_scripts or [],
+            observation_count=observation_count,
+            source_etag=version.get('eTag'),
+            source_ctag=version.get('cTag'),
+            source_size=version.get('size'),
+            source_item_id=version.get('id'),
+            created_by=created_by,
+            updated_by=updated_by
+        )
+        
+        create_version(FormDisplayVersion, form, display_metadata, content_hash(display_metadata), 1, created_by, updated_by, snapshot=snapshot, source=source.source_name)
+        create_version(FormEntryVersion, form, entry_data, content_hash(entry_data), 1, created_by, updated_by, snapshot=snapshot, source=source.source_name)
+        if on_created:
+            on_created(form.id)
+        
+        return {
+            'form_id': form.id,
+            'form_name': form_name,
+            'display_version': 1,
+            'entry_version': 1,
+            'outcome': 'created',
+            'display_sheet': workbook['display_sheet'],
+            'entry_sheet': workbook['entry_sheet']
+        }
+    
+    def _version_changes(self, form: Form, workbook: Dict) -> Dict:
+        """Hashes of the extracted content and whether each differs from the form's latest version"""
+        display_hash = content_hash(workbook['display'])
+        entry_hash = content_hash(workbook['entry'])
+        
+        # Only hashes are compared; the previous JSON is loaded only for rows that predate them
+        latest_display = current_version(form, FormDisplayVersion, defer=['inline_display_json'])
+        latest_entry = current_version(form, FormEntryVersion, defer=['inline_entry_json'])
+        
+        return {
+            'display_hash': display_hash,
+            'entry_hash': entry_hash,
+            'latest_display': latest_display,
+            'latest_entry': latest_entry,
+            'display': not latest_display or self._display_version_hash(latest_display) != display_hash,
+            'entry': not latest_entry or self._entry_version_hash(latest_entry) != entry_hash
+        }
+    
+    def _save_versions(self, form: Form, source: WorkbookSource, version: Dict, workbook: Dict, changes: Dict, snapshot, updated_by: str) -> Dict:
+        latest_display = changes['latest_display']
+        latest_entry = changes['latest_entry']
+        versions_updated = []
+        display_version = version_number(latest_display) if latest_display else 0
+        entry_version = version_number(latest_entry) if latest_entry else 0
+        
+        # A workbook uploaded to a form imported from SharePoint or a local path only adds versions;
+        # the form keeps its source, so syncs and change notifications go on tracking it
+        if source.source_name != UploadedWorkbookSource.source_name or form.source in (None, UploadedWorkbookSource.source_name):
+            form.source = source.source_name
+            form.url = source.url or form.url
+            form.source_path = source.path or form.source_path
+            form.source_etag = version.get('eTag')
+            form.source_ctag = version.get('cTag')
+            form.source_size = version.get('size')
+            form.source_item_id = version.get('id') or form.source_item_id
+        form.updated_by = updated_by
+        # Leaves fields an admin may be editing meanwhile, and the current-version pointers, alone
+        form.save(update_fields=[
+            'source', 'url', 'source_path', 'source_etag', 'source_ctag', 'source_size', 'source_item_id', 'updated_by', 'updated_at'
+        ])
+        
+        if changes['display']:
+            display_version += 1
+            create_version(
+                FormDisplayVersion, form, workbook['display'], changes['display_hash'], display_version,
+                updated_by, updated_by, previous=latest_display, snapshot=snapshot, source=source.source_name
             )
-            
-            entry_data = self.get_entry_sheet_data(sharepoint_url, entry_sheet['name'])
-            
-            FormEntryVersion.objects.create(
-                form=form,
-                form_entry_json=entry_data,
-                form_version='1',
-                approved=False,
-                created_by=created_by,
-                updated_by=updated_by
+            versions_updated.append('display')
+        
+        if changes['entry']:
+            entry_version += 1
+            create_version(
+                FormEntryVersion, form, workbook['entry'], changes['entry_hash'], entry_version,
+                updated_by, updated_by, previous=latest_entry, snapshot=snapshot, source=source.source_name
             )
-            
-            return {
-                'form_id': form.id,
-                'form_name': form_name,
-                'display_version': 1,
-                'entry_version': 1,
-                'display_sheet': display_sheet['name'],
-                'entry_sheet': entry_sheet['name']
-            }
+            versions_updated.append('entry')
+        
+        return {
+            'form_id': form.id,
+            'form_name': form.form_name,
+            'display_version': display_version,
+            'entry_version': entry_version,
+            'versions_updated': versions_updated,
+            'outcome': 'updated' if versions_updated else 'unchanged',
+            'display_sheet': workbook['display_sheet'],
+            'entry_sheet': workbook['entry_sheet']
+        }
     
-    def update_existing_form(self, form_id: int, updated_by: str) -> Dict:
-        """Update existing form from SharePoint URL"""
-        form = Form.objects.get(id=form_id)
-        sharepoint_url = form.url
-        worksheets = self.get_workbook_worksheets(sharepoint_url)
+    def _display_version_hash(self, version: FormDisplayVersion) -> str:
+        if version.content_hash:
+            return version.content_hash
+        # Older versions may be stored in another shape; hash the sparse one
+        return content_hash(sparse_display_json(version.form_display_json))
+    
+    def _entry_version_hash(self, version: FormEntryVersion) -> str:
+        if version.content_hash:
+            return version.content_hash
+        return content_hash(version.form_entry_json)
+    
+    def _resolve_drive_item(self, sharepoint_url: str) -> tuple:
+        """Resolve a SharePoint URL to (site_id, file_path, drive item metadata)"""
+        resolved = self._resolve_drive_items([sharepoint_url])[sharepoint_url]
+        if isinstance(resolved, Exception):
+            raise resolved
+        return resolved
+    
+    def _resolve_drive_items(self, sharepoint_urls: List[str], retry_not_found: bool = True) -> Dict:
+        """Resolve many SharePoint URLs to (site_id, file_path, drive item metadata) in Graph batches.
+        
+        Maps each URL to its resolved tuple, or to the exception resolving it failed with.
+        """
+        results = self._parse_sharepoint_urls(sharepoint_urls)
+        parsed = [url for url, value in results.items() if not isinstance(value, Exception)]
+        responses = self.graph.batch([self._drive_item_request(*results[url]) for url in parsed])
         
+        not_found = []
+        for url, response in zip(parsed, responses):
+            site_id, file_path = results[url]
+            try:
+                results[url] = (site_id, file_path, self._drive_item_from_response(response))
+            except GraphNotFoundError as e:
+                results[url] = e
+                not_found.append(url)
+            except Exception as e:
+                results[url] = e
+        
+        if not_found and retry_not_found:
+            # The cached site ID or file path may be stale; resolve again once
+            for url in not_found:
+                self._invalidate_resolution(url)
+            results.update(self._resolve_drive_items(not_found, retry_not_found=False))
+        
+        return results
+    
+    def _is_unmodified(self, form: Form, version: Dict) -> bool:
+        """Whether the source still matches the version the form was last imported from"""
+        if form.source_ctag and version.get('cTag'):
+            # cTag only changes with the file content, eTag also with metadata such as renames
+            return form.source_ctag == version['cTag'] and form.source_size == version.get('size')
+        if form.source_etag and version.get('eTag'):
+            return form.source_etag == version['eTag']
+        return False
+    
+    def _not_modified_result(self, form: Form) -> Dict:
+        latest_display = current_version(form, FormDisplayVersion, defer=['inline_display_json', 'delta'])
+        latest_entry = current_version(form, FormEntryVersion, defer=['inline_entry_json', 'delta'])
+        return {
+            'form_id': form.id,
+            'form_name': form.form_name,
+            'display_version': version_number(latest_display) if latest_display else 0,
+            'entry_version': version_number(latest_entry) if latest_entry else 0,
+            'versions_updated': [],
+            'outcome': 'not_modified',
+            'display_sheet': None,
+            'entry_sheet': None
+        }
+    
+    def _select_form_sheets(self, worksheets: List[Dict]) -> tuple:
+        """Pick the display and entry worksheets by name"""
         display_sheet = None
         entry_sheet = None
         
@@ -110,74 +421,30 @@ class SharePointService:
         if not display_sheet or not entry_sheet:
             raise Exception("Both 'display' and 'entry' worksheets are required")
         
-        new_display_metadata = self.get_display_sheet_metadata(sharepoint_url, display_sheet['name'])
-        new_entry_data = self.get_entry_sheet_data(sharepoint_url, entry_sheet['name'])
-        
-        latest_display = FormDisplayVersion.objects.filter(form=form).order_by('-form_version').first()
-        latest_entry = FormEntryVersion.objects.filter(form=form).order_by('-form_version').first()
-        
-        versions_updated = []
-        display_version = int(latest_display.form_version) if latest_display else 0
-        entry_version = int(latest_entry.form_version) if latest_entry else 0
-        
-        with transaction.atomic():
-            form.url = sharepoint_url
-            form.updated_by = updated_by
-            form.save()
-            
-            if not latest_display or latest_display.form_display_json != new_display_metadata:
-                display_version += 1
-                FormDisplayVersion.objects.create(
-                    form=form,
-                    form_display_json=new_display_metadata,
-                    form_version=str(display_version),
-                    approved=False,
-                    created_by=updated_by,
-                    updated_by=updated_by
-                )
-                versions_updated.append('display')
-            
-            if not latest_entry or latest_entry.form_entry_json != new_entry_data:
-                entry_version += 1
-                FormEntryVersion.objects.create(
-                    form=form,
-                    form_entry_json=new_entry_data,
-                    form_version=str(entry_version),
-                    approved=False,
-                    created_by=updated_by,
-                    updated_by=updated_by
-                )
-                versions_updated.append('entry')
-            
-            return {
-                'form_id': form.id,
-                'form_name': form.form_name,
-                'display_version': display_version,
-                'entry_version': entry_version,
-                'versions_updated': versions_updated,
-                'display_sheet': display_sheet['name'],
-                'entry_sheet': entry_sheet['name']
-            }
+        return display_sheet, entry_sheet
     
-    def get_display_sheet_metadata(self, sharepoint_url: str, worksheet_name: str) -> Dict:
-        """Get complete metadata for display sheet using openpyxl"""
-        return self._get_display_metadata_from_file(sharepoint_url, worksheet_name)
-    
-    def get_entry_sheet_data(self, sharepoint_url: str, worksheet_name: str) -> List[Dict]:
-        """Get entry sheet data and transform to JSON object list"""
-        token = self.get_access_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        
-        site_id, file_path = self._parse_sharepoint_url(sharepoint_url)
-        base_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{file_path}:/workbook/worksheets('{worksheet_name}')"
-        
-        range_response = requests.get(f"{base_url}/usedRange", headers=headers)
-        if range_response.status_code != 200:
-            raise Exception(f"Failed to get range: {range_response.text}")
+    def _pair_form_sheets(self, worksheets: List[Dict]) -> Dict:
+        """Pair display and entry worksheets that share a name apart from the word display/entry.
         
-        range_data = range_response.json()
-        values = range_data.get("values", [])
+        "Pump Display" pairs with "Pump Entry" and "display_valve" with
+        "entry_valve". Maps each pair's sheet key (the rest of the name,
+        lowercased) to (display sheet, entry sheet), in workbook order.
+        """
+        sheets = {}
+        for worksheet in worksheets:
+            name = worksheet['name'].lower()
+            role = 'display' if 'display' in name else 'entry' if 'entry' in name else None
+            if role:
+                key = ' '.join(name.replace(role, ' ').replace('_', ' ').replace('-', ' ').split())
+                sheets.setdefault(key, {})[role] = worksheet
         
+        pairs = {key: (roles['display'], roles['entry']) for key, roles in sheets.items() if len(roles) == 2}
+        if not pairs:
+            raise Exception("No worksheets pair up as '<name> display' and '<name> entry'")
+        return pairs
+    
+    def _rows_to_json_objects(self, values: List[List]) -> List[Dict]:
+        """Turn a header row plus data rows into a list of JSON objects"""
         if not values or len(values) < 2:
             return []
         
@@ -196,23 +463,63 @@ class SharePointService:
         
         return json_objects
     
-    def get_workbook_worksheets(self, sharepoint_url: str) -> List[Dict]:
-        token = self.get_access_token()
-        headers = {"Authorization": f"Bearer {token}"}
+    def _parse_sharepoint_url(self, sharepoint_url: str) -> tuple:
+        """Parse SharePoint sharing URL to extract site URL and file path"""
+        parsed = self._parse_sharepoint_urls([sharepoint_url])[sharepoint_url]
+        if isinstance(parsed, Exception):
+            raise parsed
+        return parsed
+    
+    def _parse_sharepoint_urls(self, sharepoint_urls: List[str]) -> Dict:
+        """Resolve many SharePoint URLs to (site_id, file_path).
         
-        site_id, file_path = self._parse_sharepoint_url(sharepoint_url)
-        url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{file_path}:/workbook/worksheets"
+        Site and sharing-link lookups missing from the resolution cache are
+        independent, so they all go out together in Graph batches. Maps each URL
+        to its (site_id, file_path), or to the exception resolving it failed with.
+        """
+        results = {}
+        parts = {}
+        for sharepoint_url in sharepoint_urls:
+            try:
+                parts[sharepoint_url] = self._split_sharepoint_url(sharepoint_url)
+            except Exception as e:
+                results[sharepoint_url] = e
         
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            return response.json().get("value", [])
-        else:
-            raise Exception(f"Failed to get worksheets: {response.text}")
+        site_ids = {site_url: self.resolution_cache.get(ResolutionCache.SITE_ID, site_url) for site_url, _, _ in parts.values()}
+        file_paths = {file_id: self.resolution_cache.get(ResolutionCache.FILE_PATH, file_id) for _, file_id, _ in parts.values() if file_id}
+        missing_sites = [site_url for site_url, site_id in site_ids.items() if not site_id]
+        missing_files = [file_id for file_id, file_path in file_paths.items() if not file_path]
+        
+        responses = self.graph.batch(
+            [self._site_request(site_url) for site_url in missing_sites]
+            + [{'url': f"/shares/u!{file_id}/driveItem"} for file_id in missing_files]
+        )
+        for site_url, response in zip(missing_sites, responses):
+            try:
+                site_ids[site_url] = self._site_id_from_response(site_url, response)
+            except Exception as e:
+                site_ids[site_url] = e
+        share_responses = dict(zip(missing_files, responses[len(missing_sites):]))
+        
+        for sharepoint_url, (site_url, file_id, file_name) in parts.items():
+            site_id = site_ids[site_url]
+            if isinstance(site_id, Exception):
+                results[sharepoint_url] = site_id
+            elif file_name:
+                results[sharepoint_url] = (site_id, file_name)
+            else:
+                try:
+                    if not file_paths[file_id]:
+                        file_paths[file_id] = self._file_path_from_response(site_id, file_id, share_responses[file_id])
+                    results[sharepoint_url] = (site_id, file_paths[file_id])
+                except Exception as e:
+                    results[sharepoint_url] = e
+        
+        return results
     
-    def _parse_sharepoint_url(self, sharepoint_url: str) -> tuple:
-        """Parse SharePoint sharing URL to extract site URL and file path"""
-        import re
-        from urllib.parse import urlparse, parse_qs, unquote
+    def _split_sharepoint_url(self, sharepoint_url: str) -> tuple:
+        """Split a SharePoint URL into site URL, sharing-link ID and file name without calling Graph"""
+        from urllib.parse import urlparse, parse_qs
         
         parsed = urlparse(sharepoint_url)
         domain = parsed.netloc
@@ -238,13 +545,9 @@ class SharePointService:
             if not source_doc or not file_name:
                 raise Exception("Could not extract file info from URL")
             
-            # Remove curly braces from GUID
-            file_guid = source_doc.strip('{}').replace('%7B', '').replace('%7D', '')
-            
             site_url = f"https://{domain}/sites/{site_name}"
-            site_id = self._get_site_id(site_url)
             
-            return site_id, file_name
+            return site_url, None, file_name
         
         # Original sharing link format (:x:/s/test/...)
         else:
@@ -259,163 +562,290 @@ class SharePointService:
                 raise Exception("Could not extract site name from URL")
             
             site_url = f"https://{domain}/sites/{site_name}"
-            site_id = self._get_site_id(site_url)
             
             # Extract file ID from URL path
             file_id_match = re.search(r'/([A-Za-z0-9_-]+)\?', sharepoint_url)
             if not file_id_match:
                 raise Exception("Could not extract file ID from URL")
             
-            file_id = file_id_match.group(1)
-            file_path = self._get_file_path_from_id(site_id, file_id)
-            
-            return site_id, file_path
+            return site_url, file_id_match.group(1), None
     
-    def _get_file_path_from_id(self, site_id: str, file_id: str) -> str:
-        """Get file path from sharing link ID"""
-        token = self.get_access_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        
-        # Try to resolve the sharing link
-        sharing_url = f"https://graph.microsoft.com/v1.0/shares/u!{file_id}/driveItem"
-        response = requests.get(sharing_url, headers=headers)
-        
+    def _invalidate_resolution(self, sharepoint_url: str):
+        """Drop cached site ID and file path for a URL after Graph reports them gone"""
+        site_url, file_id, _ = self._split_sharepoint_url(sharepoint_url)
+        self.resolution_cache.invalidate(ResolutionCache.SITE_ID, site_url)
+        if file_id:
+            self.resolution_cache.invalidate(ResolutionCache.FILE_PATH, file_id)
+    
+    def _file_path_from_response(self, site_id: str, file_id: str, response) -> str:
+        """Get file path from the sharing link's driveItem response"""
         if response.status_code == 200:
             item = response.json()
-            return item.get('name', 'Unknown.xlsx')
+            file_path = item.get('name', 'Unknown.xlsx')
+            self.resolution_cache.set(ResolutionCache.FILE_PATH, file_id, file_path)
+            return file_path
         else:
             # Fallback: search for files in the site
-            search_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root/children"
-            response = requests.get(search_url, headers=headers)
+            search_url = f"/sites/{site_id}/drive/root/children"
+            response = self.graph.get(search_url)
             if response.status_code == 200:
                 items = response.json().get('value', [])
                 # Return first Excel file found
+                # Only a guess, so not cached: the next resolution asks the share again
                 for item in items:
                     if item.get('name', '').endswith(('.xlsx', '.xls')):
                         return item['name']
             
             raise Exception("Could not resolve file path from sharing URL")
     
-    def _get_site_id(self, site_url: str) -> str:
-        token = self.get_access_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        
+    def _site_request(self, site_url: str) -> Dict:
         parts = site_url.replace("https://", "").split("/")
         domain = parts[0]
         site_path = "/".join(parts[1:])
-        
-        graph_url = f"https://graph.microsoft.com/v1.0/sites/{domain}:/{site_path}"
-        response = requests.get(graph_url, headers=headers)
-        
+        return {'url': f"/sites/{domain}:/{site_path}"}
+    
+    def _site_id_from_response(self, site_url: str, response) -> str:
         if response.status_code == 200:
-            return response.json()["id"]
+            site_id = response.json()["id"]
+            self.resolution_cache.set(ResolutionCache.SITE_ID, site_url, site_id)
+            return site_id
         else:
             raise Exception(f"Failed to get site ID: {response.text}")
-
     
-    def _get_display_metadata_from_file(self, sharepoint_url: str, worksheet_name: str) -> Dict:
-        """Extract complete display metadata using openpyxl"""
+    def _drive_item_request(self, site_id: str, file_path: str) -> Dict:
+        """Request for a drive item's eTag, cTag and size without downloading it"""
+        return {'url': f"/sites/{site_id}/drive/root:/{file_path}", 'params': {'$select': 'id,eTag,cTag,size'}}
+    
+    def _drive_item_from_response(self, response) -> Dict:
+        if response.status_code == 404:
+            raise GraphNotFoundError(f"Failed to get file metadata: {response.status_code}")
+        if response.status_code != 200:
+            raise Exception(f"Failed to get file metadata: {response.text}")
+        return response.json()
+    
+    def _resolve_and_download(self, sharepoint_url: str) -> tuple:
+        """Fetch a drive item's metadata and content at the same time.
+        
+        For imports that need both and do not compare the version first (new
+        forms, forced updates). Returns (site_id, file_path, drive item
+        metadata, workbook file).
+        """
+        site_id, file_path = self._parse_sharepoint_url(sharepoint_url)
+        download = self.graph.get_executor().submit(self._download_workbook_file, site_id, file_path)
+        try:
+            request = self._drive_item_request(site_id, file_path)
+            item = self._drive_item_from_response(self.graph.get(request['url'], params=request['params']))
+            workbook_file = download.result()
+        except GraphNotFoundError:
+            # The cached site ID or file path may be stale; resolve again and fetch in order
+            self._discard_download(download)
+            self._invalidate_resolution(sharepoint_url)
+            site_id, file_path, item = self._resolve_drive_item(sharepoint_url)
+            return site_id, file_path, item, self._download_workbook_file(site_id, file_path)
+        except BaseException:
+            # Whatever failed, the download must not be left running or open
+            self._discard_download(download)
+            raise
+        
+        workbook_file.seek(0, 2)
+        size = workbook_file.tell()
+        workbook_file.seek(0)
+        if item.get('size') is not None and item['size'] != size:
+            # The file changed between the two calls; record no version so the next sync imports it again
+            item = {'id': item.get('id'), 'eTag': None, 'cTag': None, 'size': size}
+        
+        return site_id, file_path, item, workbook_file
+    
+    def _discard_download(self, download):
+        # A download still queued never starts; one under way is waited for and its file closed
+        if download.cancel():
+            return
         try:
-            token = self.get_access_token()
-            headers = {"Authorization": f"Bearer {token}"}
-            
-            site_id, file_path = self._parse_sharepoint_url(sharepoint_url)
-            download_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{file_path}:/content"
-            
-            response = requests.get(download_url, headers=headers)
+            download.result().close()
+        except Exception:
+            pass
+    
+    def _download_workbook_file(self, site_id: str, file_path: str):
+        """Stream a drive item's content into a temporary file, spilling to disk past WORKBOOK_SPOOL_MAX_MEMORY"""
+        download_url = f"/sites/{site_id}/drive/root:/{file_path}:/content"
+        
+        with self.graph.stream(download_url) as response:
+            if response.status_code == 404:
+                raise GraphNotFoundError(f"Failed to download file: {response.status_code}")
             if response.status_code != 200:
                 raise Exception(f"Failed to download file: {response.status_code}")
             
-            file_content = BytesIO(response.content)
-            
-            # Extract theme colors from Excel file
-            theme_colors = self._extract_theme_colors(file_content)
-            file_content.seek(0)  # Reset file pointer
-            
-            wb = load_workbook(file_content, data_only=False)
-            ws = wb[worksheet_name]
+            workbook_file = tempfile.SpooledTemporaryFile(max_size=settings.WORKBOOK_SPOOL_MAX_MEMORY)
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                workbook_file.write(chunk)
+        
+        workbook_file.seek(0)
+        return workbook_file
+    
+    def _extract_display_metadata_from_file(self, workbook_file, worksheet_name: str) -> Dict:
+        """Extract display metadata with the extractor selected by WORKBOOK_EXTRACTOR"""
+        # Extract theme colors from Excel file
+        styles = StyleResolver(self._extract_theme_colors(workbook_file))
+        workbook_file.seek(0)  # Reset file pointer
+        
+        if settings.WORKBOOK_EXTRACTOR == 'openpyxl':
+            wb = load_workbook(workbook_file, data_only=False)
             
             # Load workbook again with data_only=True to get calculated values
-            file_content.seek(0)
-            wb_data = load_workbook(file_content, data_only=True)
-            ws_data = wb_data[worksheet_name]
-            
-            # Determine dimensions - find actual used columns
-            max_row = ws.max_row
-            
-            # Find actual used columns (non-empty cells)
-            used_cols = set()
-            for row_idx in range(1, max_row + 1):
-                for col_idx in range(1, ws.max_column + 1):
-                    cell = ws.cell(row_idx, col_idx)
-                    if cell.value is not None and str(cell.value).strip():
-                        used_cols.add(col_idx)
-            
-            actual_max_col = max(used_cols) if used_cols else ws.max_column
-            
-            # Extract cells metadata
-            cells_metadata = []
-            for row_idx in range(1, max_row + 1):
-                for col_idx in range(1, actual_max_col + 1):
-                    cell = ws.cell(row_idx, col_idx)
-                    cell_data_value = ws_data.cell(row_idx, col_idx)
-                    cell_data = self._extract_openpyxl_cell_data(cell, cell_data_value, row_idx - 1, col_idx - 1, ws, theme_colors)
-                    cells_metadata.append(cell_data)
-            
-            # Extract merged cells
-            merged_cells = []
-            for merged_range in ws.merged_cells.ranges:
-                if merged_range.min_col <= actual_max_col:
-                    merged_cells.append({
-                        "range": str(merged_range),
-                        "start_row": merged_range.min_row - 1,
-                        "start_col": merged_range.min_col - 1,
-                        "row_span": merged_range.max_row - merged_range.min_row + 1,
-                        "col_span": merged_range.max_col - merged_range.min_col + 1
-                    })
-            
-            return {
-                "worksheet_name": worksheet_name,
-                "dimensions": {"rows": max_row, "columns": actual_max_col},
-                "cells": cells_metadata,
-                "merged_cells": merged_cells
-            }
+            workbook_file.seek(0)
+            wb_data = load_workbook(workbook_file, data_only=True)
             
-        except Exception as e:
-            raise Exception(f"Failed to extract display metadata: {e}")
+            return self._extract_display_metadata(wb, wb_data, worksheet_name, styles)
+        
+        streamed = StreamedWorkbook(workbook_file)
+        try:
+            return self._extract_streamed_display_metadata(streamed, worksheet_name, styles)
+        finally:
+            streamed.close()
+    
+    def _extract_display_metadata(self, wb, wb_data, worksheet_name: str, styles: StyleResolver) -> Dict:
+        """Build display metadata from already loaded formula and value workbooks"""
+        ws = wb[worksheet_name]
+        ws_data = wb_data[worksheet_name]
+        
+        # Determine dimensions - find actual used columns
+        # (max_row/max_column scan every cell, so read them once)
+        max_row = ws.max_row
+        max_col = ws.max_column
+        
+        # Find actual used columns (non-empty cells)
+        used_cols = set()
+        for row_idx in range(1, max_row + 1):
+            for col_idx in range(1, max_col + 1):
+                cell = ws.cell(row_idx, col_idx)
+                if cell.value is not None and str(cell.value).strip():
+                    used_cols.add(col_idx)
+        
+        actual_max_col = max(used_cols) if used_cols else max_col
+        
+        # Extract cells metadata
+        cells_metadata = []
+        for row_idx in range(1, max_row + 1):
+            for col_idx in range(1, actual_max_col + 1):
+                cell = ws.cell(row_idx, col_idx)
+                cell_data_value = ws_data.cell(row_idx, col_idx)
+                cell_data = self._extract_openpyxl_cell_data(cell, cell_data_value, row_idx - 1, col_idx - 1, ws, styles)
+                cells_metadata.append(cell_data)
+        
+        # Extract merged cells
+        merged_cells = []
+        for merged_range in ws.merged_cells.ranges:
+            if merged_range.min_col <= actual_max_col:
+                merged_cells.append({
+                    "range": str(merged_range),
+                    "start_row": merged_range.min_row - 1,
+                    "start_col": merged_range.min_col - 1,
+                    "row_span": merged_range.max_row - merged_range.min_row + 1,
+                    "col_span": merged_range.max_col - merged_range.min_col + 1
+                })
+        
+        return {
+            "worksheet_name": worksheet_name,
+            "dimensions": {"rows": max_row, "columns": actual_max_col},
+            "cells": cells_metadata,
+            "merged_cells": merged_cells
+        }
     
-    def _extract_openpyxl_cell_data(self, cell, cell_data_value, row: int, col: int, ws, theme_colors: Dict) -> Dict:
+    def _extract_streamed_display_metadata(self, streamed: StreamedWorkbook, worksheet_name: str, styles: StyleResolver) -> Dict:
+        """Build display metadata from a single streaming pass over the sheet XML.
+        
+        Produces the same cells/merged_cells JSON as _extract_display_metadata,
+        converting each distinct cell style only once per workbook.
+        """
+        ws = streamed.read_sheet(worksheet_name)
+        max_row = ws.max_row
+        
+        # Find actual used columns (non-empty cells)
+        used_cols = set()
+        for (row_idx, col_idx), cell in ws.cells.items():
+            if cell is not MERGED and cell.value is not None and str(cell.value).strip():
+                used_cols.add(col_idx)
+        
+        actual_max_col = max(used_cols) if used_cols else ws.max_column
+        
+        empty_cell = StreamedCell()
+        
+        # Extract cells metadata
+        cells_metadata = []
+        for row_idx in range(1, max_row + 1):
+            for col_idx in range(1, actual_max_col + 1):
+                cell = ws.cells.get((row_idx, col_idx), empty_cell)
+                if cell is MERGED:
+                    cells_metadata.append(self._merged_cell_data(row_idx - 1, col_idx - 1, ws.column_dimensions, ws.row_dimensions))
+                    continue
+                
+                style = styles.style(cell.style, lambda: streamed.style_cell(cell.style))
+                
+                cells_metadata.append(self._build_cell_data(
+                    f"{get_column_letter(col_idx)}{row_idx}",
+                    cell.value,
+                    cell.data_value,
+                    row_idx - 1,
+                    col_idx - 1,
+                    style,
+                    ws.column_dimensions,
+                    ws.row_dimensions,
+                    cell.hyperlink,
+                    cell.comment
+                ))
+        
+        # Extract merged cells
+        merged_cells = []
+        for merged_range in ws.merged_ranges:
+            if merged_range.min_col <= actual_max_col:
+                merged_cells.append({
+                    "range": str(merged_range),
+                    "start_row": merged_range.min_row - 1,
+                    "start_col": merged_range.min_col - 1,
+                    "row_span": merged_range.max_row - merged_range.min_row + 1,
+                    "col_span": merged_range.max_col - merged_range.min_col + 1
+                })
+        
+        return {
+            "worksheet_name": worksheet_name,
+            "dimensions": {"rows": max_row, "columns": actual_max_col},
+            "cells": cells_metadata,
+            "merged_cells": merged_cells
+        }
+    
+    def _extract_openpyxl_cell_data(self, cell, cell_data_value, row: int, col: int, ws, styles: StyleResolver) -> Dict:
         """Extract all metadata from an openpyxl cell"""
         # Handle merged cells - they don't have full attributes
         if isinstance(cell, MergedCell):
-            col_letter = chr(65 + col) if col < 26 else chr(64 + col // 26) + chr(65 + col % 26)
-            return {
-                "address": f"{col_letter}{row + 1}",
-                "value": None,
-                "formula": None,
-                "display_value": "",
-                "data_type": "empty",
-                "row": row,
-                "column": col,
-                "font": {"name": "", "size": 11, "bold": False, "italic": False, "underline": "none", "strikethrough": False, "color": ""},
-                "fill": {"color": "", "pattern_type": ""},
-                "alignment": {"horizontal": "", "vertical": "", "wrap_text": False, "indent": 0, "text_rotation": 0},
-                "borders": {"left": {"style": ""}, "right": {"style": ""}, "top": {"style": ""}, "bottom": {"style": ""}},
-                "number_format": {"format": ""},
-                "protection": {"locked": True},
-                "column_width": ws.column_dimensions[col_letter].width if col_letter in ws.column_dimensions else 8.43,
-                "row_height": ws.row_dimensions[row + 1].height if row + 1 in ws.row_dimensions else 15,
-                "column_hidden": False,
-                "row_hidden": False,
-                "hyperlink": {"target": ""},
-                "comment": {"text": ""},
-                "validation": {},
-                "conditional_formats": []
-            }
+            return self._merged_cell_data(row, col, ws.column_dimensions, ws.row_dimensions)
         
+        return self._build_cell_data(
+            cell.coordinate,
+            cell.value,
+            cell_data_value.value if cell_data_value else cell.value,
+            row,
+            col,
+            styles.cell_style(cell),
+            ws.column_dimensions,
+            ws.row_dimensions,
+            cell.hyperlink.target if cell.hyperlink else "",
+            cell.comment.text if cell.comment else ""
+        )
+    
+    def _merged_cell_data(self, row: int, col: int, column_dimensions, row_dimensions) -> Dict:
+        """Placeholder metadata for a cell covered by a merged range"""
+        col_letter = merged_column_letter(col)
+        return merged_cell_placeholder(
+            row,
+            col,
+            column_dimensions[col_letter].width if col_letter in column_dimensions else 8.43,
+            row_dimensions[row + 1].height if row + 1 in row_dimensions else 15
+        )
+    
+    def _build_cell_data(self, coordinate: str, value, display_value, row: int, col: int, style: Dict, column_dimensions, row_dimensions, hyperlink_target, comment_text) -> Dict:
+        """Assemble cell metadata from its values, resolved style and sheet dimensions"""
         # Separate formula and value
-        formula_value = cell.value if isinstance(cell.value, str) and cell.value.startswith('=') else None
-        display_value = cell_data_value.value if cell_data_value else cell.value
+        formula_value = value if isinstance(value, str) and value.startswith('=') else None
         
         # Convert datetime to string
         if hasattr(display_value, 'isoformat'):
@@ -423,58 +853,28 @@ class SharePointService:
         elif display_value is not None and not isinstance(display_value, (str, int, float, bool)):
             display_value = str(display_value)
         
+        column_letter = get_column_letter(col + 1)
+        row_number = row + 1
+        
         return {
-            "address": cell.coordinate,
+            "address": coordinate,
             "value": display_value,
             "formula": formula_value,
             "display_value": str(display_value) if display_value is not None else "",
             "data_type": self._infer_data_type(display_value),
             "row": row,
             "column": col,
-            "font": {
-                "name": cell.font.name if cell.font else "",
-                "size": cell.font.size if cell.font else 11,
-                "bold": cell.font.bold if cell.font else False,
-                "italic": cell.font.italic if cell.font else False,
-                "underline": cell.font.underline if cell.font else "none",
-                "strikethrough": cell.font.strike if cell.font else False,
-                "color": self._get_color_value(cell.font.color, theme_colors) if cell.font and cell.font.color else ""
-            },
-            "fill": {
-                "color": self._get_color_value(cell.fill.fgColor, theme_colors) if cell.fill and cell.fill.fgColor and cell.fill.patternType and cell.fill.patternType != 'none' else "",
-                "pattern_type": cell.fill.patternType if cell.fill else ""
-            },
-            "alignment": {
-                "horizontal": cell.alignment.horizontal if cell.alignment else "",
-                "vertical": cell.alignment.vertical if cell.alignment else "",
-                "wrap_text": cell.alignment.wrap_text if cell.alignment else False,
-                "indent": cell.alignment.indent if cell.alignment else 0,
-                "text_rotation": cell.alignment.text_rotation if cell.alignment else 0
-            },
-            "borders": {
-                "left": {"style": cell.border.left.style if cell.border and cell.border.left else ""},
-                "right": {"style": cell.border.right.style if cell.border and cell.border.right else ""},
-                "top": {"style": cell.border.top.style if cell.border and cell.border.top else ""},
-                "bottom": {"style": cell.border.bottom.style if cell.border and cell.border.bottom else ""}
-            },
-            "number_format": {
-                "format": cell.number_format if cell.number_format else ""
-            },
-            "protection": {
-                "locked": cell.protection.locked if cell.protection else True
-            },
-            "column_width": ws.column_dimensions[cell.column_letter].width if cell.column_letter in ws.column_dimensions else 8.43,
-            "row_height": ws.row_dimensions[cell.row].height if cell.row in ws.row_dimensions else 15,
-            "column_hidden": ws.column_dimensions[cell.column_letter].hidden if cell.column_letter in ws.column_dimensions else False,
-            "row_hidden": ws.row_dimensions[cell.row].hidden if cell.row in ws.row_dimensions else False,
-            "hyperlink": {"target": cell.hyperlink.target if cell.hyperlink else ""},
-            "comment": {"text": cell.comment.text if cell.comment else ""},
+            **style,
+            "column_width": column_dimensions[column_letter].width if column_letter in column_dimensions else 8.43,
+            "row_height": row_dimensions[row_number].height if row_number in row_dimensions else 15,
+            "column_hidden": column_dimensions[column_letter].hidden if column_letter in column_dimensions else False,
+            "row_hidden": row_dimensions[row_number].hidden if row_number in row_dimensions else False,
+            "hyperlink": {"target": hyperlink_target},
+            "comment": {"text": comment_text},
             "validation": {},
             "conditional_formats": []
         }
     
-
-    
     def _extract_theme_colors(self, file_content: BytesIO) -> Dict:
         """Extract theme colors from Excel file"""
         theme_colors = {}
@@ -510,62 +910,124 @@ class SharePointService:
             pass
         
         return theme_colors
+    
+    def _infer_data_type(self, value) -> str:
+        return infer_data_type(value)
 
-    def _get_color_value(self, color_obj, theme_colors: Dict) -> str:
-        """Extract color value from openpyxl color object"""
-        if not color_obj:
-            return ""
-        
+class WorkbookImportSession:
+    """Open a workbook source once for a whole import.
+    
+    Worksheet names, entry rows and display metadata are all derived from the
+    same local copy, so an import costs one version check and one download.
+    Remote copies are spooled to a temporary file; close the session when done.
+    """
+    
+    def __init__(self, service: SharePointService, source: WorkbookSource):
+        self.service = service
+        self.source = source
+        # Opened first: a source may fetch its version along with the content
+        self.workbook_file = source.open()
         try:
-            # Check RGB first
-            if hasattr(color_obj, 'rgb') and color_obj.rgb and isinstance(color_obj.rgb, str):
-                rgb = color_obj.rgb
-                if rgb not in ['00000000', 'FF000000']:
-                    return rgb[2:] if len(rgb) == 8 else rgb
+            self.version = source.get_version()
             
-            # Handle theme colors
-            if hasattr(color_obj, 'theme') and color_obj.theme is not None:
-                base_color = theme_colors.get(color_obj.theme, '')
-                if base_color:
-                    # Apply tint if present
-                    if hasattr(color_obj, 'tint') and color_obj.tint != 0:
-                        return self._apply_tint(base_color, color_obj.tint)
-                    return base_color
-        except:
-            pass
+            self.styles = StyleResolver(service._extract_theme_colors(self.workbook_file))
+            self.workbook_file.seek(0)
+            self.workbook = StreamedWorkbook(self.workbook_file)
+        except Exception:
+            # Not a valid workbook; __exit__ never runs, so the spooled copy is closed here
+            self.workbook_file.close()
+            raise
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        self.workbook.close()
+        self.workbook_file.close()
+    
+    def get_worksheets(self) -> List[Dict]:
+        return self.workbook.get_worksheets()
+    
+    def read_form(self, sheet_key: str = None) -> Dict:
+        """extract_form, in a parser process when WORKBOOK_PARSE_WORKERS is set"""
+        return self.read_forms([sheet_key])[sheet_key]
+    
+    def read_forms(self, sheet_keys: List[str] = None) -> Dict:
+        """extract_forms, in a parser process when WORKBOOK_PARSE_WORKERS is set"""
+        if settings.WORKBOOK_PARSE_WORKERS <= 0:
+            return self.extract_forms(sheet_keys)
         
-        return ""
+        fallback = lambda: self.extract_forms(sheet_keys)
+        if isinstance(self.source, LocalWorkbookSource):
+            return WorkbookParserPool.parse(self.source.full_path, fallback, sheet_keys)
+        
+        # Children read from disk; remote and uploaded copies may only be in memory
+        with tempfile.NamedTemporaryFile(suffix='.xlsx') as copy:
+            self.workbook_file.seek(0)
+            shutil.copyfileobj(self.workbook_file, copy)
+            copy.flush()
+            return WorkbookParserPool.parse(copy.name, fallback, sheet_keys)
     
-    def _apply_tint(self, rgb: str, tint: float) -> str:
-        """Apply tint to RGB color"""
-        try:
-            r, g, b = int(rgb[0:2], 16), int(rgb[2:4], 16), int(rgb[4:6], 16)
-            
-            if tint < 0:
-                # Darken
-                r = int(r * (1 + tint))
-                g = int(g * (1 + tint))
-                b = int(b * (1 + tint))
+    def extract_form(self, sheet_key: str = None) -> Dict:
+        """Select the display and entry sheets and extract both: sparse display JSON and entry rows.
+        
+        Without a sheet key the last display and the last entry sheet are used;
+        with one, the pair `_pair_form_sheets` finds under that key.
+        """
+        return self.extract_forms([sheet_key])[sheet_key]
+    
+    def extract_forms(self, sheet_keys: List[str] = None) -> Dict:
+        """extract_form for several sheet keys, or for every sheet pair if none are given, keyed by sheet key"""
+        worksheets = self.get_worksheets()
+        pairs = {}
+        if sheet_keys is None or any(key is not None for key in sheet_keys):
+            pairs = self.service._pair_form_sheets(worksheets)
+        if sheet_keys is None:
+            sheet_keys = list(pairs)
+        
+        workbooks = {}
+        for key in sheet_keys:
+            if key is None:
+                display_sheet, entry_sheet = self.service._select_form_sheets(worksheets)
+            elif key in pairs:
+                display_sheet, entry_sheet = pairs[key]
             else:
-                # Lighten
-                r = int(r + (255 - r) * tint)
-                g = int(g + (255 - g) * tint)
-                b = int(b + (255 - b) * tint)
-            
-            return f"{r:02X}{g:02X}{b:02X}"
-        except:
-            return rgb
+                raise Exception(f"Workbook has no display/entry worksheet pair named '{key}'")
+            workbooks[key] = {
+                'display_sheet': display_sheet['name'],
+                'entry_sheet': entry_sheet['name'],
+                'display': sparse_display_json(self.get_display_sheet_metadata(display_sheet['name'])),
+                'entry': self.get_entry_sheet_data(entry_sheet['name'])
+            }
+        return workbooks
     
-    def _infer_data_type(self, value) -> str:
-        if value is None or value == "":
-            return "empty"
-        elif isinstance(value, bool):
-            return "boolean"
-        elif isinstance(value, (int, float)):
-            return "number"
-        elif isinstance(value, str):
-            if value.startswith("="):
-                return "formula"
-            return "text"
-        else:
-            return "unknown"
\ No newline at end of file
+    def get_display_sheet_metadata(self, worksheet_name: str) -> Dict:
+        try:
+            if settings.WORKBOOK_EXTRACTOR == 'openpyxl':
+                self.workbook_file.seek(0)
+                return self.service._extract_display_metadata_from_file(self.workbook_file, worksheet_name)
+            return self.service._extract_streamed_display_metadata(self.workbook, worksheet_name, self.styles)
+        except Exception as e:
+            raise Exception(f"Failed to extract display metadata: {e}")
+    
+    def get_entry_sheet_data(self, worksheet_name: str) -> List[Dict]:
+        """Read the used range of the entry sheet the way Graph's /usedRange reports it"""
+        ws = self.workbook.read_sheet(worksheet_name)
+        epoch = self.workbook.epoch
+        
+        values = []
+        for row in ws.iter_data_values():
+            values.append([self._to_graph_value(value, epoch) for value in row])
+        
+        return self.service._rows_to_json_objects(values)
+    
+    def _to_graph_value(self, value, epoch):
+        # Graph returns blanks as "" and dates as Excel serial numbers
+        if value is None:
+            return ""
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time, datetime.timedelta)):
+            return to_excel(value, epoch)
+        return value
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import FormMetadataCache
+from .models import Form, FormDisplayVersion, FormEntryVersion
+
+
+# Every save or delete of a form or its versions changes what get_form_metadata
+# renders, whether it comes from an import, a view, the admin or a command.
+# Queryset update() sends no signal, so callers using it invalidate themselves.
+@receiver([post_save, post_delete], sender=Form)
+@receiver([post_save, post_delete], sender=FormDisplayVersion)
+@receiver([post_save, post_delete], sender=FormEntryVersion)
+def invalidate_form_metadata(sender, instance, **kwargs):
+    FormMetadataCache().invalidate(instance.id if sender is Form else instance.form_id)
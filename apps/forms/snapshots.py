@@ -0,0 +1,56 @@
+import hashlib
+import os
+import tempfile
+from typing import Optional
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .models import WorkbookSnapshot
+
+
+def store_snapshot(workbook_file) -> Optional[WorkbookSnapshot]:
+    """Keep the raw xlsx bytes of an import under WORKBOOK_SNAPSHOT_DIR, named by their sha256.
+    
+    Identical files share one snapshot. Returns None when snapshots are disabled.
+    """
+    if not settings.WORKBOOK_SNAPSHOT_DIR:
+        return None
+    
+    os.makedirs(settings.WORKBOOK_SNAPSHOT_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    # Write to a temporary name first so a half-written file never has a snapshot's name
+    fd, tmp_path = tempfile.mkstemp(dir=settings.WORKBOOK_SNAPSHOT_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            workbook_file.seek(0)
+            for chunk in iter(lambda: workbook_file.read(1024 * 1024), b''):
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+        workbook_file.seek(0)
+        
+        path = snapshot_path(digest.hexdigest())
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    
+    snapshot = WorkbookSnapshot.objects.filter(content_hash=digest.hexdigest()).first()
+    if snapshot:
+        return snapshot
+    
+    try:
+        with transaction.atomic():
+            return WorkbookSnapshot.objects.create(content_hash=digest.hexdigest(), size=size)
+    except IntegrityError:
+        # Another import stored the same file first
+        return WorkbookSnapshot.objects.get(content_hash=digest.hexdigest())
+
+
+def snapshot_path(content_hash: str) -> str:
+    return os.path.join(settings.WORKBOOK_SNAPSHOT_DIR, content_hash[:2], f"{content_hash}.xlsx")
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import uuid
+from typing import Dict, Optional
+from django.conf import settings
+
+
+class WorkbookSourceError(Exception):
+    """The workbook source cannot be read; retrying will not help"""
+
+
+class WorkbookSource:
+    """Where an imported workbook comes from.
+    
+    `get_version` returns cheap change-detection metadata in the shape of a
+    Graph drive item (eTag, cTag, size); `open` returns a seekable binary file
+    with the xlsx content. Both are recorded on the form as source_* fields.
+    """
+    
+    source_name = None
+    url = None
+    path = None
+    
+    def get_version(self) -> Dict:
+        raise NotImplementedError
+    
+    def open(self):
+        raise NotImplementedError
+
+
+class GraphWorkbookSource(WorkbookSource):
+    """A SharePoint workbook read through Microsoft Graph"""
+    
+    source_name = 'sharepoint'
+    
+    def __init__(self, service, sharepoint_url: str):
+        self.service = service
+        self.url = sharepoint_url
+        self.site_id = None
+        self.file_path = None
+        self._version = None
+    
+    def get_version(self) -> Dict:
+        if self._version is None:
+            self.site_id, self.file_path, self._version = self.service._resolve_drive_item(self.url)
+        return self._version
+    
+    def set_resolved(self, site_id: str, file_path: str, version: Dict):
+        """Use drive item metadata that was already fetched, e.g. in a Graph batch"""
+        self.site_id = site_id
+        self.file_path = file_path
+        self._version = version
+    
+    def open(self):
+        if self._version is None:
+            # No version check came first (new form, forced update): fetch the version with the content
+            self.site_id, self.file_path, self._version, workbook_file = self.service._resolve_and_download(self.url)
+            return workbook_file
+        # Metadata was read before the content, so a concurrent edit at worst causes one extra import later
+        return self.service._download_workbook_file(self.site_id, self.file_path)
+
+
+class UploadedWorkbookSource(WorkbookSource):
+    """An xlsx file uploaded directly to the API, read from any binary file object"""
+    
+    source_name = 'upload'
+    
+    def __init__(self, uploaded_file):
+        self.uploaded_file = uploaded_file
+        self._version = None
+    
+    def get_version(self) -> Dict:
+        if self._version is None:
+            digest = hashlib.sha256()
+            size = 0
+            self.uploaded_file.seek(0)
+            for chunk in iter(lambda: self.uploaded_file.read(1024 * 1024), b''):
+                digest.update(chunk)
+                size += len(chunk)
+            self._version = {'eTag': None, 'cTag': digest.hexdigest(), 'size': size}
+        return self._version
+    
+    def open(self):
+        self.uploaded_file.seek(0)
+        return self.uploaded_file
+
+
+def store_upload(uploaded_file) -> str:
+    """Save an uploaded workbook under WORKBOOK_UPLOAD_DIR for its import job; returns the stored file name"""
+    os.makedirs(settings.WORKBOOK_UPLOAD_DIR, 0o700, exist_ok=True)
+    name = f"{uuid.uuid4().hex}.xlsx"
+    with open(os.path.join(settings.WORKBOOK_UPLOAD_DIR, name), 'wb') as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+    return name
+
+
+def open_upload(name: str):
+    try:
+        return open(os.path.join(settings.WORKBOOK_UPLOAD_DIR, os.path.basename(name)), 'rb')
+    except FileNotFoundError:
+        raise WorkbookSourceError("Uploaded workbook is no longer available; upload it again")
+
+
+def discard_upload(name: str):
+    try:
+        os.remove(os.path.join(settings.WORKBOOK_UPLOAD_DIR, os.path.basename(name)))
+    except FileNotFoundError:
+        pass
+
+
+class LocalWorkbookSource(WorkbookSource):
+    """An xlsx file under WORKBOOK_LOCAL_DIR, for admin imports and offline runs"""
+    
+    source_name = 'local'
+    
+    def __init__(self, path: str, root: Optional[str] = None):
+        root = os.path.realpath(root or settings.WORKBOOK_LOCAL_DIR)
+        full_path = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, full_path]) != root:
+            raise WorkbookSourceError(f"Workbook path {path} is outside {root}")
+        if not os.path.isfile(full_path):
+            raise WorkbookSourceError(f"Workbook {path} does not exist")
+        
+        self.path = os.path.relpath(full_path, root)
+        self.full_path = full_path
+    
+    def get_version(self) -> Dict:
+        stat = os.stat(self.full_path)
+        return {'eTag': None, 'cTag': str(stat.st_mtime_ns), 'size': stat.st_size}
+    
+    def open(self):
+        return open(self.full_path, 'rb')
@@ -0,0 +1,120 @@
+from typing import Callable, Dict
+from openpyxl.styles.cell_style import StyleArray
+
+
+class StyleResolver:
+    """Convert openpyxl cell styles to display JSON, once per workbook.
+    
+    A workbook has a few dozen distinct style records and colors shared by
+    thousands of cells, so resolved colors are cached by (rgb, theme, tint)
+    and style JSON by the cell's style array. Create one resolver per
+    workbook: theme colors and style ids are not shared between workbooks.
+    """
+    
+    def __init__(self, theme_colors: Dict):
+        self.theme_colors = theme_colors
+        self._colors = {}
+        self._styles = {}
+    
+    def cell_style(self, cell) -> Dict:
+        """Style JSON of an openpyxl cell"""
+        # Cells that were never styled have no style array and use the default one
+        return self.style(tuple(cell._style or StyleArray()), lambda: cell)
+    
+    def style(self, key: tuple, get_cell: Callable) -> Dict:
+        """Style JSON for a style array, built from get_cell() the first time it is seen"""
+        style = self._styles.get(key)
+        if style is None:
+            style = self._style_data(get_cell())
+            self._styles[key] = style
+        return style
+    
+    def color(self, color_obj) -> str:
+        """Hex RGB of an openpyxl color object, with theme colors and tint applied"""
+        if not color_obj:
+            return ""
+        
+        rgb = getattr(color_obj, 'rgb', None)
+        key = (rgb if isinstance(rgb, str) else None, getattr(color_obj, 'theme', None), getattr(color_obj, 'tint', 0))
+        color = self._colors.get(key)
+        if color is None:
+            color = self._resolve_color(*key)
+            self._colors[key] = color
+        return color
+    
+    def _style_data(self, cell) -> Dict:
+        """Extract font, fill, alignment, border, number format and protection of a cell"""
+        return {
+            "font": {
+                "name": cell.font.name if cell.font else "",
+                "size": cell.font.size if cell.font else 11,
+                "bold": cell.font.bold if cell.font else False,
+                "italic": cell.font.italic if cell.font else False,
+                "underline": cell.font.underline if cell.font else "none",
+                "strikethrough": cell.font.strike if cell.font else False,
+                "color": self.color(cell.font.color) if cell.font and cell.font.color else ""
+            },
+            "fill": {
+                "color": self.color(cell.fill.fgColor) if cell.fill and cell.fill.fgColor and cell.fill.patternType and cell.fill.patternType != 'none' else "",
+                "pattern_type": cell.fill.patternType if cell.fill else ""
+            },
+            "alignment": {
+                "horizontal": cell.alignment.horizontal if cell.alignment else "",
+                "vertical": cell.alignment.vertical if cell.alignment else "",
+                "wrap_text": cell.alignment.wrap_text if cell.alignment else False,
+                "indent": cell.alignment.indent if cell.alignment else 0,
+                "text_rotation": cell.alignment.text_rotation if cell.alignment else 0
+            },
+            "borders": {
+                "left": {"style": cell.border.left.style if cell.border and cell.border.left else ""},
+                "right": {"style": cell.border.right.style if cell.border and cell.border.right else ""},
+                "top": {"style": cell.border.top.style if cell.border and cell.border.top else ""},
+                "bottom": {"style": cell.border.bottom.style if cell.border and cell.border.bottom else ""}
+            },
+            "number_format": {
+                "format": cell.number_format if cell.number_format else ""
+            },
+            "protection": {
+                "locked": cell.protection.locked if cell.protection else True
+            }
+        }
+    
+    def _resolve_color(self, rgb, theme, tint) -> str:
+        try:
+            # Check RGB first
+            if rgb:
+                if rgb not in ['00000000', 'FF000000']:
+                    return rgb[2:] if len(rgb) == 8 else rgb
+            
+            # Handle theme colors
+            if theme is not None:
+                base_color = self.theme_colors.get(theme, '')
+                if base_color:
+                    # Apply tint if present
+                    if tint != 0:
+                        return self._apply_tint(base_color, tint)
+                    return base_color
+        except:
+            pass
+        
+        return ""
+    
+    def _apply_tint(self, rgb: str, tint: float) -> str:
+        """Apply tint to RGB color"""
+        try:
+            r, g, b = int(rgb[0:2], 16), int(rgb[2:4], 16), int(rgb[4:6], 16)
+            
+            if tint < 0:
+                # Darken
+                r = int(r * (1 + tint))
+                g = int(g * (1 + tint))
+                b = int(b * (1 + tint))
+            else:
+                # Lighten
+                r = int(r + (255 - r) * tint)
+                g = int(g + (255 - g) * tint)
+                b = int(b + (255 - b) * tint)
+            
+            return f"{r:02X}{g:02X}{b:02X}"
+        except:
+            return rgb
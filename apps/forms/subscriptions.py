@@ -0,0 +1,156 @@
+import hmac
+import logging
+import secrets
+from datetime import timedelta
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Form, GraphSubscription
+from .services import SharePointService
+
+
+logger = logging.getLogger(__name__)
+
+
+class GraphSubscriptionManager:
+    """Graph change notifications for the workbooks behind SharePoint forms.
+    
+    Graph only subscribes to whole drives, so there is one subscription per
+    site document library holding a form workbook. A notification says only
+    that something in the drive changed; a delta query of the drive then
+    lists the changed items, which are matched to forms by drive item ID.
+    """
+    
+    def __init__(self, service: SharePointService = None):
+        self.service = service or SharePointService()
+        self.graph = self.service.graph
+    
+    def sync_subscriptions(self, user, dry_run: bool = False) -> Dict:
+        """Subscribe to sites that gained forms, renew expiring subscriptions and drop unused ones"""
+        counts = {'created': 0, 'renewed': 0, 'deleted': 0, 'failed': 0}
+        urls = Form.objects.filter(source='sharepoint').exclude(url__isnull=True).exclude(url='').values_list('url', flat=True)
+        resolved = self.service._parse_sharepoint_urls(list(set(urls)))
+        site_ids = {value[0] for value in resolved.values() if not isinstance(value, Exception)}
+        # A site whose URLs failed to resolve this time may still have forms; keep its subscription
+        unresolved = any(isinstance(value, Exception) for value in resolved.values())
+        
+        existing = {subscription.site_id: subscription for subscription in GraphSubscription.objects.all()}
+        renew_before = timezone.now() + timedelta(seconds=settings.GRAPH_SUBSCRIPTION_RENEW_BEFORE)
+        actions = [('created', self._create, (site_id, user)) for site_id in sorted(site_ids - set(existing))]
+        for site_id, subscription in existing.items():
+            if site_id not in site_ids and not unresolved:
+                actions.append(('deleted', self._delete, (subscription,)))
+            elif site_id in site_ids and subscription.expires_at < renew_before:
+                actions.append(('renewed', self._renew, (subscription,)))
+        
+        for outcome, action, args in actions:
+            if dry_run:
+                counts[outcome] += 1
+                continue
+            try:
+                action(*args)
+                counts[outcome] += 1
+            except Exception as e:
+                logger.warning("Graph subscription not %s: %s", outcome, e)
+                counts['failed'] += 1
+        
+        return counts
+    
+    def subscription_for(self, notification: Dict) -> Optional[GraphSubscription]:
+        """The subscription a notification belongs to, or None if it is unknown or its clientState does not match"""
+        subscription = GraphSubscription.objects.filter(subscription_id=notification.get('subscriptionId') or '').first()
+        if subscription is None or not hmac.compare_digest(subscription.client_state, str(notification.get('clientState') or '')):
+            logger.warning("Ignoring Graph notification for unknown subscription %s", notification.get('subscriptionId'))
+            return None
+        return subscription
+    
+    def changed_forms(self, subscription: GraphSubscription) -> tuple:
+        """Forms whose workbooks changed since the subscription's last delta query.
+        
+        Returns (forms, next delta link). If Graph no longer accepts the delta
+        link, every form on the site is returned; their own eTag/cTag checks
+        then skip the unchanged ones.
+        """
+        item_ids = set()
+        url = subscription.delta_link
+        while url:
+            response = self.graph.get(url)
+            if response.status_code == 410:
+                logger.info("Delta link of drive %s expired; re-checking every form on the site", subscription.drive_id)
+                return self._site_forms(subscription.site_id), self._latest_delta_link(subscription.drive_id)
+            if response.status_code != 200:
+                raise Exception(f"Failed to get drive changes: {response.text}")
+            
+            page = response.json()
+            item_ids.update(item['id'] for item in page.get('value', []))
+            if '@odata.deltaLink' in page:
+                return list(Form.objects.filter(source='sharepoint', source_item_id__in=item_ids)), page['@odata.deltaLink']
+            url = page.get('@odata.nextLink')
+        
+        return self._site_forms(subscription.site_id), self._latest_delta_link(subscription.drive_id)
+    
+    def _create(self, site_id: str, user):
+        response = self.graph.get(f"/sites/{site_id}/drive", params={'$select': 'id'})
+        if response.status_code != 200:
+            raise Exception(f"Failed to get drive of site {site_id}: {response.text}")
+        drive_id = response.json()['id']
+        # Taken before subscribing so no change between the two is missed
+        delta_link = self._latest_delta_link(drive_id)
+        
+        client_state = secrets.token_hex(32)
+        response = self.graph.post('/subscriptions', json={
+            'changeType': 'updated',
+            'notificationUrl': settings.GRAPH_NOTIFICATION_URL,
+            'resource': f"/drives/{drive_id}/root",
+            'expirationDateTime': self._expiration().isoformat(),
+            'clientState': client_state
+        })
+        if response.status_code != 201:
+            raise Exception(f"Failed to subscribe to drive {drive_id}: {response.text}")
+        
+        created = response.json()
+        GraphSubscription.objects.create(
+            subscription_id=created['id'],
+            site_id=site_id,
+            drive_id=drive_id,
+            client_state=client_state,
+            expires_at=parse_datetime(created['expirationDateTime']),
+            delta_link=delta_link,
+            created_by=user
+        )
+    
+    def _renew(self, subscription: GraphSubscription):
+        response = self.graph.patch(
+            f"/subscriptions/{subscription.subscription_id}",
+            json={'expirationDateTime': self._expiration().isoformat()}
+        )
+        if response.status_code == 404:
+            # Expired before it was renewed; subscribe again on the next sync
+            subscription.delete()
+            raise Exception(f"Subscription {subscription.subscription_id} no longer exists")
+        if response.status_code != 200:
+            raise Exception(f"Failed to renew subscription {subscription.subscription_id}: {response.text}")
+        
+        subscription.expires_at = parse_datetime(response.json()['expirationDateTime'])
+        subscription.save(update_fields=['expires_at', 'updated_at'])
+    
+    def _delete(self, subscription: GraphSubscription):
+        response = self.graph.delete(f"/subscriptions/{subscription.subscription_id}")
+        if response.status_code not in (204, 404):
+            raise Exception(f"Failed to delete subscription {subscription.subscription_id}: {response.text}")
+        subscription.delete()
+    
+    def _expiration(self):
+        return timezone.now() + timedelta(seconds=settings.GRAPH_SUBSCRIPTION_LIFETIME)
+    
+    def _latest_delta_link(self, drive_id: str) -> str:
+        response = self.graph.get(f"/drives/{drive_id}/root/delta", params={'token': 'latest'})
+        if response.status_code != 200:
+            raise Exception(f"Failed to get delta link of drive {drive_id}: {response.text}")
+        return response.json()['@odata.deltaLink']
+    
+    def _site_forms(self, site_id: str) -> List[Form]:
+        forms = list(Form.objects.filter(source='sharepoint').exclude(url__isnull=True).exclude(url=''))
+        resolved = self.service._parse_sharepoint_urls(list({form.url for form in forms}))
+        return [form for form in forms if not isinstance(resolved[form.url], Exception) and resolved[form.url][0] == site_id]
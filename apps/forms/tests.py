@@ -0,0 +1,627 @@
+import copy
+import datetime
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+from unittest import mock
+from urllib.parse import urlsplit
+from django.core.cache import caches
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from openpyxl.utils.datetime import to_excel
+from rest_framework.test import APIClient
+from apps.organizations.models import Organization
+from apps.users.models import User
+from benchmarks.workbooks import SIZES, generate_workbook
+from .attachments import store_attachment
+from .blobs import content_hash
+from .deltas import apply_patch, make_patch
+from .display_format import _densify, compact_display_json, expand_display_json, sparse_display_json
+from .graph import GraphClient
+from .locks import _acquire, single_flight, single_flight_all
+from .models import Attachment, Form, FormData, FormDataEntry, FormDisplayVersion, FormEntryVersion, FormImportLock, VersionBlob
+from .services import SharePointService, WorkbookImportSession
+from .sources import LocalWorkbookSource, UploadedWorkbookSource
+from .versions import create_version, materialize
+
+
+def create_user(username: str = 'importer') -> User:
+    org = Organization.objects.create(org_name='Org')
+    # The first user is its own creator
+    with connection.constraint_checks_disabled():
+        user = User.objects.create(id=1, org=org, username=username, password='-', name=username, created_by_id=1)
+    return user
+
+
+@override_settings(WORKBOOK_PARSE_WORKERS=0)
+class StreamingExtractorTests(SimpleTestCase):
+    """The streaming extractor must produce exactly what openpyxl reads from the same workbook"""
+    
+    # Benchmark presets cut down to keep the suite quick; seeds vary merges, comments and hyperlinks
+    WORKBOOKS = {
+        'small': dict(SIZES['small']),
+        'medium': dict(SIZES['medium'], rows=150, entry_rows=60),
+        'sparse': dict(SIZES['sparse'], rows=400),
+        'styled': dict(SIZES['styled'], rows=120, styles=400, entry_rows=40),
+    }
+    SEEDS = (1, 2, 3)
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.workdir = tempfile.TemporaryDirectory()
+        cls.service = SharePointService()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.workdir.cleanup()
+        super().tearDownClass()
+    
+    def test_display_and_entry_match_openpyxl(self):
+        for name, params in self.WORKBOOKS.items():
+            for seed in self.SEEDS:
+                with self.subTest(workbook=name, seed=seed):
+                    file_name = f"{name}-{seed}.xlsx"
+                    generate_workbook(os.path.join(self.workdir.name, file_name), seed=seed, **params)
+                    
+                    streamed = self._extract(file_name, 'streaming')
+                    expected = self._extract(file_name, 'openpyxl')
+                    self.assertEqual(streamed['display'], expected['display'])
+                    # Entry rows are always streamed, whatever WORKBOOK_EXTRACTOR says
+                    self.assertEqual(streamed['entry'], self._openpyxl_entry(file_name, streamed['entry_sheet']))
+    
+    def _extract(self, file_name: str, extractor: str) -> dict:
+        with override_settings(WORKBOOK_EXTRACTOR=extractor):
+            source = LocalWorkbookSource(file_name, root=self.workdir.name)
+            with WorkbookImportSession(self.service, source) as session:
+                return session.extract_form()
+    
+    def test_invalid_workbook_closes_its_file(self):
+        workbook_file = io.BytesIO(b'not an xlsx archive')
+        with self.assertRaises(zipfile.BadZipFile):
+            WorkbookImportSession(self.service, UploadedWorkbookSource(workbook_file))
+        self.assertTrue(workbook_file.closed)
+    
+    def _openpyxl_entry(self, file_name: str, sheet_name: str) -> list:
+        """Entry rows of the sheet's used range read with openpyxl, with blanks and dates as Graph returns them"""
+        wb = load_workbook(os.path.join(self.workdir.name, file_name), data_only=True)
+        try:
+            ws = wb[sheet_name]
+            rows = ws.iter_rows(
+                min_row=ws.min_row, max_row=ws.max_row, min_col=ws.min_column, max_col=ws.max_column, values_only=True
+            )
+            values = [[_graph_value(value, wb.epoch) for value in row] for row in rows]
+        finally:
+            wb.close()
+        return self.service._rows_to_json_objects(values)
+
+
+@override_settings(WORKBOOK_PARSE_WORKERS=0)
+class DisplayFormatTests(SimpleTestCase):
+    """Stored display formats must expand back to exactly the legacy metadata extracted from the workbook"""
+    
+    WORKBOOKS = {
+        'small': dict(SIZES['small']),
+        'sparse': dict(SIZES['sparse'], rows=400),
+        'styled': dict(SIZES['styled'], rows=120, styles=400, entry_rows=40),
+    }
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.legacy = {}
+        service = SharePointService()
+        with tempfile.TemporaryDirectory() as workdir:
+            for name, params in cls.WORKBOOKS.items():
+                file_name = f"{name}.xlsx"
+                generate_workbook(os.path.join(workdir, file_name), **params)
+                with WorkbookImportSession(service, LocalWorkbookSource(file_name, root=workdir)) as session:
+                    cls.legacy[name] = session.get_display_sheet_metadata('Display')
+                if name == 'sparse':
+                    cls.theme_fills = _theme_fills(os.path.join(workdir, file_name))
+    
+    def test_fixture_covers_merged_cells_empty_rows_and_theme_colours(self):
+        legacy = self.legacy['sparse']
+        self.assertTrue(legacy['merged_cells'])
+        values = {}
+        for cell in legacy['cells']:
+            values.setdefault(cell['row'], []).append(cell['value'])
+        self.assertTrue(any(all(value is None for value in row) for row in values.values()))
+        self.assertTrue(self.theme_fills)
+        self.assertTrue(all(legacy['cells'][self._index(legacy, row, col)]['fill']['color'] for row, col in self.theme_fills))
+    
+    def test_compact_round_trip(self):
+        for name, legacy in self.legacy.items():
+            with self.subTest(workbook=name):
+                original = copy.deepcopy(legacy)
+                compact = compact_display_json(legacy)
+                self.assertEqual(compact['format'], 'compact')
+                self.assertLess(len(compact['styles']), len(compact['cells']))
+                self.assertIs(compact_display_json(compact), compact)
+                # Versions are stored as JSON, so the round trip goes through it too
+                self.assertEqual(expand_display_json(json.loads(json.dumps(compact))), legacy)
+                self.assertEqual(legacy, original)
+    
+    def test_sparse_round_trip(self):
+        for name, legacy in self.legacy.items():
+            with self.subTest(workbook=name):
+                compact = compact_display_json(legacy)
+                sparse = sparse_display_json(legacy)
+                self.assertEqual(sparse['format'], 'sparse')
+                self.assertLess(len(sparse['cells']), len(compact['cells']))
+                self.assertEqual(_densify(sparse), compact)
+                self.assertEqual(compact_display_json(sparse), compact)
+                self.assertEqual(sparse_display_json(compact), sparse)
+                self.assertEqual(expand_display_json(json.loads(json.dumps(sparse))), legacy)
+    
+    def test_sparse_omits_blank_and_merged_cells(self):
+        legacy = self.legacy['sparse']
+        sparse = sparse_display_json(legacy)
+        stored = {(cell['row'], cell['column']) for cell in sparse['cells']}
+        merged = [
+            (cell['row'], cell['column']) for cell in compact_display_json(legacy)['cells'] if cell.get('merged')
+        ]
+        self.assertTrue(merged)
+        self.assertFalse(stored & set(merged))
+        empty_rows = set(range(legacy['dimensions']['rows'])) - {row for row, _ in stored}
+        self.assertTrue(empty_rows)
+    
+    def _index(self, legacy: dict, row: int, col: int) -> int:
+        return row * legacy['dimensions']['columns'] + col
+
+
+@override_settings(GRAPH_BATCH_SIZE=20, GRAPH_MAX_RETRIES=4)
+class GraphBatchTests(SimpleTestCase):
+    """GraphClient.batch against a session that answers each $batch sub-request through `respond`"""
+    
+    def setUp(self):
+        self.calls = []
+        self.throttled = {}
+        self.dropped = set()
+        session = mock.Mock()
+        session.request.side_effect = self._session_request
+        # Creates the shared semaphores, then routes every call to the fake session
+        GraphClient.get_session()
+        patcher = mock.patch.object(GraphClient, 'get_session', return_value=session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sleep = mock.patch('apps.forms.graph.time.sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+        self.client = GraphClient(base_url='https://graph.test/v1.0', token_provider=lambda: 'token')
+    
+    def test_requests_are_sent_in_chunks_of_twenty(self):
+        responses = self.client.batch([{'url': f"items/{index}"} for index in range(45)])
+        
+        self.assertEqual([len(call['json']['requests']) for call in self.calls], [20, 20, 5])
+        self.assertEqual([response.json() for response in responses], [{'url': f"/items/{index}"} for index in range(45)])
+    
+    def test_lone_request_is_sent_plainly(self):
+        responses = self.client.batch([{'url': 'items/1', 'params': {'$select': 'id,name'}}])
+        
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.calls[0]['method'], 'GET')
+        self.assertEqual(self.calls[0]['url'], 'https://graph.test/v1.0/items/1?$select=id,name')
+        self.assertEqual(responses[0].status_code, 200)
+    
+    def test_throttled_sub_responses_are_retried(self):
+        self.throttled = {'1': 1, '2': 2}
+        responses = self.client.batch([{'url': f"items/{index}"} for index in range(3)])
+        
+        self.assertEqual([response.status_code for response in responses], [200, 200, 200])
+        self.assertEqual(responses[1].json(), {'url': '/items/1'})
+        # Both throttled requests go out in one batch, then the one still throttled on its own
+        self.assertEqual(self._ids(self.calls[1]), ['1', '2'])
+        self.assertEqual(self.calls[2]['url'], 'https://graph.test/v1.0/items/2')
+        self.sleep.assert_called_with(0.0)
+    
+    def test_throttled_response_is_returned_once_retries_run_out(self):
+        self.throttled = {'1': 10}
+        with override_settings(GRAPH_MAX_RETRIES=1):
+            responses = self.client.batch([{'url': f"items/{index}"} for index in range(3)])
+        
+        self.assertEqual([response.status_code for response in responses], [200, 429, 200])
+    
+    def test_missing_sub_response_raises(self):
+        self.dropped = {'1'}
+        with self.assertRaisesMessage(Exception, 'missing 1 request'):
+            self.client.batch([{'url': f"items/{index}"} for index in range(3)])
+    
+    def _session_request(self, method, url, headers=None, **kwargs):
+        self.calls.append(dict(kwargs, method=method, url=url))
+        if not url.endswith('/$batch'):
+            return self._response(self._respond(urlsplit(url).path.split('/v1.0', 1)[1]))
+        
+        items = [
+            dict(self._respond(item['url']), id=item['id'])
+            for item in kwargs['json']['requests'] if item['id'] not in self.dropped
+        ]
+        return self._response({'status': 200, 'body': {'responses': items}})
+    
+    def _respond(self, path: str) -> dict:
+        """Sub-response for `/items/<index>`, throttled while its index has throttles left"""
+        index = path.rsplit('/', 1)[-1]
+        if self.throttled.get(index):
+            self.throttled[index] -= 1
+            return {'status': 429, 'headers': {'Retry-After': '0'}, 'body': {'error': 'throttled'}}
+        return {'status': 200, 'body': {'url': path}}
+    
+    def _response(self, item: dict):
+        response = mock.Mock(status_code=item['status'], headers=item.get('headers', {}))
+        response.json.return_value = item['body']
+        return response
+    
+    def _ids(self, call: dict) -> list:
+        return [item['id'] for item in call['json']['requests']]
+
+
+class PatchTests(SimpleTestCase):
+    """Every historical version is rebuilt with apply_patch, so patches must round-trip exactly"""
+    
+    DOCUMENT = {
+        'title': 'Inspection',
+        'rows': [[1, 'a', None], [2, 'b', 3.5], [3, 'c', True]],
+        'merged': [{'range': 'A1:B1', 'cells': ['A1', 'B1']}],
+        'meta': {'version': 1, 'tags': ['x', 'y']},
+    }
+    
+    def assertRoundTrip(self, source, target):
+        original = copy.deepcopy(source)
+        patch = make_patch(source, target)
+        result = apply_patch(source, patch)
+        self.assertEqual(result, target)
+        self.assertEqual(_types(result), _types(target))
+        # The base document is shared, never modified
+        self.assertEqual(source, original)
+        return patch
+    
+    def test_set_and_remove_keys(self):
+        target = copy.deepcopy(self.DOCUMENT)
+        target['title'] = 'Inspection v2'
+        target['footer'] = 'new'
+        del target['merged']
+        patch = self.assertRoundTrip(self.DOCUMENT, target)
+        self.assertEqual(sorted(operation['op'] for operation in patch), ['remove', 'set', 'set'])
+    
+    def test_splice_inserts_and_deletes_list_items(self):
+        inserted = copy.deepcopy(self.DOCUMENT)
+        inserted['rows'].insert(1, [9, 'z', None])
+        patch = self.assertRoundTrip(self.DOCUMENT, inserted)
+        self.assertEqual(patch, [{'op': 'splice', 'path': ['rows'], 'start': 1, 'delete': 0, 'insert': [[9, 'z', None]]}])
+        
+        deleted = copy.deepcopy(self.DOCUMENT)
+        del deleted['rows'][0]
+        self.assertRoundTrip(self.DOCUMENT, deleted)
+        self.assertRoundTrip(self.DOCUMENT, dict(self.DOCUMENT, rows=[]))
+    
+    def test_nested_lists_are_patched_in_place(self):
+        target = copy.deepcopy(self.DOCUMENT)
+        target['rows'][1][2] = 4.5
+        target['merged'][0]['cells'].append('C1')
+        target['meta']['tags'][0] = 'w'
+        patch = self.assertRoundTrip(self.DOCUMENT, target)
+        self.assertIn({'op': 'set', 'path': ['rows', 1, 2], 'value': 4.5}, patch)
+    
+    def test_type_changes(self):
+        for old, new in [(1, True), (1, 1.0), (0, False), (1, '1'), ([1], {'0': 1}), ({'a': 1}, [1]), (None, []), ('a', None)]:
+            with self.subTest(old=old, new=new):
+                self.assertRoundTrip({'value': old, 'rows': [old]}, {'value': new, 'rows': [new]})
+        self.assertRoundTrip([1, 2], {'rows': [1, 2]})
+    
+    def test_identical_documents_give_an_empty_patch(self):
+        self.assertEqual(self.assertRoundTrip(self.DOCUMENT, copy.deepcopy(self.DOCUMENT)), [])
+
+
+@override_settings(FORM_VERSION_SNAPSHOT_INTERVAL=10)
+class VersionDeltaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+    
+    def setUp(self):
+        self.form = Form.objects.create(form_name='Form', created_by=self.user)
+    
+    def test_superseded_version_drops_its_blob(self):
+        first = _display(rows=200)
+        second = _display(rows=200, changed=5)
+        v1 = self._create(first, 1)
+        blob_id = v1.blob_id
+        self._create(second, 2, previous=v1)
+        
+        v1.refresh_from_db()
+        self.assertIsNone(v1.blob_id)
+        self.assertIsNotNone(v1.delta_base_id)
+        self.assertFalse(VersionBlob.objects.filter(id=blob_id).exists())
+        self.assertEqual(materialize(v1), first)
+    
+    def test_blob_shared_with_another_version_is_kept(self):
+        first = _display(rows=200)
+        other_form = Form.objects.create(form_name='Copy', created_by=self.user)
+        create_version(FormDisplayVersion, other_form, first, content_hash(first), 1, self.user, self.user)
+        v1 = self._create(first, 1)
+        self._create(_display(rows=200, changed=5), 2, previous=v1)
+        
+        v1.refresh_from_db()
+        self.assertIsNone(v1.blob_id)
+        self.assertTrue(VersionBlob.objects.filter(content_hash=content_hash(first)).exists())
+    
+    def _create(self, content, number, previous=None):
+        return create_version(FormDisplayVersion, self.form, content, content_hash(content), number, self.user, self.user, previous=previous)
+
+
+@override_settings(CACHES={
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f"metadata-tests-{alias}"}
+    for alias in ('default', 'shared', 'versions', 'metadata')
+})
+class FormMetadataTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+    
+    def setUp(self):
+        for alias in ('shared', 'metadata'):
+            caches[alias].clear()
+        self.form = Form.objects.create(form_name='Form', created_by=self.user)
+        display = _display(rows=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.version = create_version(FormDisplayVersion, self.form, display, content_hash(display), 1, self.user, self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('get_form_metadata', args=[self.form.id, 'display'])
+    
+    def test_matching_etag_returns_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['display_data'], _display(rows=3))
+        etag = response['ETag']
+        
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        # Each metadata type is its own representation
+        both = reverse('get_form_metadata', args=[self.form.id, 'both'])
+        self.assertEqual(self.client.get(both, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_saving_a_version_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        
+        self.version.approved = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.version.save()
+        
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertTrue(response.json()['display_version']['approved'])
+    
+    def test_state_is_dropped_only_when_the_save_commits(self):
+        etag = self.client.get(self.url)['ETag']
+        
+        self.version.approved = True
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.version.save()
+            # Until the commit, other requests may still be served the committed state
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertTrue(callbacks)
+        
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AttachmentTests(TestCase):
+    """Attachments are written under userUploads/ relative to the working directory, here a temporary one"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.form = Form.objects.create(form_name='Form', created_by=cls.user)
+        entry = [{'id': 3, 'name': 'Photo'}, {'id': 5, 'name': 'Report'}]
+        cls.version = create_version(FormEntryVersion, cls.form, entry, content_hash(entry), 1, cls.user, cls.user)
+    
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(workdir.name)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('get_form_entries', args=[self.form.id])
+    
+    def test_store_attachment_writes_and_indexes_the_file(self):
+        form_data = self._entry()
+        attachment = store_attachment(form_data, 3, 'photo.png', b'image')
+        
+        self.assertEqual(attachment.path, os.path.join('userUploads', str(self.form.id), str(form_data.id), '3', 'photo.png'))
+        with open(attachment.path, 'rb') as f:
+            self.assertEqual(f.read(), b'image')
+        self.assertEqual(attachment.field_id, '3')
+        self.assertEqual(attachment.size, 5)
+        self.assertEqual(attachment.content_type, 'image/png')
+        self.assertEqual(attachment.content_hash, hashlib.sha256(b'image').hexdigest())
+        
+        # Writing the same file again replaces its row
+        again = store_attachment(form_data, 3, 'photo.png', b'new image')
+        self.assertEqual(again.id, attachment.id)
+        self.assertEqual(Attachment.objects.get(form_data=form_data).size, 9)
+    
+    def test_entries_list_attachments_by_field_in_upload_order(self):
+        first, second = self._entry(), self._entry()
+        photos = [store_attachment(first, 3, name, b'image').path for name in ('b.png', 'a.png')]
+        report = store_attachment(first, 5, 'report.pdf', b'report').path
+        other_user = User.objects.create(org=self.user.org, username='other', password='-', name='other', created_by=self.user)
+        self._entry(user=other_user)
+        
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['columns'], {'3': 'Photo', '5': 'Report'})
+        self.assertEqual(payload['count'], 2)
+        entries = {entry['id']: entry for entry in payload['entries']}
+        self.assertEqual(list(entries), [second.id, first.id])
+        self.assertEqual(entries[first.id]['attachments'], {'3': photos, '5': [report]})
+        self.assertEqual(entries[second.id]['attachments'], {})
+        self.assertEqual(entries[first.id]['form_data_entry_id'], first.form_data_entry_id)
+        self.assertEqual(entries[first.id]['created_by'], self.user.id)
+    
+    def test_entry_listing_queries_do_not_grow_with_entries(self):
+        store_attachment(self._entry(), 3, 'photo.png', b'image')
+        with CaptureQueriesContext(connection) as one_entry:
+            self.client.get(self.url)
+        
+        for _ in range(3):
+            store_attachment(self._entry(), 3, 'photo.png', b'image')
+        with self.assertNumQueries(len(one_entry)):
+            self.client.get(self.url)
+    
+    def _entry(self, user=None) -> FormData:
+        user = user or self.user
+        form_data_entry = FormDataEntry.objects.create(
+            user=user, form=self.form, form_entry_version=self.version, created_by=user
+        )
+        return FormData.objects.create(
+            form_data_entry=form_data_entry, user=user, form=self.form, form_entry_version=self.version,
+            form_values_json={'3': 'x'}, observation_number=1, created_by=user
+        )
+
+
+@override_settings(FORM_IMPORT_LOCK_POLL_INTERVAL=0, FORM_IMPORT_LOCK_WAIT=60, FORM_IMPORT_LOCK_TIMEOUT=60)
+class ImportLockTests(TestCase):
+    """Another import holding the lock is played by a row its test writes, released from `on_wait`"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+    
+    def setUp(self):
+        self.form = Form.objects.create(form_name='Form', created_by=self.user)
+        self.imports = 0
+    
+    def test_free_lock_runs_the_import_and_publishes_its_result(self):
+        self.assertEqual(single_flight(self.form.id, self._import), {'import': 1})
+        
+        lock = FormImportLock.objects.get(form=self.form)
+        self.assertIsNone(lock.token)
+        self.assertIsNone(lock.expires_at)
+        self.assertEqual(lock.result, {'import': 1})
+        self.assertIsNotNone(lock.finished_at)
+    
+    def test_waiter_reuses_a_result_finished_after_it_arrived(self):
+        self._hold()
+        result = single_flight(self.form.id, self._import, on_wait=self._release({'import': 'other'}))
+        self.assertEqual(result, {'import': 'other'})
+        self.assertEqual(self.imports, 0)
+    
+    def test_result_finished_before_arrival_is_not_reused(self):
+        self._hold()
+        before = timezone.now() - datetime.timedelta(seconds=1)
+        result = single_flight(self.form.id, self._import, on_wait=self._release({'import': 'stale'}, finished_at=before))
+        self.assertEqual(result, {'import': 1})
+        
+        # Nor is one left by an import that ended before this caller arrived
+        self.assertEqual(single_flight(self.form.id, self._import), {'import': 2})
+    
+    def test_failed_import_shares_no_result(self):
+        self._hold()
+        result = single_flight(self.form.id, self._import, on_wait=self._release(None))
+        self.assertEqual(result, {'import': 1})
+    
+    def test_unshared_import_waits_and_runs_its_own(self):
+        self._hold()
+        result = single_flight(self.form.id, self._import, share=False, on_wait=self._release({'import': 'other'}))
+        self.assertEqual(result, {'import': 1})
+        self.assertEqual(FormImportLock.objects.get(form=self.form).result, None)
+    
+    def test_contended_lock_times_out(self):
+        self._hold()
+        with override_settings(FORM_IMPORT_LOCK_WAIT=0):
+            with self.assertRaises(Exception):
+                single_flight(self.form.id, self._import, on_wait=lambda: time.sleep(0.01))
+        self.assertEqual(self.imports, 0)
+        self.assertEqual(FormImportLock.objects.get(form=self.form).token, 'other')
+    
+    def test_expired_lease_is_taken_over(self):
+        self._hold(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        waits = []
+        self.assertEqual(single_flight(self.form.id, self._import, on_wait=lambda: waits.append(1)), {'import': 1})
+        self.assertEqual(waits, [])
+    
+    def test_acquire_creates_the_row_once(self):
+        self.assertTrue(_acquire(FormImportLock, 'first', form_id=self.form.id))
+        # The insert of a second caller hits the primary key; it must not break the surrounding transaction
+        self.assertFalse(_acquire(FormImportLock, 'second', form_id=self.form.id))
+        self.assertEqual(FormImportLock.objects.get(form=self.form).token, 'first')
+    
+    def test_single_flight_all_holds_every_lock(self):
+        other = Form.objects.create(form_name='Other', created_by=self.user)
+        
+        def import_forms():
+            held = FormImportLock.objects.filter(form_id__in=[self.form.id, other.id], token__isnull=False)
+            self.assertEqual(held.count(), 2)
+            return {'forms': 2}
+        
+        self.assertEqual(single_flight_all([other.id, self.form.id], import_forms), {'forms': 2})
+        self.assertFalse(FormImportLock.objects.filter(token__isnull=False).exists())
+        self.assertFalse(FormImportLock.objects.filter(result__isnull=False).exists())
+    
+    def _import(self) -> dict:
+        self.imports += 1
+        return {'import': self.imports}
+    
+    def _hold(self, expires_at=None):
+        FormImportLock.objects.create(
+            form=self.form, token='other', acquired_at=timezone.now(),
+            expires_at=expires_at or timezone.now() + datetime.timedelta(seconds=60)
+        )
+    
+    def _release(self, result, finished_at=None):
+        def on_wait():
+            FormImportLock.objects.filter(form=self.form, token='other').update(
+                token=None, expires_at=None, result=result, finished_at=finished_at or timezone.now()
+            )
+        return on_wait
+
+
+def _graph_value(value, epoch):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time, datetime.timedelta)):
+        return to_excel(value, epoch)
+    return value
+
+
+def _theme_fills(path: str) -> list:
+    """Zero-based (row, column) of the display cells filled with a tinted theme colour"""
+    wb = load_workbook(path)
+    try:
+        return [
+            (cell.row - 1, cell.column - 1) for row in wb['Display'].iter_rows() for cell in row
+            if cell.fill.fgColor.type == 'theme' and cell.fill.fgColor.tint
+        ]
+    finally:
+        wb.close()
+
+
+def _display(rows: int, changed: int = None) -> dict:
+    return {'cells': [[f"r{row}c{column}" if row != changed else 'edited' for column in range(5)] for row in range(rows)]}
+
+
+def _types(document):
+    if isinstance(document, dict):
+        return {key: _types(value) for key, value in document.items()}
+    if isinstance(document, list):
+        return [_types(value) for value in document]
+    return type(document).__name__
@@ -5,6 +5,10 @@ urlpatterns = [
     path('', views.get_forms_list, name='get_forms_list'),
     path('create/', views.create_form_from_sharepoint, name='create_form_from_sharepoint'),
     path('update/', views.update_form_from_sharepoint, name='update_form_from_sharepoint'),
+    path('upload/', views.upload_form_workbook, name='upload_form_workbook'),
+    path('import-workbook/', views.import_workbook_from_sharepoint, name='import_workbook_from_sharepoint'),
+    path('jobs/<int:job_id>/', views.get_import_job, name='get_import_job'),
+    path('graph-notifications/', views.receive_graph_notifications, name='receive_graph_notifications'),
     path('<int:form_id>/metadata/<str:metadata_type>/', views.get_form_metadata, name='get_form_metadata'),
     path('data/save/', views.save_form_data, name='save_form_data'),
     path('<int:form_id>/entries/', views.get_form_entries, name='get_form_entries'),
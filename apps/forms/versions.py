@@ -0,0 +1,186 @@
+from django.conf import settings
+from django.core.cache import caches
+from .blobs import canonical_json, content_hash, store_blob
+from .cache import FormMetadataCache
+from .deltas import apply_patch, make_patch
+from .models import Form, FormDisplayVersion, FormEntryVersion, VersionBlob
+
+
+INLINE_FIELDS = {
+    FormDisplayVersion: 'inline_display_json',
+    FormEntryVersion: 'inline_entry_json',
+}
+
+# Form fields pointing at the latest version of each model
+CURRENT_FIELDS = {
+    FormDisplayVersion: 'current_display_version',
+    FormEntryVersion: 'current_entry_version',
+}
+
+
+def create_version(model, form: Form, content, digest: str, number: int, created_by, updated_by, previous=None, snapshot=None, source=None):
+    """Create the latest version of a form with its full content and point the form at it.
+    
+    The previous latest version is then stored as a patch against the new one,
+    so the latest version is always read from a single blob and older versions
+    are rebuilt backwards from it.
+    """
+    version = model.objects.create(
+        form=form,
+        blob=store_blob(content, digest),
+        content_hash=digest,
+        snapshot=snapshot,
+        source=source,
+        form_version=str(number),
+        version_number=number,
+        approved=False,
+        created_by=created_by,
+        updated_by=updated_by
+    )
+    # Only the pointer is written; a full save could undo a concurrent edit of the form, and sends no post_save
+    Form.objects.filter(id=form.id).update(**{CURRENT_FIELDS[model]: version})
+    setattr(form, CURRENT_FIELDS[model], version)
+    FormMetadataCache().invalidate(form.id)
+    
+    if previous is not None:
+        store_as_delta(previous, version, content)
+    return version
+
+
+def current_version(form: Form, model, *related, defer=()):
+    """The latest version of a form, found through the form's current-version pointer.
+    
+    Uses the pointed-to row if it was loaded with the form (select_related);
+    otherwise fetches it by primary key with `related` and `defer` applied.
+    """
+    field = CURRENT_FIELDS[model]
+    pointer_id = getattr(form, f"{field}_id")
+    if pointer_id and Form._meta.get_field(field).is_cached(form):
+        return getattr(form, field)
+    
+    versions = model.objects.select_related(*related).defer(*defer)
+    if pointer_id:
+        return versions.filter(id=pointer_id).first()
+    # Forms imported before the pointers existed, until backfill_current_versions has run
+    return versions.filter(form=form).order_by('-version_number', '-id').first()
+
+
+def version_number(version) -> int:
+    """A version's number; rows from before version_number existed fall back to form_version"""
+    if version.version_number is not None:
+        return version.version_number
+    return int(version.form_version) if version.form_version.isdigit() else 0
+
+
+def store_as_delta(version, base, base_content) -> bool:
+    """Replace a version's full content with a patch that rebuilds it from `base`.
+    
+    Every FORM_VERSION_SNAPSHOT_INTERVAL-th version stays a full snapshot to
+    bound the patches applied on read, and so does any version whose patch
+    would not be much smaller than the content itself.
+    """
+    if version.delta_base_id or _is_snapshot(version):
+        return False
+    
+    content = full_content(version)
+    encoded = canonical_json(content)
+    patch = make_patch(base_content, content)
+    if len(canonical_json(patch)) > len(encoded) * settings.FORM_VERSION_DELTA_MAX_RATIO:
+        return False
+    # The patch format cannot express every JSON type change; never store one that does not round-trip
+    if canonical_json(apply_patch(base_content, patch)) != encoded:
+        return False
+    
+    inline_field = INLINE_FIELDS[type(version)]
+    blob_id = version.blob_id
+    version.delta = patch
+    version.delta_base = base
+    version.blob = None
+    setattr(version, inline_field, None)
+    version.save(update_fields=['delta', 'delta_base', 'blob', inline_field])
+    if blob_id:
+        _delete_unreferenced_blob(blob_id)
+    return True
+
+
+def replace_content(version, content, digest: str):
+    """Replace a version's content in place, e.g. after re-extracting its workbook snapshot.
+    
+    Versions stored as patches against this one are rebuilt from its old
+    content first and then encoded against the new one.
+    """
+    model = type(version)
+    dependents = [(dependent, materialize(dependent)) for dependent in model.objects.filter(delta_base=version)]
+    base = version.delta_base
+    
+    _store_full(version, content, digest)
+    if base is not None:
+        store_as_delta(version, base, materialize(base))
+    
+    for dependent, dependent_content in dependents:
+        _store_full(dependent, dependent_content, dependent.content_hash or content_hash(dependent_content))
+        store_as_delta(dependent, version, content)
+
+
+def full_content(version):
+    """Content of a version stored in full, as a blob or inline"""
+    return version.blob.content if version.blob_id else getattr(version, INLINE_FIELDS[type(version)])
+
+
+def materialize(version):
+    """Content of any version, rebuilding delta versions from the next full one.
+    
+    Rebuilt versions are kept in the FORM_VERSION_CACHE_ALIAS cache, which
+    also serves as a starting point for rebuilding older versions.
+    """
+    if not version.delta_base_id:
+        return full_content(version)
+    
+    cache = caches[settings.FORM_VERSION_CACHE_ALIAS]
+    content = cache.get(_cache_key(version))
+    if content is not None:
+        return content
+    
+    model = type(version)
+    chain = [version]
+    while True:
+        current = model.objects.defer(INLINE_FIELDS[model]).get(id=chain[-1].delta_base_id)
+        if not current.delta_base_id:
+            content = full_content(current)
+            break
+        content = cache.get(_cache_key(current))
+        if content is not None:
+            break
+        chain.append(current)
+    
+    for delta_version in reversed(chain):
+        content = apply_patch(content, delta_version.delta)
+    
+    cache.set(_cache_key(version), content, settings.FORM_VERSION_CACHE_TIMEOUT)
+    return content
+
+
+def _store_full(version, content, digest: str):
+    inline_field = INLINE_FIELDS[type(version)]
+    version.blob = store_blob(content, digest)
+    version.content_hash = digest
+    version.delta = None
+    version.delta_base = None
+    setattr(version, inline_field, None)
+    version.save(update_fields=['blob', 'content_hash', 'delta', 'delta_base', inline_field])
+
+
+def _delete_unreferenced_blob(blob_id: int):
+    # Identical content of another version or form shares the blob; it is only dropped once nothing points at it
+    VersionBlob.objects.filter(id=blob_id, entry_versions__isnull=True, display_versions__isnull=True).delete()
+
+
+def _is_snapshot(version) -> bool:
+    if version.version_number is None and not version.form_version.isdigit():
+        return True
+    return version_number(version) % settings.FORM_VERSION_SNAPSHOT_INTERVAL == 0
+
+
+def _cache_key(version) -> str:
+    # Keyed by content as well: re-extraction can replace a version's content in place
+    return f"form_version:{version._meta.db_table}:{version.id}:{version.content_hash}"
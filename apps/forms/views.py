@@ -1,19 +1,29 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from django.conf import settings
 from django.db import transaction
-from .models import Form, FormDisplayVersion, FormEntryVersion, FormData, FormDataHistory, UserFormAccess, FormDataEntry
-from apps.permissions.models import Role
-from .serializers import SharePointMetadataSerializer, FormSerializer
-from .services import SharePointService
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+from .attachments import attachment_paths, store_attachment
+from .cache import FormMetadataCache
+from .models import Form, FormDisplayVersion, FormEntryVersion, FormData, FormDataHistory, UserFormAccess, FormDataEntry, ImportJob
+from .serializers import SharePointMetadataSerializer, FormSerializer, ImportJobSerializer
+from .jobs import ImportJobRunner
+from .sources import store_upload
+from .subscriptions import GraphSubscriptionManager
+from .versions import current_version
+from .display_format import DISPLAY_FORMATS, LEGACY_FORMAT, fill_display_values, to_display_format
 import json
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_form_from_sharepoint(request):
-    """Create new form from SharePoint URL"""
+    """Queue creation of a new form from a SharePoint URL"""
     try:
         user = request.user
         form_name = request.data.get('form_name')
@@ -25,38 +35,23 @@ def create_form_from_sharepoint(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        sharepoint_service = SharePointService()
-        
-        # Process SharePoint URL with new flow
-        result = sharepoint_service.create_new_form(
-            sharepoint_url,
-            form_name,
-            created_by=user,
-            updated_by=user,
-            custom_scripts=request.data.get('custom_scripts', []),
-            observation_count=request.data.get('observation_count', 1)
-        )
-        
-        # Grant admin access to creator
-        admin_role = Role.objects.get(role_name='Form Admin')
-        UserFormAccess.objects.create(
-            user=user,
-            form_id=result['form_id'],
-            role=admin_role,
-            created_by=user
+        # Download and parsing run in the background; poll the job for the result
+        job = ImportJobRunner.enqueue(
+            ImportJob.CREATE,
+            {
+                'sharepoint_url': sharepoint_url,
+                'form_name': form_name,
+                'custom_scripts': request.data.get('custom_scripts', []),
+                'observation_count': request.data.get('observation_count', 1)
+            },
+            user
         )
         
         return Response({
-            'message': 'Form created successfully from SharePoint',
-            'form_id': result['form_id'],
-            'form_name': result['form_name'],
-            'display_version': result['display_version'],
-            'entry_version': result['entry_version'],
-            'worksheets': {
-                'display': result['display_sheet'],
-                'entry': result['entry_sheet']
-            }
-        }, status=status.HTTP_201_CREATED)
+            'message': 'Form import queued',
+            'job_id': job.id,
+            'status': job.status
+        }, status=status.HTTP_202_ACCEPTED)
         
     except Exception as e:
         return Response(
@@ -68,7 +63,7 @@ def create_form_from_sharepoint(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def update_form_from_sharepoint(request):
-    """Update existing form from SharePoint URL"""
+    """Queue an update of an existing form from its SharePoint URL"""
     try:
         form_id = request.data.get('form_id')
         
@@ -78,39 +73,35 @@ def update_form_from_sharepoint(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        sharepoint_service = SharePointService()
+        form = Form.objects.get(id=form_id)
         
         # Update custom_scripts or observation_count if provided
         custom_scripts = request.data.get('custom_scripts')
         observation_count = request.data.get('observation_count')
         
         if custom_scripts is not None or observation_count is not None:
-            form = Form.objects.get(id=form_id)
             if custom_scripts is not None:
                 form.custom_scripts = custom_scripts
             if observation_count is not None:
                 form.observation_count = observation_count
             form.updated_by = request.user
-            form.save()
-        
-        # Update existing form
-        result = sharepoint_service.update_existing_form(
-            form_id,
-            updated_by=request.user
+            form.save(update_fields=['custom_scripts', 'observation_count', 'updated_by', 'updated_at'])
+        
+        # Update existing form in the background
+        # Unchanged workbooks (same cTag/eTag) are skipped unless force is set
+        job = ImportJobRunner.enqueue(
+            ImportJob.UPDATE,
+            {'force': bool(request.data.get('force', False))},
+            request.user,
+            form=form
         )
         
         return Response({
-            'message': 'Form updated successfully from SharePoint',
-            'form_id': result['form_id'],
-            'form_name': result['form_name'],
-            'display_version': result['display_version'],
-            'entry_version': result['entry_version'],
-            'versions_updated': result['versions_updated'],
-            'worksheets': {
-                'display': result['display_sheet'],
-                'entry': result['entry_sheet']
-            }
-        }, status=status.HTTP_200_OK)
+            'message': 'Form update queued',
+            'form_id': form.id,
+            'job_id': job.id,
+            'status': job.status
+        }, status=status.HTTP_202_ACCEPTED)
         
     except Form.DoesNotExist:
         return Response(
@@ -124,6 +115,201 @@ def update_form_from_sharepoint(request):
         )
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_workbook_from_sharepoint(request):
+    """Queue creation or update of every form in a multi-form SharePoint workbook"""
+    try:
+        sharepoint_url = request.data.get('sharepoint_url')
+        form_names = request.data.get('form_names') or {}
+        
+        if not sharepoint_url:
+            return Response(
+                {'error': 'sharepoint_url is required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not isinstance(form_names, dict):
+            return Response(
+                {'error': 'form_names must map sheet keys to form names'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Display/entry sheet pairs are matched by name; one download and parse covers all forms
+        job = ImportJobRunner.enqueue(
+            ImportJob.WORKBOOK,
+            {
+                'sharepoint_url': sharepoint_url,
+                'form_names': form_names,
+                'custom_scripts': request.data.get('custom_scripts', []),
+                'observation_count': request.data.get('observation_count', 1),
+                'force': bool(request.data.get('force', False))
+            },
+            request.user
+        )
+        
+        return Response({
+            'message': 'Workbook import queued',
+            'job_id': job.id,
+            'status': job.status
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to import workbook: {str(e)}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_form_workbook(request):
+    """Queue creation of a form, or of a new version of one, from an uploaded xlsx file"""
+    try:
+        user = request.user
+        uploaded_file = request.FILES.get('file')
+        form_id = request.data.get('form_id')
+        form_name = request.data.get('form_name')
+        
+        if not uploaded_file or not (form_id or form_name):
+            return Response(
+                {'error': 'file and either form_id or form_name are required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not uploaded_file.name.lower().endswith('.xlsx'):
+            return Response(
+                {'error': 'Only .xlsx workbooks are supported'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if uploaded_file.size > settings.WORKBOOK_UPLOAD_MAX_SIZE:
+            return Response(
+                {'error': f'Workbook exceeds {settings.WORKBOOK_UPLOAD_MAX_SIZE} bytes'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Multipart fields arrive as strings
+        custom_scripts = request.data.get('custom_scripts')
+        if isinstance(custom_scripts, str):
+            custom_scripts = json.loads(custom_scripts) if custom_scripts else None
+        observation_count = request.data.get('observation_count')
+        
+        if not form_id:
+            # Parsing runs in the background from a copy on disk; poll the job for the result
+            job = ImportJobRunner.enqueue(
+                ImportJob.UPLOAD,
+                {
+                    'file': store_upload(uploaded_file),
+                    'form_name': form_name,
+                    'custom_scripts': custom_scripts or [],
+                    'observation_count': int(observation_count) if observation_count else 1
+                },
+                user
+            )
+            
+            return Response({
+                'message': 'Uploaded workbook import queued',
+                'job_id': job.id,
+                'status': job.status
+            }, status=status.HTTP_202_ACCEPTED)
+        
+        form = Form.objects.get(id=form_id)
+        if custom_scripts is not None or observation_count:
+            if custom_scripts is not None:
+                form.custom_scripts = custom_scripts
+            if observation_count:
+                form.observation_count = int(observation_count)
+            form.updated_by = user
+            form.save(update_fields=['custom_scripts', 'observation_count', 'updated_by', 'updated_at'])
+        
+        job = ImportJobRunner.enqueue(
+            ImportJob.UPLOAD,
+            {
+                'file': store_upload(uploaded_file),
+                'force': str(request.data.get('force', '')).lower() in ('1', 'true')
+            },
+            user,
+            form=form
+        )
+        
+        return Response({
+            'message': 'Uploaded workbook import queued',
+            'form_id': form.id,
+            'job_id': job.id,
+            'status': job.status
+        }, status=status.HTTP_202_ACCEPTED)
+        
+    except Form.DoesNotExist:
+        return Response(
+            {'error': 'Form not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to import uploaded workbook: {str(e)}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def receive_graph_notifications(request):
+    """Accept Graph change notifications for form workbooks and queue a check of the changed drives"""
+    # Graph validates the endpoint when subscribing by expecting the token echoed back as plain text
+    validation_token = request.query_params.get('validationToken')
+    if validation_token:
+        return HttpResponse(validation_token, content_type='text/plain')
+    
+    try:
+        manager = GraphSubscriptionManager()
+        queued = set()
+        # Authenticated by each notification's clientState, the secret sent when subscribing
+        for notification in request.data.get('value', []):
+            subscription = manager.subscription_for(notification)
+            if subscription is None:
+                continue
+            
+            subscription.notified_at = timezone.now()
+            subscription.save(update_fields=['notified_at', 'updated_at'])
+            job = ImportJobRunner.enqueue(
+                ImportJob.CHANGES,
+                {'subscription_id': subscription.subscription_id},
+                subscription.created_by
+            )
+            queued.add(job.id)
+        
+        # Graph retries anything but a quick 2xx, so the drive is only read by the job
+        return Response({'job_ids': sorted(queued)}, status=status.HTTP_202_ACCEPTED)
+        
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to process notifications: {str(e)}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_import_job(request, job_id):
+    """Get status, progress and result of a form import job"""
+    try:
+        job = ImportJob.objects.get(id=job_id, created_by=request.user)
+        return Response(ImportJobSerializer(job).data)
+        
+    except ImportJob.DoesNotExist:
+        return Response(
+            {'error': 'Import job not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to get import job: {str(e)}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_forms_list(request):
@@ -159,11 +345,31 @@ def get_form_metadata(request, form_id, metadata_type):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        form = Form.objects.get(id=form_id)
+        display_format = request.query_params.get('display_format', LEGACY_FORMAT)
+        if display_format not in DISPLAY_FORMATS:
+            return Response(
+                {'error': f'display_format must be one of: {", ".join(DISPLAY_FORMATS)}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Clients revalidate with the ETag; unchanged metadata costs no DB query and no JSON encoding
+        metadata_cache = FormMetadataCache()
+        state = metadata_cache.state(form_id)
+        if state is None:
+            raise Form.DoesNotExist
+        etag = metadata_cache.etag(form_id, state, metadata_type, display_format)
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return _metadata_response(None, etag)
+        body = metadata_cache.get(form_id, etag)
+        if body is not None:
+            return _metadata_response(body, etag)
+        
+        form = Form.objects.select_related('current_entry_version__blob', 'current_display_version__blob').get(id=form_id)
         response_data = {'form': FormSerializer(form).data}
         
         if metadata_type in ['entry', 'both']:
-            entry_version = FormEntryVersion.objects.filter(form=form).order_by('-form_version').first()
+            entry_version = current_version(form, FormEntryVersion, 'blob')
             response_data['entry_data'] = entry_version.form_entry_json if entry_version else []
             response_data['entry_version'] = {
                 'id': entry_version.id if entry_version else None,
@@ -172,15 +378,20 @@ def get_form_metadata(request, form_id, metadata_type):
             }
         
         if metadata_type in ['display', 'both']:
-            display_version = FormDisplayVersion.objects.filter(form=form).order_by('-form_version').first()
-            response_data['display_data'] = display_version.form_display_json if display_version else {}
+            display_version = current_version(form, FormDisplayVersion, 'blob')
+            response_data['display_data'] = to_display_format(display_version.form_display_json, display_format) if display_version else {}
+            response_data['display_format'] = display_format
             response_data['display_version'] = {
                 'id': display_version.id if display_version else None,
                 'version': display_version.form_version if display_version else None,
                 'approved': display_version.approved if display_version else None
             }
         
-        return Response(response_data)
+        # Keyed by the state just read, which is newer than the cached one if an import finished meanwhile
+        etag = metadata_cache.etag(form_id, metadata_cache.state_of(form), metadata_type, display_format)
+        body = JSONRenderer().render(response_data)
+        metadata_cache.set(form_id, etag, body)
+        return _metadata_response(body, etag)
         
     except Form.DoesNotExist:
         return Response(
@@ -194,14 +405,23 @@ def get_form_metadata(request, form_id, metadata_type):
         )
 
 
+def _metadata_response(body, etag: str) -> HttpResponse:
+    if body is None:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Revalidated on every use; only the requesting client may keep it
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def save_form_data(request):
     """Save form data submission from frontend"""
     try:
         import base64
-        import os
-        from pathlib import Path
         
         user = request.user
         form_id = request.data.get('form_id')
@@ -215,10 +435,10 @@ def save_form_data(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        form = Form.objects.get(id=form_id)
+        form = Form.objects.select_related('current_entry_version').get(id=form_id)
         
         # Get latest versions
-        entry_version = FormEntryVersion.objects.filter(form=form).order_by('-form_version').first()
+        entry_version = current_version(form, FormEntryVersion)
         
         if not entry_version:
             return Response(
@@ -281,17 +501,11 @@ def save_form_data(request):
                 content = file_data.get('content')
                 
                 if filename and content:
-                    # Create directory structure: /userUploads/formId/entryId/fieldId/
-                    upload_dir = Path('userUploads') / str(form_id) / str(form_data.id) / str(field_id)
-                    upload_dir.mkdir(parents=True, exist_ok=True)
-                    
-                    # Save file
-                    file_path = upload_dir / filename
-                    with open(file_path, 'wb') as f:
-                        f.write(base64.b64decode(content))
+                    # Saved under /userUploads/formId/entryId/fieldId/ and indexed for entry listings
+                    attachment = store_attachment(form_data, field_id, filename, base64.b64decode(content))
                     
                     # Store relative URL
-                    attachment_urls[field_id].append(str(file_path))
+                    attachment_urls[field_id].append(attachment.path)
         
         # Get next version number for history
         last_history = FormDataHistory.objects.filter(form_data_entry=form_data_entry).order_by('-version').first()
@@ -338,11 +552,12 @@ def get_form_entries(request, form_id):
     """Get all form data entries for a specific form filtered by user"""
     try:
         user = request.user
-        form = Form.objects.get(id=form_id)
-        form_entries = FormData.objects.filter(form=form, user=user).order_by('-id')
+        form = Form.objects.select_related('current_entry_version__blob').get(id=form_id)
+        # Attachments of all entries come from the index in one query
+        form_entries = FormData.objects.filter(form=form, user=user).prefetch_related('attachments').order_by('-id')
         
         # Get latest entry version to extract column names
-        latest_entry_version = FormEntryVersion.objects.filter(form=form).order_by('-form_version').first()
+        latest_entry_version = current_version(form, FormEntryVersion, 'blob')
         
         # Create columns dictionary from entry JSON (id -> name mapping)
         columns = {}
@@ -354,31 +569,15 @@ def get_form_entries(request, form_id):
         # Format entries data
         entries_data = []
         for entry in form_entries:
-            # Get attachments for this entry
-            import os
-            from pathlib import Path
-            
-            attachments = {}
-            upload_dir = Path('userUploads') / str(form.id) / str(entry.id)
-            
-            if upload_dir.exists():
-                for field_dir in upload_dir.iterdir():
-                    if field_dir.is_dir():
-                        field_id = field_dir.name
-                        attachments[field_id] = []
-                        for file_path in field_dir.iterdir():
-                            if file_path.is_file():
-                                attachments[field_id].append(str(file_path))
-            
             entries_data.append({
                 'id': entry.id,
-                'form_data_entry_id': entry.form_data_entry.id,
+                'form_data_entry_id': entry.form_data_entry_id,
                 'observation_number': entry.observation_number,
                 'values': entry.form_values_json,
-                'attachments': attachments,
-                'created_by': entry.created_by.id if entry.created_by else None,
+                'attachments': attachment_paths(entry.attachments.all()),
+                'created_by': entry.created_by_id,
                 'created_at': entry.created_at,
-                'updated_by': entry.updated_by.id if entry.updated_by else None,
+                'updated_by': entry.updated_by_id,
                 'updated_at': entry.updated_at
             })
         
@@ -407,11 +606,18 @@ def get_form_entries(request, form_id):
 def get_filled_display_data(request, form_data_id):
     """Get display data with values filled from form data"""
     try:
-        form_data = FormData.objects.get(id=form_data_id)
+        display_format = request.query_params.get('display_format', LEGACY_FORMAT)
+        if display_format not in DISPLAY_FORMATS:
+            return Response(
+                {'error': f'display_format must be one of: {", ".join(DISPLAY_FORMATS)}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        form_data = FormData.objects.select_related('form__current_display_version__blob').get(id=form_data_id)
         form = form_data.form
         
         # Get latest display version
-        display_version = FormDisplayVersion.objects.filter(form=form).order_by('-form_version').first()
+        display_version = current_version(form, FormDisplayVersion, 'blob')
         
         if not display_version:
             return Response(
@@ -419,7 +625,7 @@ def get_filled_display_data(request, form_data_id):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        display_data = display_version.form_display_json.copy()
+        display_data = to_display_format(display_version.form_display_json.copy(), display_format)
         form_values = form_data.form_values_json
         
         # Parse form_values if it's a string
@@ -428,23 +634,14 @@ def get_filled_display_data(request, form_data_id):
             form_values = json.loads(form_values)
         
         # Fill values in cells
-        for cell in display_data.get('cells', []):
-            cell_value = cell.get('value', '')
-            if cell_value and '<pa' in str(cell_value):
-                # Extract ID from pattern like <pa_1>
-                import re
-                match = re.search(r'<pa_(\d+)>', str(cell_value))
-                if match:
-                    field_id = match.group(1)
-                    if field_id in form_values:
-                        cell['value'] = form_values[field_id]
-                        cell['display_value'] = str(form_values[field_id])
+        display_data = fill_display_values(display_data, form_values)
         
         return Response({
             'form_data_id': form_data_id,
             'form_id': form.id,
             'form_name': form.form_name,
-            'display_data': display_data
+            'display_data': display_data,
+            'display_format': display_format
         })
         
     except FormData.DoesNotExist:
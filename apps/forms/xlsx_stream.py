@@ -0,0 +1,262 @@
+import zipfile
+from typing import Dict, List
+from openpyxl.cell.cell import Cell
+from openpyxl.comments.comment_sheet import CommentSheet
+from openpyxl.packaging.manifest import Manifest
+from openpyxl.packaging.relationship import RelationshipList, get_dependents, get_rels_path
+from openpyxl.reader.excel import _find_workbook_part
+from openpyxl.reader.strings import read_string_table
+from openpyxl.reader.workbook import WorkbookParser
+from openpyxl.styles import Border
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.stylesheet import apply_stylesheet
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.worksheet._reader import WorkSheetParser, FORMULA_TAG
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+from openpyxl.worksheet.dimensions import ColumnDimension, RowDimension
+from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.xml.constants import ARC_CONTENT_TYPES, COMMENTS_NS, SHARED_STRINGS
+from openpyxl.xml.functions import fromstring
+
+
+# Style of cells openpyxl creates on demand (ws.cell() on an empty coordinate)
+DEFAULT_STYLE = tuple(StyleArray())
+
+# Placeholder for cells covered by a merged range, like openpyxl's MergedCell
+MERGED = object()
+
+
+class _FormulaValueParser(WorkSheetParser):
+    """Worksheet parser that keeps the cached value and the formula of each cell.
+    
+    openpyxl reads either formulas (data_only=False) or cached values
+    (data_only=True); this parser runs in data_only mode and additionally
+    records the formula, so one pass yields both.
+    """
+    
+    def parse_cell(self, element):
+        cell = super().parse_cell(element)
+        if element.find(FORMULA_TAG) is not None:
+            cell['formula'] = self.parse_formula(element)
+        return cell
+
+
+class StreamedCell:
+    __slots__ = ('style', 'value', 'data_value', 'hyperlink', 'comment')
+    
+    def __init__(self, style: tuple = DEFAULT_STYLE, value=None, data_value=None):
+        self.style = style
+        self.value = value
+        self.data_value = data_value
+        self.hyperlink = ""
+        self.comment = ""
+
+
+class StreamedSheet:
+    """Sparse cells, merged ranges and dimensions of one worksheet.
+    
+    Mirrors what openpyxl's load_workbook would hold for the sheet: `value` is
+    what a data_only=False workbook returns and `data_value` what a
+    data_only=True workbook returns.
+    """
+    
+    def __init__(self, title: str):
+        self.title = title
+        self.cells = {}
+        self.merged_ranges = []
+        self.column_dimensions = {}
+        self.row_dimensions = {}
+    
+    def cell(self, row: int, column: int):
+        """Get or create a cell, as openpyxl's ws.cell() does"""
+        cell = self.cells.get((row, column))
+        if cell is None:
+            cell = StreamedCell()
+            self.cells[(row, column)] = cell
+        return cell
+    
+    @property
+    def max_row(self) -> int:
+        return max(row for row, _ in self.cells) if self.cells else 1
+    
+    @property
+    def max_column(self) -> int:
+        return max(column for _, column in self.cells) if self.cells else 1
+    
+    @property
+    def min_row(self) -> int:
+        return min(row for row, _ in self.cells) if self.cells else 1
+    
+    @property
+    def min_column(self) -> int:
+        return min(column for _, column in self.cells) if self.cells else 1
+    
+    def iter_data_values(self):
+        """Yield rows of cached values over the used range, like iter_rows(values_only=True)"""
+        min_column, max_column = self.min_column, self.max_column
+        for row in range(self.min_row, self.max_row + 1):
+            values = []
+            for column in range(min_column, max_column + 1):
+                cell = self.cells.get((row, column))
+                values.append(None if cell is None or cell is MERGED else cell.data_value)
+            yield values
+
+
+class StreamedWorkbook:
+    """Read worksheets straight from an xlsx archive, one sheet at a time.
+    
+    Only the workbook part, styles and shared strings are loaded up front; a
+    worksheet's XML is parsed in a single streaming pass when it is requested.
+    """
+    
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.archive = zipfile.ZipFile(fileobj, 'r')
+        self.valid_files = set(self.archive.namelist())
+        self.package = Manifest.from_tree(fromstring(self.archive.read(ARC_CONTENT_TYPES)))
+        
+        parser = WorkbookParser(self.archive, _find_workbook_part(self.package).PartName[1:])
+        parser.parse()
+        self.wb = parser.wb
+        apply_stylesheet(self.archive, self.wb)
+        
+        self.sheets = [
+            (sheet, rel) for sheet, rel in parser.find_sheets()
+            if rel.target in self.valid_files and 'chartsheet' not in rel.Type
+        ]
+        self._shared_strings = None
+        self._style_ws = Worksheet(self.wb)
+    
+    def close(self):
+        self.archive.close()
+    
+    @property
+    def sheetnames(self) -> List[str]:
+        return [sheet.name for sheet, _ in self.sheets]
+    
+    @property
+    def epoch(self):
+        return self.wb.epoch
+    
+    @property
+    def shared_strings(self) -> List:
+        if self._shared_strings is None:
+            self._shared_strings = []
+            ct = self.package.find(SHARED_STRINGS)
+            if ct is not None:
+                with self.archive.open(ct.PartName[1:]) as src:
+                    self._shared_strings = read_string_table(src)
+        return self._shared_strings
+    
+    def get_worksheets(self) -> List[Dict]:
+        """List worksheets in the same shape as Graph's /workbook/worksheets"""
+        return [
+            {'name': sheet.name, 'position': position, 'visibility': sheet.state}
+            for position, (sheet, _) in enumerate(self.sheets)
+        ]
+    
+    def style_cell(self, style: tuple) -> Cell:
+        """A detached openpyxl cell carrying the given style, for reading font, fill, etc."""
+        return Cell(self._style_ws, row=1, column=1, style_array=StyleArray(style))
+    
+    def read_sheet(self, worksheet_name: str) -> StreamedSheet:
+        for sheet, rel in self.sheets:
+            if sheet.name == worksheet_name:
+                break
+        else:
+            raise KeyError(f"Worksheet {worksheet_name} does not exist.")
+        
+        rels_path = get_rels_path(rel.target)
+        rels = get_dependents(self.archive, rels_path) if rels_path in self.valid_files else RelationshipList()
+        
+        ws = StreamedSheet(worksheet_name)
+        with self.archive.open(rel.target) as src:
+            parser = _FormulaValueParser(
+                src, self.shared_strings, True, self.wb.epoch,
+                self.wb._date_formats, self.wb._timedelta_formats, False
+            )
+            cell_styles = self.wb._cell_styles
+            for _, row in parser.parse():
+                for parsed in row:
+                    ws.cells[(parsed['row'], parsed['column'])] = StreamedCell(
+                        tuple(cell_styles[parsed['style_id']]),
+                        parsed['formula'] if 'formula' in parsed else parsed['value'],
+                        parsed['value']
+                    )
+        
+        # Same order openpyxl binds them in: merged cells, hyperlinks, dimensions, comments
+        self._bind_merged_cells(ws, parser)
+        self._bind_hyperlinks(ws, parser, rels)
+        
+        for letter, attrs in parser.column_dimensions.items():
+            attrs = {k: v for k, v in attrs.items() if k != 'style'}
+            ws.column_dimensions[letter] = ColumnDimension(self._style_ws, **attrs)
+        
+        for row, attrs in parser.row_dimensions.items():
+            attrs = {k: v for k, v in attrs.items() if k != 's'}
+            ws.row_dimensions[int(row)] = RowDimension(self._style_ws, **attrs)
+        
+        for r in rels.find(COMMENTS_NS):
+            comment_sheet = CommentSheet.from_tree(fromstring(self.archive.read(r.target)))
+            for ref, comment in comment_sheet.comments:
+                cell = ws.cell(*coordinate_to_tuple(ref))
+                if cell is not MERGED:
+                    cell.comment = comment.text
+        
+        return ws
+    
+    def _bind_merged_cells(self, ws: StreamedSheet, parser: WorkSheetParser):
+        if not parser.merged_cells:
+            return
+        
+        for merge_cell in parser.merged_cells.mergeCell:
+            merged_range = CellRange(merge_cell.ref)
+            start = ws.cell(merged_range.min_row, merged_range.min_col)
+            
+            # openpyxl copies the bottom-right cell's right/bottom border onto the top-left cell
+            end = ws.cells.get((merged_range.max_row, merged_range.max_col))
+            if end is not None:
+                start.style = self._merge_borders(start.style, DEFAULT_STYLE if end is MERGED else end.style)
+            
+            cells = merged_range.cells
+            next(cells)  # keep the top-left cell
+            for coordinate in cells:
+                ws.cells[coordinate] = MERGED
+            ws.merged_ranges.append(merged_range)
+        
+        # Iterated in the order of openpyxl's ws.merged_cells.ranges, a set built from the same sequence
+        ws.merged_ranges = list(MultiCellRange(ws.merged_ranges).ranges)
+    
+    def _merge_borders(self, start_style: tuple, end_style: tuple) -> tuple:
+        start = self.style_cell(start_style)
+        end = self.style_cell(end_style)
+        start.border += Border(right=end.border.right, bottom=end.border.bottom)
+        return tuple(start._style)
+    
+    def _bind_hyperlinks(self, ws: StreamedSheet, parser: WorkSheetParser, rels: RelationshipList):
+        for link in parser.hyperlinks.hyperlink:
+            if link.id:
+                link.target = rels.get(link.id).Target
+            
+            if ":" in link.ref:
+                targets = [ws.cell(row, column) for row, column in CellRange(link.ref).cells]
+            else:
+                row, column = coordinate_to_tuple(link.ref)
+                cell = ws.cell(row, column)
+                if cell is MERGED:
+                    cell = next(
+                        (ws.cell(r.min_row, r.min_col) for r in ws.merged_ranges
+                         if r.min_row <= row <= r.max_row and r.min_col <= column <= r.max_col),
+                        None
+                    )
+                targets = [cell] if cell is not None else []
+            
+            for cell in targets:
+                if cell is MERGED:
+                    continue
+                cell.hyperlink = link.target
+                # Assigning a hyperlink fills an empty cell with its target
+                if cell.value is None:
+                    cell.value = link.target or link.location
+                if cell.data_value is None:
+                    cell.data_value = link.target or link.location
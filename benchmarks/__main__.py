@@ -0,0 +1,76 @@
+"""Offline extraction benchmarks.
+
+    python -m benchmarks --sizes small,medium --output results.json
+    python -m benchmarks --sizes small,medium --compare results.json --max-regression 1.25
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import django
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time display/entry extraction over synthetic workbooks')
+    parser.add_argument('--sizes', default='small,medium', help='Comma-separated presets from benchmarks.workbooks.SIZES')
+    parser.add_argument('--stages', help='Comma-separated subset of stages to run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', help='Directory for generated workbooks (kept between runs)')
+    parser.add_argument('--output', help='Write results JSON here instead of stdout')
+    parser.add_argument('--compare', help='Results JSON from an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, help='Exit non-zero if any stage is slower by more than this ratio')
+    args = parser.parse_args()
+    
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    django.setup()
+    from .extraction import STAGES, compare_results, run_benchmarks
+    from .workbooks import SIZES
+    
+    sizes = args.sizes.split(',')
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"Unknown sizes: {', '.join(unknown)} (choose from {', '.join(SIZES)})")
+    stages = args.stages.split(',') if args.stages else STAGES
+    
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = run_benchmarks(sizes, args.workdir, args.repeat, stages, args.seed)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            results = run_benchmarks(sizes, workdir, args.repeat, stages, args.seed)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    
+    for result in results['results']:
+        sys.stderr.write(
+            f"{result['workbook']:>8} {result['stage']:<20} {result['seconds_min'] * 1000:10.1f} ms"
+            f" {result['peak_memory_bytes'] / 1048576:8.1f} MiB"
+            + (f" {result['output_bytes'] / 1024:10.1f} KiB" if result['output_bytes'] is not None else '')
+            + '\n'
+        )
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = []
+        for comparison in compare_results(results, baseline):
+            sys.stderr.write(
+                f"{comparison['workbook']:>8} {comparison['stage']:<20} {comparison['ratio']:6.2f}x"
+                f" ({comparison['before'] * 1000:.1f} -> {comparison['after'] * 1000:.1f} ms)\n"
+            )
+            if args.max_regression and comparison['ratio'] > args.max_regression:
+                regressions.append(comparison)
+        if regressions:
+            sys.stderr.write(f"{len(regressions)} stage(s) regressed by more than {args.max_regression}x\n")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
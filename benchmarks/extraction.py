@@ -0,0 +1,169 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+import openpyxl
+from openpyxl import load_workbook
+from apps.forms.display_format import sparse_display_json
+from apps.forms.services import SharePointService, WorkbookImportSession
+from apps.forms.sources import LocalWorkbookSource
+from apps.forms.styles import StyleResolver
+from .workbooks import SIZES, generate_workbook
+
+
+STAGES = ['open', 'worksheets', 'display_streaming', 'display_openpyxl', 'cell_data_openpyxl', 'sparse_encode', 'entry']
+
+
+def run_benchmarks(sizes: List[str], workdir: str, repeat: int = 3, stages: List[str] = None, seed: int = 1) -> Dict:
+    """Generate a workbook per size, time each extraction stage and return machine-readable results"""
+    stages = stages or STAGES
+    results = []
+    
+    for size in sizes:
+        params = SIZES[size]
+        file_name = f"{size}-{seed}.xlsx"
+        path = os.path.join(workdir, file_name)
+        if not os.path.exists(path):
+            generate_workbook(path, seed=seed, **params)
+        
+        for stage, fn, measure_output in _stage_functions(file_name, workdir, stages):
+            timings, output = _time(fn, repeat)
+            results.append({
+                'workbook': size,
+                'params': params,
+                'file_bytes': os.path.getsize(path),
+                'stage': stage,
+                'seconds_min': min(timings),
+                'seconds_mean': sum(timings) / len(timings),
+                'peak_memory_bytes': _peak_memory(fn),
+                'output_bytes': len(json.dumps(output, default=str)) if measure_output else None,
+                **({'cells': output['cells_timed']} if stage == 'cell_data_openpyxl' else {})
+            })
+    
+    return {'meta': _environment(repeat, seed), 'results': results}
+
+
+def compare_results(current: Dict, baseline: Dict) -> List[Dict]:
+    """Ratio of current to baseline seconds_min for every (workbook, stage) present in both"""
+    previous = {(r['workbook'], r['stage']): r for r in baseline['results']}
+    comparisons = []
+    for result in current['results']:
+        before = previous.get((result['workbook'], result['stage']))
+        if not before or not before['seconds_min']:
+            continue
+        comparisons.append({
+            'workbook': result['workbook'],
+            'stage': result['stage'],
+            'before': before['seconds_min'],
+            'after': result['seconds_min'],
+            'ratio': result['seconds_min'] / before['seconds_min'],
+        })
+    return comparisons
+
+
+def _stage_functions(file_name: str, workdir: str, stages: List[str]) -> List[tuple]:
+    service = SharePointService()
+    source = LocalWorkbookSource(file_name, root=workdir)
+    
+    def open_session():
+        WorkbookImportSession(service, source).close()
+    
+    def with_session(fn: Callable) -> Callable:
+        def run():
+            with WorkbookImportSession(service, source) as session:
+                return fn(session)
+        return run
+    
+    def display_streaming(session):
+        return service._extract_streamed_display_metadata(session.workbook, 'Display', session.styles)
+    
+    def display_openpyxl():
+        with open(source.full_path, 'rb') as f:
+            theme_colors = service._extract_theme_colors(f)
+            f.seek(0)
+            wb = load_workbook(f, data_only=False)
+            f.seek(0)
+            wb_data = load_workbook(f, data_only=True)
+            return service._extract_display_metadata(wb, wb_data, 'Display', StyleResolver(theme_colors))
+    
+    loaded = {}
+    
+    def cell_data_openpyxl():
+        # Per-cell cost of the openpyxl path; workbook loading happens in the setup below
+        ws, ws_data, theme_colors = loaded['display']
+        styles = StyleResolver(theme_colors)
+        count = 0
+        for row in range(1, ws.max_row + 1):
+            for col in range(1, ws.max_column + 1):
+                service._extract_openpyxl_cell_data(ws.cell(row, col), ws_data.cell(row, col), row - 1, col - 1, ws, styles)
+                count += 1
+        return {'cells_timed': count}
+    
+    def sparse_encode():
+        return sparse_display_json(loaded['legacy'])
+    
+    if 'cell_data_openpyxl' in stages:
+        with open(source.full_path, 'rb') as f:
+            theme_colors = service._extract_theme_colors(f)
+            f.seek(0)
+            ws = load_workbook(f, data_only=False)['Display']
+            f.seek(0)
+            loaded['display'] = (ws, load_workbook(f, data_only=True)['Display'], theme_colors)
+    
+    if 'sparse_encode' in stages:
+        loaded['legacy'] = with_session(display_streaming)()
+    
+    functions = [
+        ('open', open_session, False),
+        ('worksheets', with_session(lambda session: session.get_worksheets()), False),
+        ('display_streaming', with_session(display_streaming), True),
+        ('display_openpyxl', display_openpyxl, True),
+        ('cell_data_openpyxl', cell_data_openpyxl, False),
+        ('sparse_encode', sparse_encode, True),
+        ('entry', with_session(lambda session: session.get_entry_sheet_data('Entry')), True),
+    ]
+    return [function for function in functions if function[0] in stages]
+
+
+def _time(fn: Callable, repeat: int) -> tuple:
+    timings = []
+    output = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = fn()
+        timings.append(time.perf_counter() - started)
+    return timings, output
+
+
+def _peak_memory(fn: Callable) -> int:
+    # Separate run: tracing allocations slows the code down too much to time it
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _environment(repeat: int, seed: int) -> Dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    
+    return {
+        'commit': commit,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'openpyxl': openpyxl.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'seed': seed,
+    }
@@ -0,0 +1,145 @@
+import datetime
+import random
+from openpyxl import Workbook
+from openpyxl.comments import Comment
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.styles.colors import Color
+from openpyxl.utils import get_column_letter
+
+
+# rows/columns of the display sheet, merged ranges, distinct cell styles,
+# share of display cells left blank and rows of the entry sheet
+SIZES = {
+    'small': {'rows': 50, 'columns': 10, 'merged': 5, 'styles': 10, 'blank_ratio': 0.5, 'entry_rows': 25},
+    'medium': {'rows': 500, 'columns': 20, 'merged': 40, 'styles': 50, 'blank_ratio': 0.6, 'entry_rows': 200},
+    'large': {'rows': 3000, 'columns': 30, 'merged': 200, 'styles': 200, 'blank_ratio': 0.7, 'entry_rows': 1000},
+    'sparse': {'rows': 2000, 'columns': 40, 'merged': 20, 'styles': 20, 'blank_ratio': 0.97, 'entry_rows': 100},
+    'styled': {'rows': 500, 'columns': 20, 'merged': 40, 'styles': 2000, 'blank_ratio': 0.3, 'entry_rows': 200},
+}
+
+FONTS = ['Calibri', 'Arial', 'Times New Roman', 'Verdana']
+COLORS = ['FFFF0000', 'FF00B050', 'FF0070C0', 'FFFFFF00', 'FF7030A0', 'FFDDEBF7']
+NUMBER_FORMATS = ['General', '0.00', '0.00%', 'yyyy-mm-dd', '#,##0']
+
+
+def generate_workbook(path: str, rows: int, columns: int, merged: int, styles: int, blank_ratio: float, entry_rows: int, seed: int = 1):
+    """Write a deterministic template workbook with a Display and an Entry sheet"""
+    rng = random.Random(seed)
+    palette = [_random_style(rng) for _ in range(styles)]
+    
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Display'
+    
+    for row in range(1, rows + 1):
+        for column in range(1, columns + 1):
+            if rng.random() < blank_ratio:
+                continue
+            
+            cell = ws.cell(row, column)
+            cell.value = _random_value(rng, row, column)
+            font, fill, alignment, border, number_format = rng.choice(palette)
+            cell.font = font
+            if fill:
+                cell.fill = fill
+            cell.alignment = alignment
+            if border:
+                cell.border = border
+            cell.number_format = number_format
+            
+            if rng.random() < 0.005:
+                cell.comment = Comment(f"Note for row {row}", 'benchmark')
+            if rng.random() < 0.005:
+                cell.hyperlink = f"https://example.com/{row}/{column}"
+    
+    _add_merged_ranges(ws, rng, rows, columns, merged)
+    
+    for column in range(1, columns + 1):
+        if rng.random() < 0.3:
+            ws.column_dimensions[get_column_letter(column)].width = rng.choice([5, 12, 20, 35])
+    for row in range(1, rows + 1, 7):
+        ws.row_dimensions[row].height = rng.choice([12, 18, 30])
+    
+    entry = wb.create_sheet('Entry')
+    entry.append(['id', 'name', 'type', 'required', 'options', 'default'])
+    types = ['text', 'number', 'date', 'select', 'checkbox']
+    for i in range(1, entry_rows + 1):
+        field_type = rng.choice(types)
+        entry.append([
+            i,
+            f"Field {i}",
+            field_type,
+            rng.random() < 0.5,
+            'A,B,C' if field_type == 'select' else None,
+            datetime.date(2024, 1, 1) + datetime.timedelta(days=i) if field_type == 'date' else None
+        ])
+    
+    wb.save(path)
+
+
+def _random_style(rng: random.Random) -> tuple:
+    font = Font(
+        name=rng.choice(FONTS),
+        size=rng.choice([9, 10, 11, 12, 14]),
+        bold=rng.random() < 0.3,
+        italic=rng.random() < 0.2,
+        underline='single' if rng.random() < 0.1 else None,
+        color=rng.choice(COLORS + [None])
+    )
+    fill = None
+    if rng.random() < 0.3:
+        fill = PatternFill('solid', fgColor=rng.choice(COLORS))
+    elif rng.random() < 0.2:
+        fill = PatternFill('solid', fgColor=Color(theme=rng.randint(0, 9), tint=rng.choice([0, 0.4, -0.25])))
+    alignment = Alignment(
+        horizontal=rng.choice([None, 'left', 'center', 'right']),
+        vertical=rng.choice([None, 'top', 'center']),
+        wrap_text=rng.random() < 0.3,
+        indent=rng.choice([0, 0, 1, 2])
+    )
+    border = None
+    if rng.random() < 0.4:
+        side = Side(style=rng.choice(['thin', 'medium', 'double']))
+        border = Border(left=side, right=side, top=side, bottom=side)
+    return font, fill, alignment, border, rng.choice(NUMBER_FORMATS)
+
+
+def _random_value(rng: random.Random, row: int, column: int):
+    k = rng.random()
+    if k < 0.3:
+        return f"<pa_{row * 1000 + column}>"
+    if k < 0.5:
+        return f"Label {row}.{column}"
+    if k < 0.65:
+        return rng.randint(0, 100000)
+    if k < 0.75:
+        return round(rng.random() * 1000, 3)
+    if k < 0.85:
+        return f"=A{row}&\"-{column}\""
+    if k < 0.95:
+        return datetime.datetime(2024, 1, 1) + datetime.timedelta(hours=row * column)
+    return rng.random() < 0.5
+
+
+def _add_merged_ranges(ws, rng: random.Random, rows: int, columns: int, count: int):
+    taken = set()
+    for _ in range(count * 5):
+        if count <= 0:
+            break
+        
+        row = rng.randint(1, max(1, rows - 2))
+        column = rng.randint(1, max(1, columns - 2))
+        height, width = rng.randint(1, 3), rng.randint(2, 4)
+        cells = {
+            (r, c) for r in range(row, min(rows, row + height - 1) + 1)
+            for c in range(column, min(columns, column + width - 1) + 1)
+        }
+        if len(cells) < 2 or cells & taken:
+            continue
+        
+        taken |= cells
+        ws.merge_cells(
+            start_row=row, start_column=column,
+            end_row=max(r for r, _ in cells), end_column=max(c for _, c in cells)
+        )
+        count -= 1
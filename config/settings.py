@@ -90,6 +90,29 @@ USE_I18N = True
 USE_TZ = True
 
 STATIC_URL = 'static/'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared by every worker process on the host; holds the Graph app token, so keep it private to the app user
+    'shared': {
+        'BACKEND': config('SHARED_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('SHARED_CACHE_LOCATION', default=str(BASE_DIR / 'var' / 'cache')),
+    },
+    # Older form versions rebuilt from patches (apps/forms/versions.py)
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'form-versions',
+        'OPTIONS': {'MAX_ENTRIES': config('FORM_VERSION_CACHE_MAX_ENTRIES', default=50, cast=int)},
+    },
+    # Rendered form metadata responses (apps/forms/cache.py)
+    'metadata': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'form-metadata',
+        'OPTIONS': {'MAX_ENTRIES': config('FORM_METADATA_CACHE_MAX_ENTRIES', default=200, cast=int)},
+    },
+}
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
@@ -113,4 +136,82 @@ SIMPLE_JWT = {
 # CORS settings
 CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default='http://localhost:3000,http://127.0.0.1:3000').split(',')
 CORS_ALLOW_CREDENTIALS = config('CORS_ALLOW_CREDENTIALS', default=True, cast=bool)
-CORS_ALLOW_ALL_ORIGINS = config('CORS_ALLOW_ALL_ORIGINS', default=False, cast=bool)
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = config('CORS_ALLOW_ALL_ORIGINS', default=False, cast=bool)
+
+# SharePoint import settings
+SHAREPOINT_RESOLUTION_CACHE_TTL = config('SHAREPOINT_RESOLUTION_CACHE_TTL', default=86400, cast=int)
+SHAREPOINT_RESOLUTION_CACHE_MAX_ENTRIES = config('SHAREPOINT_RESOLUTION_CACHE_MAX_ENTRIES', default=5000, cast=int)
+# Seconds between last_used_at updates of a resolution row, so cache hits are reads only
+SHAREPOINT_RESOLUTION_CACHE_TOUCH_INTERVAL = config('SHAREPOINT_RESOLUTION_CACHE_TOUCH_INTERVAL', default=3600, cast=int)
+# 'streaming' parses the sheet XML in one pass; 'openpyxl' loads the workbook twice
+WORKBOOK_EXTRACTOR = config('WORKBOOK_EXTRACTOR', default='streaming')
+WORKBOOK_SPOOL_MAX_MEMORY = config('WORKBOOK_SPOOL_MAX_MEMORY', default=1048576, cast=int)
+
+GRAPH_TOKEN_CACHE_ALIAS = config('GRAPH_TOKEN_CACHE_ALIAS', default='shared')
+GRAPH_TOKEN_REFRESH_MARGIN = config('GRAPH_TOKEN_REFRESH_MARGIN', default=300, cast=int)
+
+# Microsoft Graph client settings
+GRAPH_BASE_URL = config('GRAPH_BASE_URL', default='https://graph.microsoft.com/v1.0')
+GRAPH_CONNECT_TIMEOUT = config('GRAPH_CONNECT_TIMEOUT', default=5, cast=float)
+GRAPH_READ_TIMEOUT = config('GRAPH_READ_TIMEOUT', default=60, cast=float)
+GRAPH_MAX_RETRIES = config('GRAPH_MAX_RETRIES', default=4, cast=int)
+GRAPH_BACKOFF_BASE = config('GRAPH_BACKOFF_BASE', default=0.5, cast=float)
+GRAPH_BACKOFF_MAX = config('GRAPH_BACKOFF_MAX', default=30, cast=float)
+GRAPH_RETRY_AFTER_MAX = config('GRAPH_RETRY_AFTER_MAX', default=300, cast=float)
+GRAPH_POOL_SIZE = config('GRAPH_POOL_SIZE', default=10, cast=int)
+# Requests in flight per process, and streamed downloads on top of them; both work from 1 upwards,
+# as a download only takes a request slot until its headers arrive
+GRAPH_MAX_CONCURRENCY = config('GRAPH_MAX_CONCURRENCY', default=8, cast=int)
+GRAPH_MAX_DOWNLOADS = config('GRAPH_MAX_DOWNLOADS', default=4, cast=int)
+# Requests per Graph $batch call (Graph allows at most 20)
+GRAPH_BATCH_SIZE = config('GRAPH_BATCH_SIZE', default=20, cast=int)
+
+# Import jobs: 'thread' runs them in-process, 'worker' leaves them to `manage.py run_import_jobs`
+IMPORT_JOB_MODE = config('IMPORT_JOB_MODE', default='thread')
+IMPORT_JOB_WORKERS = config('IMPORT_JOB_WORKERS', default=2, cast=int)
+IMPORT_JOB_MAX_ATTEMPTS = config('IMPORT_JOB_MAX_ATTEMPTS', default=3, cast=int)
+IMPORT_JOB_RETRY_DELAY = config('IMPORT_JOB_RETRY_DELAY', default=30, cast=float)
+IMPORT_JOB_STALE_AFTER = config('IMPORT_JOB_STALE_AFTER', default=1800, cast=int)
+IMPORT_JOB_POLL_INTERVAL = config('IMPORT_JOB_POLL_INTERVAL', default=2, cast=float)
+
+# manage.py sync_sharepoint_forms
+SHAREPOINT_SYNC_WORKERS = config('SHAREPOINT_SYNC_WORKERS', default=8, cast=int)
+SHAREPOINT_SYNC_TIMEOUT = config('SHAREPOINT_SYNC_TIMEOUT', default=300, cast=float)
+SHAREPOINT_SYNC_STATE_FILE = config('SHAREPOINT_SYNC_STATE_FILE', default=str(BASE_DIR / 'var' / 'sync_state.json'))
+
+# Workbook sources other than SharePoint
+WORKBOOK_LOCAL_DIR = config('WORKBOOK_LOCAL_DIR', default=str(BASE_DIR / 'workbooks'))
+WORKBOOK_UPLOAD_MAX_SIZE = config('WORKBOOK_UPLOAD_MAX_SIZE', default=52428800, cast=int)
+# Uploaded workbooks wait here for their import job; must be shared with run_import_jobs workers
+WORKBOOK_UPLOAD_DIR = config('WORKBOOK_UPLOAD_DIR', default=str(BASE_DIR / 'var' / 'uploads'))
+
+# Form version history: older versions are stored as patches against the next one
+FORM_VERSION_SNAPSHOT_INTERVAL = config('FORM_VERSION_SNAPSHOT_INTERVAL', default=10, cast=int)
+FORM_VERSION_DELTA_MAX_RATIO = config('FORM_VERSION_DELTA_MAX_RATIO', default=0.5, cast=float)
+FORM_VERSION_CACHE_ALIAS = config('FORM_VERSION_CACHE_ALIAS', default='versions')
+FORM_VERSION_CACHE_TIMEOUT = config('FORM_VERSION_CACHE_TIMEOUT', default=3600, cast=int)
+
+# Form metadata responses: cached per process and in the shared cache, revalidated by ETag
+FORM_METADATA_CACHE_ALIAS = config('FORM_METADATA_CACHE_ALIAS', default='metadata')
+FORM_METADATA_SHARED_CACHE_ALIAS = config('FORM_METADATA_SHARED_CACHE_ALIAS', default='shared')
+FORM_METADATA_CACHE_TIMEOUT = config('FORM_METADATA_CACHE_TIMEOUT', default=3600, cast=int)
+FORM_METADATA_STATE_TIMEOUT = config('FORM_METADATA_STATE_TIMEOUT', default=60, cast=int)
+
+# Workbook parsing in child processes (0 workers parses in the calling thread)
+WORKBOOK_PARSE_WORKERS = config('WORKBOOK_PARSE_WORKERS', default=2, cast=int)
+WORKBOOK_PARSE_MEMORY_LIMIT = config('WORKBOOK_PARSE_MEMORY_LIMIT', default=2147483648, cast=int)
+WORKBOOK_PARSE_MAX_TASKS_PER_CHILD = config('WORKBOOK_PARSE_MAX_TASKS_PER_CHILD', default=50, cast=int)
+
+# Raw workbooks kept for re-extracting versions without Graph (empty disables snapshots)
+WORKBOOK_SNAPSHOT_DIR = config('WORKBOOK_SNAPSHOT_DIR', default=str(BASE_DIR / 'snapshots'))
+
+# One import per form at a time; callers arriving meanwhile wait for and share its result
+FORM_IMPORT_LOCK_TIMEOUT = config('FORM_IMPORT_LOCK_TIMEOUT', default=1800, cast=int)
+FORM_IMPORT_LOCK_WAIT = config('FORM_IMPORT_LOCK_WAIT', default=1800, cast=int)
+FORM_IMPORT_LOCK_POLL_INTERVAL = config('FORM_IMPORT_LOCK_POLL_INTERVAL', default=1, cast=float)
+
+# Graph change notifications (GRAPH_NOTIFICATION_URL is the public URL of /api/forms/graph-notifications/)
+GRAPH_NOTIFICATION_URL = config('GRAPH_NOTIFICATION_URL', default='')
+GRAPH_SUBSCRIPTION_LIFETIME = config('GRAPH_SUBSCRIPTION_LIFETIME', default=259200, cast=int)
+GRAPH_SUBSCRIPTION_RENEW_BEFORE = config('GRAPH_SUBSCRIPTION_RENEW_BEFORE', default=86400, cast=int)
+GRAPH_NOTIFICATION_DEBOUNCE = config('GRAPH_NOTIFICATION_DEBOUNCE', default=60, cast=float)